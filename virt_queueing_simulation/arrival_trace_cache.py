@@ -0,0 +1,382 @@
+""" Arrival trace cache module
+
+An arrival trace is the arrival times of the N streams of a simulation before a horizon time.  It is stored as two .npy
+files, the flat arrival times of all of the streams and the offsets of the segment of each stream (as in
+virt_queueing_kernel), and a .json file with the parameters of the trace, which is written last and marks the trace as
+complete.  The traces are opened with np.load(mmap_mode="r"), so the worker processes that replay the same trace share
+the pages of the files instead of drawing the interarrival times again.
+
+Recorded arrival timestamps are imported into the same format from a CSV file or a .npy file with stream and time
+columns (import_trace), so that the Trace(path) arrival distribution can replay them from the memory mapped times.
+
+Measured interarrival samples are imported into a table of their quantiles in a .npy file next to them
+(import_empirical_table), so that the Empirical(path) arrival distribution reads the small table instead of parsing the
+samples again in every worker process.
+"""
+
+import hashlib
+import json
+import math
+import os
+from itertools import islice
+
+import numpy as np
+
+IMPORT_CHUNK_SIZE = 1 << 20
+
+# Number of segments of the quantile table of the empirical distributions.  The samples themselves are the table when
+# there are fewer of them.
+EMPIRICAL_TABLE_SIZE = 1 << 16
+
+# Version of the arrival times that are generated for a key, which is part of the key.  It changes when the same
+# distribution and random states generate different arrival times, so that the old traces are not replayed.
+GENERATOR_VERSION = 3
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def trace_files(trace_path):
+    """ Get the times, offsets, and info file names of a trace. """
+    return trace_path + ".times.npy", trace_path + ".offsets.npy", trace_path + ".json"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def trace_exists(trace_path):
+    return os.path.exists(trace_files(trace_path)[2])
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def save_trace(trace_path, arrival_times, horizon, info=None):
+    """ Save the list of the arrival times array of each stream as a trace.  The files are written to temporary files
+    first and then renamed, and the info file is renamed last. """
+    times_file, offsets_file, info_file = trace_files(trace_path)
+
+    offsets = np.zeros(len(arrival_times) + 1, dtype=np.int64)
+    np.cumsum([len(times) for times in arrival_times], out=offsets[1:])
+    times = np.concatenate(arrival_times).astype(np.float64, copy=False) if offsets[-1] else np.empty(0)
+    info = dict(info or {}, num_streams=len(arrival_times), num_arrivals=int(offsets[-1]), horizon=horizon)
+
+    for file_name, write in [
+        (times_file, lambda f: np.save(f, times)),
+        (offsets_file, lambda f: np.save(f, offsets)),
+        (info_file, lambda f: f.write(json.dumps(info, sort_keys=True).encode())),
+    ]:
+        temp_file = "%s.%d.tmp" % (file_name, os.getpid())
+        with open(temp_file, "wb") as f:
+            write(f)
+        os.replace(temp_file, file_name)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def open_trace(trace_path):
+    """ Open a trace.  Returns (times, offsets, horizon), where times is memory mapped. """
+    times_file, offsets_file, info_file = trace_files(trace_path)
+    with open(info_file) as f:
+        info = json.load(f)
+    times = np.load(times_file, mmap_mode="r")
+    offsets = np.load(offsets_file)
+    if len(offsets) != info["num_streams"] + 1 or len(times) != info["num_arrivals"]:
+        raise ValueError("Arrival trace %s does not match its info file." % repr(trace_path))
+    return times, offsets, info["horizon"]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def trace_info(trace_path):
+    with open(trace_files(trace_path)[2]) as f:
+        return json.load(f)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def update_trace_info(trace_path, **kwargs):
+    """ Add the given items to the info file of a trace. """
+    info_file = trace_files(trace_path)[2]
+    info = trace_info(trace_path)
+    info.update(kwargs)
+    temp_file = "%s.%d.tmp" % (info_file, os.getpid())
+    with open(temp_file, "w") as f:
+        f.write(json.dumps(info, sort_keys=True))
+    os.replace(temp_file, info_file)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def interarrival_moments(trace_path, chunk_size=IMPORT_CHUNK_SIZE):
+    """ Get the first three moments of the interarrival times of all of the streams of a trace, where the first
+    interarrival time of a stream is its first arrival time.  They are calculated in chunks the first time and saved in
+    the info file. """
+    info = trace_info(trace_path)
+    if "interarrival_moments" not in info:
+        times, offsets, _ = open_trace(trace_path)
+        sums = np.zeros(3)
+        for start in range(0, len(times), chunk_size):
+            stop = min(start + chunk_size, len(times))
+            chunk = np.asarray(times[start:stop])
+            interarrival_times = np.diff(chunk, prepend=times[start - 1] if start else 0.0)
+            # The first arrival of a stream is measured from time 0.
+            stream_starts = offsets[(offsets >= start) & (offsets < stop)] - start
+            interarrival_times[stream_starts] = chunk[stream_starts]
+            for n in range(3):
+                sums[n] += np.sum(interarrival_times ** (n + 1))
+        moments = (sums / len(times)).tolist() if len(times) else [math.nan] * 3
+        update_trace_info(trace_path, interarrival_moments=moments)
+        info["interarrival_moments"] = moments
+    return info["interarrival_moments"]
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def read_trace_source(source_path, chunk_size=IMPORT_CHUNK_SIZE):
+    """ Read a trace source file in chunks.  Yields the (streams, times) arrays of each chunk.  A .npy file is an array
+    of (stream, time) rows, which is memory mapped.  Any other file is a CSV file of (stream, time) rows with an
+    optional header row. """
+    if source_path.endswith(".npy"):
+        data = np.load(source_path, mmap_mode="r")
+        if data.ndim != 2 or data.shape[1] != 2:
+            raise ValueError("Trace source %s is not an array of (stream, time) rows." % repr(source_path))
+        for start in range(0, len(data), chunk_size):
+            chunk = np.asarray(data[start:start + chunk_size], dtype=np.float64)
+            yield chunk[:, 0].astype(np.int64), chunk[:, 1]
+    else:
+        with open(source_path) as f:
+            # Skip the header row.
+            first_line = f.readline()
+            try:
+                [float(value) for value in first_line.split(",")]
+            except ValueError:
+                lines = []
+            else:
+                lines = [first_line]
+            while True:
+                lines.extend(islice(f, chunk_size - len(lines)))
+                lines = [line for line in lines if line.strip()]
+                if not lines:
+                    break
+                chunk = np.loadtxt(lines, delimiter=",", dtype=np.float64, ndmin=2)
+                if chunk.shape[1] != 2:
+                    raise ValueError("Trace source %s does not have stream and time columns." % repr(source_path))
+                yield chunk[:, 0].astype(np.int64), chunk[:, 1]
+                lines = []
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def import_trace(source_path, trace_path, chunk_size=IMPORT_CHUNK_SIZE):
+    """ Import the (stream, time) rows of a trace source file into a trace.  The rows may interleave the streams, but
+    the times of each stream must be in order.  The times are made relative to the first time of the trace.  The source
+    is read twice in chunks, first to count the arrivals of each stream, and then to write the times into their place in
+    the memory mapped times file, so the memory use does not depend on the size of the trace. """
+    times_file, offsets_file, info_file = trace_files(trace_path)
+
+    # Count the arrivals of each stream and find the first and last times.
+    counts = np.zeros(0, dtype=np.int64)
+    t_first = math.inf
+    t_last = -math.inf
+    for streams, times in read_trace_source(source_path, chunk_size):
+        if len(streams) == 0:
+            continue
+        if streams.min() < 0:
+            raise ValueError("Trace source %s has a negative stream index." % repr(source_path))
+        chunk_counts = np.bincount(streams)
+        if len(chunk_counts) > len(counts):
+            counts = np.concatenate([counts, np.zeros(len(chunk_counts) - len(counts), dtype=np.int64)])
+        counts[:len(chunk_counts)] += chunk_counts
+        t_first = min(t_first, float(times.min()))
+        t_last = max(t_last, float(times.max()))
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    if not offsets[-1]:
+        raise ValueError("Trace source %s has no arrivals." % repr(source_path))
+
+    # Write the times of each chunk after the times of the same stream in the previous chunks.
+    temp_times_file = "%s.%d.tmp.npy" % (times_file, os.getpid())
+    trace_times = np.lib.format.open_memmap(temp_times_file, mode="w+", dtype=np.float64, shape=(int(offsets[-1]),))
+    position = offsets[:-1].copy()
+    for streams, times in read_trace_source(source_path, chunk_size):
+        order = np.argsort(streams, kind="stable")
+        sorted_streams = streams[order]
+        chunk_counts = np.bincount(sorted_streams, minlength=len(position))
+        rank = np.arange(len(order)) - (np.cumsum(chunk_counts) - chunk_counts)[sorted_streams]
+        trace_times[position[sorted_streams] + rank] = times[order] - t_first
+        position += chunk_counts
+
+    # Check that the times of each stream are in order.
+    stream_starts = set(offsets.tolist())
+    in_order = True
+    for start in range(1, len(trace_times), chunk_size):
+        stop = min(start + chunk_size, len(trace_times))
+        out_of_order = np.flatnonzero(np.diff(trace_times[start - 1:stop]) < 0) + start
+        if any(index not in stream_starts for index in out_of_order.tolist()):
+            in_order = False
+            break
+    trace_times.flush()
+    del trace_times
+    if not in_order:
+        os.remove(temp_times_file)
+        raise ValueError("The times of a stream of trace source %s are not in order." % repr(source_path))
+
+    source_stat = os.stat(source_path)
+    info = dict(source=os.path.abspath(source_path), source_size=source_stat.st_size,
+                source_mtime=source_stat.st_mtime, num_streams=len(counts), num_arrivals=int(offsets[-1]),
+                horizon=t_last - t_first)
+    os.replace(temp_times_file, times_file)
+    for file_name, write in [
+        (offsets_file, lambda f: np.save(f, offsets)),
+        (info_file, lambda f: f.write(json.dumps(info, sort_keys=True).encode())),
+    ]:
+        temp_file = "%s.%d.tmp" % (file_name, os.getpid())
+        with open(temp_file, "wb") as f:
+            write(f)
+        os.replace(temp_file, file_name)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def resolve_trace(path):
+    """ Get the trace path of a Trace(path) arrival distribution.  The path is either a trace or a trace source file,
+    which is imported into the trace path + ".trace" the first time, and again when the source file changes. """
+    if trace_exists(path):
+        return path
+    if not os.path.isfile(path):
+        raise FileNotFoundError("Arrival trace %s does not exist." % repr(path))
+    trace_path = path + ".trace"
+    source_stat = os.stat(path)
+    if trace_exists(trace_path):
+        info = trace_info(trace_path)
+        if info.get("source_size") == source_stat.st_size and info.get("source_mtime") == source_stat.st_mtime:
+            return trace_path
+    import_trace(path, trace_path)
+    return trace_path
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def empirical_table_files(table_path):
+    """ Get the table and info file names of an empirical table. """
+    return table_path + ".npy", table_path + ".json"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def read_sample_source(source_path, chunk_size=IMPORT_CHUNK_SIZE):
+    """ Read an interarrival sample file in chunks.  Yields the samples array of each chunk.  A .npy file is an array of
+    the samples, which is memory mapped.  Any other file is a CSV file with the samples in its first column and an
+    optional header row. """
+    if source_path.endswith(".npy"):
+        data = np.load(source_path, mmap_mode="r")
+        if data.ndim != 1:
+            raise ValueError("Sample source %s is not an array of samples." % repr(source_path))
+        for start in range(0, len(data), chunk_size):
+            yield np.asarray(data[start:start + chunk_size], dtype=np.float64)
+    else:
+        with open(source_path) as f:
+            # Skip the header row.
+            first_line = f.readline()
+            try:
+                float(first_line.split(",")[0])
+            except ValueError:
+                lines = []
+            else:
+                lines = [first_line]
+            while True:
+                lines.extend(islice(f, chunk_size - len(lines)))
+                lines = [line for line in lines if line.strip()]
+                if not lines:
+                    break
+                yield np.loadtxt(lines, delimiter=",", dtype=np.float64, ndmin=2)[:, 0]
+                lines = []
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def import_empirical_table(source_path, table_path, table_size=EMPIRICAL_TABLE_SIZE):
+    """ Import the interarrival samples of a sample file into an empirical table:  the quantiles of the samples at the
+    probabilities j/K for j = 0, ..., K, where K is table_size, or the sorted samples if there are fewer.  The info file
+    has the size and the modification time of the source file, and a digest of the table. """
+    table_file, info_file = empirical_table_files(table_path)
+
+    chunks = list(read_sample_source(source_path))
+    samples = np.concatenate(chunks) if chunks else np.empty(0)
+    if len(samples) < 2:
+        raise ValueError("Sample source %s has fewer than 2 samples." % repr(source_path))
+    if not np.all(np.isfinite(samples)) or samples.min() < 0:
+        raise ValueError("Sample source %s has a negative or non-finite sample." % repr(source_path))
+    if len(samples) - 1 <= table_size:
+        table = np.sort(samples)
+    else:
+        table = np.quantile(samples, np.linspace(0.0, 1.0, table_size + 1))
+    if not table.sum() > 0:
+        raise ValueError("Sample source %s has a mean of zero." % repr(source_path))
+
+    source_stat = os.stat(source_path)
+    info = dict(source=os.path.abspath(source_path), source_size=source_stat.st_size,
+                source_mtime=source_stat.st_mtime, num_samples=len(samples), table_size=len(table) - 1,
+                digest=hashlib.sha256(table.tobytes()).hexdigest()[:24])
+    for file_name, write in [
+        (table_file, lambda f: np.save(f, table)),
+        (info_file, lambda f: f.write(json.dumps(info, sort_keys=True).encode())),
+    ]:
+        temp_file = "%s.%d.tmp" % (file_name, os.getpid())
+        with open(temp_file, "wb") as f:
+            write(f)
+        os.replace(temp_file, file_name)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def resolve_empirical_table(path):
+    """ Get the table path of an Empirical(path) arrival distribution.  The sample file is imported into the table path
+    path + ".empirical" the first time, and again when the sample file changes. """
+    if not os.path.isfile(path):
+        raise FileNotFoundError("Interarrival sample file %s does not exist." % repr(path))
+    table_path = path + ".empirical"
+    info_file = empirical_table_files(table_path)[1]
+    source_stat = os.stat(path)
+    if os.path.exists(info_file):
+        with open(info_file) as f:
+            info = json.load(f)
+        if info.get("source_size") == source_stat.st_size and info.get("source_mtime") == source_stat.st_mtime:
+            return table_path
+    import_empirical_table(path, table_path)
+    return table_path
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def open_empirical_table(table_path):
+    """ Open an empirical table.  Returns (table, info). """
+    table_file, info_file = empirical_table_files(table_path)
+    with open(info_file) as f:
+        info = json.load(f)
+    table = np.load(table_file)
+    if len(table) != info["table_size"] + 1:
+        raise ValueError("Empirical table %s does not match its info file." % repr(table_path))
+    return table, info
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class ArrivalTraceCache:
+    """ Directory of arrival traces.  A trace is identified by the arrival distribution, the arrival rate, the number of
+    streams, the random states of the streams, and the horizon, which determine the arrival times. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def trace_path(self, A_dist, lambd, N, rngstates, horizon, dist_key=None):
+        """ Get the path of the trace.  rngstates are the random states of the N streams.  The streams with the same
+        random state share a random class, so the key has each distinct state and which streams share it.  dist_key
+        identifies the data of a distribution that reads a file, such as the table of an empirical distribution. """
+        distinct_states = []
+        stream_states = []
+        for rngstate in rngstates:
+            if rngstate not in distinct_states:
+                distinct_states.append(rngstate)
+            stream_states.append(distinct_states.index(rngstate))
+        key = repr((GENERATOR_VERSION, A_dist, float(lambd), N, float(horizon), stream_states, distinct_states))
+        if dist_key is not None:
+            key = repr((key, dist_key))
+        return os.path.join(self.directory, "arrivals-%s" % hashlib.sha256(key.encode()).hexdigest()[:24])
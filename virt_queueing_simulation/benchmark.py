@@ -0,0 +1,361 @@
+""" Benchmark module
+
+The benchmarks time the simulation runs of QueueingSystemSimulation over a fixed grid of N, C, S, Rs, the four arrival
+distributions of run_experiments.py, the service disciplines, and the engines, the stats reduction of the run results
+(qsc.QueueStats), the construction of QueueingSystemModel_MG1, and the runs per second of a
+QueueingSystemSimulationBatch.
+
+Each benchmark result has the best time of the repeats and the rate of the work that was timed (events, stats entries,
+models, or runs per second).  The results of each benchmark run are appended to a JSON history file, and the compare
+command compares two runs of the history and flags the benchmarks that got slower than the threshold.
+
+Usage:
+    python benchmark.py run [--quick] [--filter TEXT] [--label LABEL] [--history FILE]
+    python benchmark.py compare [--threshold FRACTION] [--history FILE] [BASE [NEW]]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from itertools import chain
+
+import numpy as np
+
+import distributions
+import utils
+import virt_queueing_model as qm
+import virt_queueing_simulation as qs
+
+Engine = qs.QueueingSystemSimulation.Engine
+ServiceDiscipline = qs.QueueingSystem.ServiceDiscipline
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_history.json")
+
+# Simulation grid of (N, C, S, Rs).  All of them are stable at the offered load of the benchmarks.
+SIM_GRID = [
+    (8, 4, 0, 1),
+    (8, 4, 4, 5),
+    (100, 10, 10, 5),
+    (100, 10, 100, 20),
+    (1000, 100, 10, 1),
+    (1000, 100, 100, 10),
+]
+
+# Arrival distributions of run_experiments.py.
+SIM_DISTRIBUTIONS = OrderedDict([
+    ("M at Sigma", "M"),
+    ("Half Sigma", "E4"),
+    ("Twice Sigma", "Hyper(WL=[1, 10], WP=[1, 3.26])"),
+    ("D at Zero", "D")
+])
+
+# Engines of each service discipline.  The vectorized engine only supports FCFS.
+SIM_ENGINES = OrderedDict([
+    (ServiceDiscipline.FCFS, (Engine.SIMPY, Engine.SLOT_CALENDAR, Engine.VECTORIZED)),
+    (ServiceDiscipline.LCFS, (Engine.SIMPY, Engine.SLOT_CALENDAR)),
+    (ServiceDiscipline.SIRO, (Engine.SIMPY, Engine.SLOT_CALENDAR)),
+])
+
+OFFERED_LOAD = 0.5
+
+# Number of clocks of the simulation benchmarks.  The offered load is the total over the N streams, so a run has about
+# the same number of arrivals for each N.
+SIM_CLOCKS = 40000
+QUICK_SIM_CLOCKS = 10000
+
+DEFAULT_REPEAT = 3
+QUICK_REPEAT = 1
+
+DEFAULT_THRESHOLD = 0.1
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def time_best(func, repeat, setup=None):
+    """ Call func repeat times and get the best time and the value of func in that call.  With a setup function, func
+    is called with the value of a new setup() call each time, and the setup is not timed. """
+    best_time = None
+    best_value = None
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        t1 = time.perf_counter()
+        value = func(*args)
+        elapsed_time = time.perf_counter() - t1
+        if best_time is None or elapsed_time < best_time:
+            best_time, best_value = elapsed_time, value
+    return best_time, best_value
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def make_simulation(N, C, S, Rs, A_dist, SD, engine, online_stats=False):
+    """ Make a simulation of the benchmarks.  The streams share one random generator like the runs of a batch. """
+    lambd = qm.QueueingSystemModel_MG1.calc_lambd_from_offered_load(N, 1, OFFERED_LOAD)
+    random_class = random.Random(0)
+    arrival_distributions = [distributions.RandomDistribution.get_distribution(A_dist, lambd,
+                                                                                random_class=random_class)
+                             for _ in range(N)]
+    return qs.QueueingSystemSimulation(N=N, C=C, S=S, Rs=Rs, arrival_distributions=arrival_distributions, f_clk=1,
+                                       SD=SD, sd_random_class=random.Random(1), stats_warmup_time=100,
+                                       engine=engine, online_stats=online_stats)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def benchmark_simulations(sim_clocks, repeat, selected):
+    """ Time QueueingSystemSimulation.run over the simulation grid, without the setup of the simulation.  The rate is
+    the job events per second. """
+    for N, C, S, Rs in SIM_GRID:
+        for A_dist in SIM_DISTRIBUTIONS.values():
+            for SD, engines in SIM_ENGINES.items():
+                for engine in engines:
+                    name = "sim/N=%d,C=%d,S=%d,Rs=%d/%s/%s/%s" % (N, C, S, Rs, A_dist, SD.name, engine.name)
+                    if not selected(name):
+                        continue
+
+                    def setup():
+                        return make_simulation(N, C, S, Rs, A_dist, SD, engine)
+
+                    def run(sim):
+                        sim.run(sim_clocks)
+                        return sim.system.num_events()
+
+                    yield name, time_best(run, repeat, setup=setup), "events/s"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def benchmark_stats_reduction(sim_clocks, repeat, selected):
+    """ Time the reduction of the statistics of a run to its results (get_queue_results), with the stored and with the
+    online statistics.  The rate is the stored statistics entries (or the job events for the online statistics) per
+    second. """
+    for online_stats in (False, True):
+        name = "stats/%s/N=8" % ("online" if online_stats else "stored")
+        if not selected(name):
+            continue
+        sim = make_simulation(8, 4, 4, 5, "M", ServiceDiscipline.FCFS, Engine.SLOT_CALENDAR, online_stats=online_stats)
+        sim.run(sim_clocks * 10)
+        if online_stats:
+            amount = sim.system.num_events()
+        else:
+            amount = sum(queue_stats.buffer_size() for queue_stats in sim.system.stats)
+
+        def reduce():
+            for queue_stats in sim.system.stats:
+                qs.QueueingSystemSimulationBatch.get_queue_results(queue_stats)
+            return amount
+
+        yield name, time_best(reduce, repeat), "entries/s" if not online_stats else "events/s"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def benchmark_model(repeat, selected):
+    """ Time the construction of QueueingSystemModel_MG1 over the experiments of run_experiments.py.  The rate is the
+    models per second. """
+    name = "model/MG1"
+    if not selected(name):
+        return
+    parameters = []
+    for C, N, S, offered_load_list, Rs_max in [(10, 100, 100, [0.08, 0.5], 40), (4, 8, 4, [0.16, 0.48], 20)]:
+        for offered_load in offered_load_list:
+            lambd = qm.QueueingSystemModel_MG1.calc_lambd_from_offered_load(N, 1, offered_load)
+            for Rs in range(1, Rs_max + 1):
+                parameters.append((N, C, S, Rs, lambd))
+
+    def construct():
+        for _ in range(10):
+            for N, C, S, Rs, lambd in parameters:
+                qm.QueueingSystemModel_MG1(N, C, S, Rs, t_clk=1, lambd=lambd)
+        return 10 * len(parameters)
+
+    yield name, time_best(construct, repeat), "models/s"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def benchmark_batch(sim_clocks, repeat, selected, max_workers):
+    """ Time a QueueingSystemSimulationBatch end to end, with the result files in a temporary directory.  The rate is
+    the runs per second. """
+    name = "batch/N=8/VECTORIZED"
+    if not selected(name):
+        return
+    num_replications = 2
+    Rs_list = range(1, 5)
+
+    def parameters():
+        lambd = qm.QueueingSystemModel_MG1.calc_lambd_from_offered_load(8, 1, OFFERED_LOAD)
+        for A_dist in SIM_DISTRIBUTIONS.values():
+            for Rs in Rs_list:
+                yield qs.QueueingSystemSimulationBatch.SimulationParametersTuple(
+                    num_replications, 8, 4, 4, Rs, 1, A_dist, lambd, sim_clocks)
+
+    def run():
+        with tempfile.TemporaryDirectory() as temp_dir, contextlib.redirect_stdout(io.StringIO()):
+            batch_sim = qs.QueueingSystemSimulationBatch(os.path.join(temp_dir, "detail.csv"),
+                                                         os.path.join(temp_dir, "summary.csv"),
+                                                         max_workers=max_workers, engine=Engine.VECTORIZED)
+            batch_sim.run(parameters())
+        return len(SIM_DISTRIBUTIONS) * len(Rs_list) * num_replications
+
+    yield name, time_best(run, repeat), "runs/s"
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def get_git_commit():
+    """ Get the git commit of the working tree, or None. """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def load_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file) as f:
+        return json.load(f)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def save_history(history_file, history):
+    """ Save the history.  The file is written to a temporary file first and then renamed. """
+    temp_file = "%s.%d.tmp" % (history_file, os.getpid())
+    with open(temp_file, "w") as f:
+        json.dump(history, f, indent=1)
+    os.replace(temp_file, history_file)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_benchmarks(quick=False, name_filter=None, label=None, history_file=HISTORY_FILE, max_workers=None):
+    """ Run the benchmarks, print their results, and append them to the history file.  Returns the history entry. """
+    sim_clocks = QUICK_SIM_CLOCKS if quick else SIM_CLOCKS
+    repeat = QUICK_REPEAT if quick else DEFAULT_REPEAT
+
+    def selected(name):
+        return name_filter is None or name_filter in name
+
+    results = OrderedDict()
+    with utils.TimeIt("Benchmarks", verbose=True):
+        for name, (best_time, amount), unit in chain(
+                benchmark_simulations(sim_clocks, repeat, selected),
+                benchmark_stats_reduction(sim_clocks, repeat, selected),
+                benchmark_model(repeat, selected),
+                benchmark_batch(sim_clocks, repeat, selected, max_workers)):
+            rate = amount / best_time if best_time > 0 else float("nan")
+            results[name] = {"seconds": best_time, "rate": rate, "unit": unit}
+            print("%-80s %9.4f s %14.1f %s" % (name, best_time, rate, unit))
+
+    entry = OrderedDict([
+        ("label", label),
+        ("time", utils.get_formatted_time()),
+        ("git_commit", get_git_commit()),
+        ("quick", quick),
+        ("python", platform.python_version()),
+        ("numpy", np.__version__),
+        ("platform", platform.platform()),
+        ("results", results),
+    ])
+    history = load_history(history_file)
+    history.append(entry)
+    save_history(history_file, history)
+    print("Appended the results to %s as run %d." % (history_file, len(history) - 1))
+    return entry
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def find_entry(history, key):
+    """ Find a history entry by its index (negative indices count from the end) or by its label. """
+    try:
+        return history[int(key)]
+    except ValueError:
+        pass
+    except IndexError:
+        raise ValueError("There is no run %s in the history." % key)
+    for entry in reversed(history):
+        if entry["label"] == key:
+            return entry
+    raise ValueError("There is no run labeled %s in the history." % repr(key))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def compare_entries(base, new, threshold=DEFAULT_THRESHOLD):
+    """ Compare the results of two history entries.  A benchmark is flagged as slower when its best time grew by more
+    than the threshold fraction.  Returns the names of the slower benchmarks. """
+    slower = []
+    for name, new_result in new["results"].items():
+        base_result = base["results"].get(name)
+        if base_result is None:
+            continue
+        change = new_result["seconds"] / base_result["seconds"] - 1
+        if change > threshold:
+            flag = "SLOWER"
+            slower.append(name)
+        elif change < -threshold:
+            flag = "faster"
+        else:
+            flag = ""
+        print("%-80s %9.4f s %9.4f s %+7.1f %%  %s" % (name, base_result["seconds"], new_result["seconds"],
+                                                        change * 100, flag))
+    print("%d benchmarks are slower than the base by more than %.0f %%." % (len(slower), threshold * 100))
+    return slower
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def main(argv=None):
+    # The history file is an option of each command.
+    history_parser = argparse.ArgumentParser(add_help=False)
+    history_parser.add_argument("--history", default=HISTORY_FILE, help="JSON history file of the benchmark runs")
+
+    parser = argparse.ArgumentParser(description="Benchmarks of the virtualized hardware queueing simulation.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", parents=[history_parser],
+                                       help="run the benchmarks and append the results to the history")
+    run_parser.add_argument("--quick", action="store_true", help="run shorter simulations once each")
+    run_parser.add_argument("--filter", help="only run the benchmarks whose names contain this text")
+    run_parser.add_argument("--label", help="label of the run in the history")
+    run_parser.add_argument("--max-workers", type=int, help="max workers of the batch benchmark")
+
+    compare_parser = subparsers.add_parser("compare", parents=[history_parser], help="compare two runs of the history")
+    compare_parser.add_argument("base", nargs="?", default="-2", help="index or label of the base run (default -2)")
+    compare_parser.add_argument("new", nargs="?", default="-1", help="index or label of the new run (default -1)")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="fraction of the base time that counts as a slowdown (default %.2f)" %
+                                     DEFAULT_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run_benchmarks(quick=args.quick, name_filter=args.filter, label=args.label, history_file=args.history,
+                       max_workers=args.max_workers)
+        return 0
+    else:
+        history = load_history(args.history)
+        try:
+            base = find_entry(history, args.base)
+            new = find_entry(history, args.new)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        print("Base: %s %s (%s)" % (base["label"], base["time"], base["git_commit"]))
+        print("New:  %s %s (%s)" % (new["label"], new["time"], new["git_commit"]))
+        return 1 if compare_entries(base, new, threshold=args.threshold) else 0
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
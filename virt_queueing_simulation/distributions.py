@@ -1,16 +1,41 @@
-""" Distributions module """
-
+""" Distributions module
+
+The interarrival times are drawn one at a time with random_sample(), or in blocks as a NumPy array with sample(n) or
+sample_into(buffer).  The block samplers draw the uniform samples of a random.Random in bulk with the NumPy MT19937 bit
+generator (random_uniforms()), which draws the same uniform samples as random.Random.random() and leaves the random
+class in the same state, so a stream is reproduced by the MT19937 state (or substream, see mt19937_substreams) of its
+random class either way.  The block samplers transform the uniform samples with NumPy, whose log can differ from
+math.log in the last bit, so a simulation draws the interarrival times of a stream either one at a time or in blocks in
+every engine (see block_sampled_streams()), and the engines give the same arrival times.
+"""
+
+import ast
+import ctypes
 import math
 import operator as op
 import random
 import re
+import sys
+from collections import Counter
 from functools import reduce
-from itertools import permutations
 
+import numpy as np
+
+import arrival_trace_cache
 import utils
 
 default_random_class = random._inst
 
+# NumPy MT19937 bit generator of random_uniforms().  Its state (the 624 words of the state and the position in them) is
+# set and read through an array view of the state struct, because the state property copies and validates the state
+# with a dictionary, which takes longer than drawing thousands of samples.
+_bit_generator = np.random.MT19937(0)
+_generator = np.random.Generator(_bit_generator)
+_bit_generator_state = np.ctypeslib.as_array(
+    ctypes.cast(_bit_generator.ctypes.state_address, ctypes.POINTER(ctypes.c_uint32)), shape=(625,))
+assert _bit_generator_state[:624].tolist() == _bit_generator.state["state"]["key"].tolist()
+assert _bit_generator_state[624] == _bit_generator.state["state"]["pos"]
+
 
 # ######################################################################################################################
 
@@ -24,11 +49,126 @@ def nCr(n, r):
     return numer//denom
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def phase_type_moment(alpha, T, n):
+    """ Get the nth moment of the phase-type distribution with the initial probabilities alpha and the sub-generator
+    matrix T, which is n! alpha (-T)^-n 1. """
+    v = np.ones(len(alpha))
+    for _ in range(n):
+        v = np.linalg.solve(-T, v)
+    return math.factorial(n) * float(np.dot(alpha, v))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def random_generate(random_class, generate):
+    """ Draw samples from a random.Random in bulk with generate(generator), which draws them from a NumPy Generator in
+    the MT19937 state of the random class.  The random class is left in the state after the draws.  Returns the result
+    of generate(), or None for any other random class, such as one that overrides random(). """
+    random_class_type = random_class.__class__
+    if random_class_type.random is not random.Random.random or random_class_type.getstate is not random.Random.getstate:
+        return None
+    version, internal_state, gauss_next = random_class.getstate()
+    _bit_generator_state[:] = internal_state
+    result = generate(_generator)
+    random_class.setstate((version, tuple(_bit_generator_state.tolist()), gauss_next))
+    return result
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def random_uniforms(random_class, n):
+    """ Draw n uniform samples in [0, 1) from a random.Random in bulk (random_generate()).  They are the samples of n
+    calls of random_class.random(), because the NumPy MT19937 bit generator makes its doubles from the same 53 bits of
+    two 32-bit outputs as random.Random.  Returns None for any other random class. """
+    return random_generate(random_class, lambda generator: generator.random(n))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def block_sampled_streams(arrival_distributions, shared_random_classes=()):
+    """ Get the indices of the streams whose interarrival times can be drawn in blocks.  The draws of the streams that
+    share a random class (with each other, with the random module, or with one of shared_random_classes) interleave in
+    the random class, so they are drawn one at a time in the order of the simulation.  The other streams draw from a
+    random class of their own, or from none, such as a trace. """
+    counts = Counter(id(dist.random_class) for dist in arrival_distributions)
+    shared = {id(default_random_class)} | {id(random_class) for random_class in shared_random_classes}
+    return {index for index, dist in enumerate(arrival_distributions)
+            if dist.random_class is None or
+            (counts[id(dist.random_class)] == 1 and id(dist.random_class) not in shared)}
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class SampleBuffer:
+    """ Sample buffer class.  It draws the samples of a distribution in blocks of BLOCK_SIZE with sample(n), and returns
+    them one at a time, or n at a time with take(n), for the arrival processes of the streams that are drawn in blocks
+    (block_sampled_streams()).  The blocks are the same however the samples are taken, so the samples are the same even
+    for a distribution whose samples depend on the size of the blocks, such as a phase-type distribution. """
+
+    BLOCK_SIZE = 4096
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, dist, block_size=BLOCK_SIZE):
+        self.dist = dist
+        self.block_size = block_size
+        # The last block and the position of the next sample in it.
+        self.block = np.empty(0)
+        self.position = 0
+        # The samples of the block that were moved to a list for __call__ but not returned yet, in reverse order.
+        self.samples = []
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def next_block(self):
+        self.block = self.dist.sample(self.block_size)
+        self.position = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __call__(self):
+        samples = self.samples
+        if not samples:
+            if self.position == len(self.block):
+                self.next_block()
+            samples = self.samples = self.block[self.position:][::-1].tolist()
+            self.position = len(self.block)
+        return samples.pop()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def take(self, n):
+        """ Get the next n samples as an array. """
+        parts = []
+        samples = self.samples
+        if samples:
+            m = min(n, len(samples))
+            parts.append(np.array(samples[:len(samples) - m - 1:-1] if m < len(samples) else samples[::-1]))
+            del samples[len(samples) - m:]
+            n -= m
+        while n > 0:
+            if self.position == len(self.block):
+                self.next_block()
+            m = min(n, len(self.block) - self.position)
+            parts.append(self.block[self.position:self.position + m])
+            self.position += m
+            n -= m
+        if len(parts) == 1:
+            return parts[0].copy()
+        return np.concatenate(parts) if parts else np.empty(0)
+
+
 # ######################################################################################################################
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 class WeightedChoice:
+    """ Weighted choice class.  It chooses an index with a probability proportional to its weight from one uniform
+    sample.  A choice of up to SCAN_MAX_WEIGHTS weights scans the cumulative weights for the uniform sample, which gives
+    the choices of the earlier versions from the same random state.  The choices of more weights, and the block choices
+    (choices()), use the alias method (Walker, with the table construction of Vose), which takes constant time for any
+    number of weights.  The uniform sample u is scaled to u k for k weights:  its integer part picks a column of the
+    table, and its fractional part picks the index of the column or its alias.  So the two map the same uniform sample
+    to different choices. """
+
+    SCAN_MAX_WEIGHTS = 8    # Largest number of weights that choice() scans
+
     # ------------------------------------------------------------------------------------------------------------------
     def __init__(self, weights, random_class=None):
         # Setup the random class.
@@ -37,29 +177,72 @@ class WeightedChoice:
         else:
             self.random_class = random_class
 
-        # Normalize the weights (exclude the last value as this will be the default case when a random sample is
-        # tested).
+        # Build the alias table.  Each column holds the probability of its own index scaled by k, and the rest of the
+        # column is the alias of an index with more than its share.
         assert len(weights) >= 1
+        k = len(weights)
         divisor = sum(weights)
+
+        # Normalize the weights for the scan (exclude the last value as this will be the default case when a random
+        # sample is tested).
         self.norm_weights = tuple(wi/divisor for wi in weights[:-1])
 
+        scaled = [wi * k / divisor for wi in weights]
+        probabilities = [1.0] * k
+        aliases = list(range(k))
+        small = [i for i, pi in enumerate(scaled) if pi < 1]
+        large = [i for i, pi in enumerate(scaled) if pi >= 1]
+        while small and large:
+            i = small.pop()
+            j = large.pop()
+            probabilities[i] = scaled[i]
+            aliases[i] = j
+            scaled[j] = (scaled[j] + scaled[i]) - 1
+            if scaled[j] < 1:
+                small.append(j)
+            else:
+                large.append(j)
+        # The columns that are left over are full (up to rounding).
+        self.k = k
+        self.probabilities = tuple(probabilities)
+        self.aliases = tuple(aliases)
+        self._probabilities_array = np.array(probabilities)
+        self._aliases_array = np.array(aliases, dtype=np.int64)
+
     # ------------------------------------------------------------------------------------------------------------------
     def __call__(self):
         return self.choice()
 
     # ------------------------------------------------------------------------------------------------------------------
-    def choice(self):
-        # Get random sample between 0 and 1.
+    def choice(self, n=None):
+        """ Get a random choice, or an array of n random choices. """
+        if n is not None:
+            uniforms = random_uniforms(self.random_class, n)
+            if uniforms is None:
+                return np.fromiter((self.choice() for _ in range(n)), dtype=np.int64, count=n)
+            return self.choices(uniforms)
+
         sample = self.random_class.random()
+        if self.k <= self.SCAN_MAX_WEIGHTS:
+            # Test sample against the normalized weights.
+            for i, wi_prime in enumerate(self.norm_weights):
+                if sample < wi_prime:
+                    return i
+                sample -= wi_prime
 
-        # Test sample against the normalized weights.
-        for i, wi_prime in enumerate(self.norm_weights):
-            if sample < wi_prime:
-                return i
-            sample -= wi_prime
+            # Default case is the last choice.
+            return len(self.norm_weights)
 
-        # Default case is the last choice.
-        return len(self.norm_weights)
+        sample *= self.k
+        i = int(sample)
+        return i if sample - i < self.probabilities[i] else self.aliases[i]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def choices(self, samples):
+        """ Get the choices of an array of uniform samples with the alias table. """
+        samples = samples * self.k
+        columns = samples.astype(np.int64)
+        return np.where(samples - columns < self._probabilities_array[columns], columns, self._aliases_array[columns])
 
 
 # ######################################################################################################################
@@ -67,6 +250,12 @@ class WeightedChoice:
 
 # ----------------------------------------------------------------------------------------------------------------------
 class RandomDistribution:
+    """ Random distribution base class.  A distribution draws the uniform samples of its random class for its samples.
+    The distributions that draw a fixed number of uniform samples for each sample (uniforms_per_sample()) transform
+    them in blocks (transform_uniforms()) for sample(n) and sample_into(buffer). """
+
+    SAMPLE_CHUNK_SIZE = 1 << 16     # Number of samples that are transformed at a time
+
     # ------------------------------------------------------------------------------------------------------------------
     def __init__(self, lambd, random_class=None):
         self.lambd = lambd
@@ -84,6 +273,15 @@ class RandomDistribution:
         elif type == "M":
             # Exponential
             return ExponentialDistribution, (lambd,)
+        elif type[:9] == "Empirical":
+            # Empirical distribution of measured interarrival samples
+            #     Expect a type string of the form:  "Empirical(path)" or "Empirical(path, raw)"
+            #     where path is a file of interarrival samples (see arrival_trace_cache.read_sample_source), and raw
+            #     draws the samples as they are instead of scaling them to the rate lambd.
+            match = re.match(r"\(\s*(.*?)\s*(,\s*raw\s*)?\)$", type[9:])
+            if match is None or not match.group(1):
+                raise ValueError("type == %s" % repr(type))
+            return EmpiricalDistribution, (lambd, match.group(1), match.group(2) is not None)
         elif type[:1] == "E":
             # Erlang with parameter k
             try:
@@ -116,9 +314,55 @@ class RandomDistribution:
             except Exception:
                 raise ValueError("type == %s" % repr(type))
             return HyperexponentialDistribution, (lambd, lambd_weights, prob_weights)
+        elif type[:2] == "PH":
+            # Phase-type with the initial probabilities and the sub-generator matrix of the phases
+            #     Expect a type string of the form:  "PH(alpha=[a1, ..., ak], T=[[t11, ...], ..., [..., tkk]])"
+            #     where alpha are the initial probabilities of the k phases and T is the matrix of their transition
+            #     rates, which is scaled to the rate lambd.
+            try:
+                match = re.match(r"\(\s*alpha\s*=\s*(\[.*?\])\s*,\s*T\s*=\s*(\[.*\])\s*\)$", type[2:])
+                alpha = tuple(float(a) for a in ast.literal_eval(match.group(1)))
+                T = tuple(tuple(float(t) for t in row) for row in ast.literal_eval(match.group(2)))
+            except Exception:
+                raise ValueError("type == %s" % repr(type))
+            return PhaseTypeDistribution, (lambd, alpha, T)
+        elif type[:4] == "MMPP":
+            # Markov-modulated Poisson process with the arrival rates and the generator matrix of the states
+            #     Expect a type string of the form:  "MMPP(R=[r1, ..., rm], Q=[[q11, ..., q1m], ..., [..., qmm]])"
+            #     where R are the arrival rates in the m states and Q is the matrix of the transition rates between
+            #     the states, which are scaled to the rate lambd.
+            try:
+                match = re.match(r"\(\s*R\s*=\s*(\[.*?\])\s*,\s*Q\s*=\s*(\[.*\])\s*\)$", type[4:])
+                rates = tuple(float(r) for r in ast.literal_eval(match.group(1)))
+                Q = tuple(tuple(float(q) for q in row) for row in ast.literal_eval(match.group(2)))
+            except Exception:
+                raise ValueError("type == %s" % repr(type))
+            return MarkovModulatedPoissonDistribution, (lambd, rates, Q)
+        elif type[:5] == "Trace":
+            # Replay of a recorded arrival trace
+            #     Expect a type string of the form:  "Trace(path)" or "Trace(path, raw)"
+            #     where path is an arrival trace or a trace source file (see arrival_trace_cache), and raw replays the
+            #     times as they are instead of scaling them to the rate lambd.
+            match = re.match(r"\(\s*(.*?)\s*(,\s*raw\s*)?\)$", type[5:])
+            if match is None or not match.group(1):
+                raise ValueError("type == %s" % repr(type))
+            return TraceDistribution, (lambd, match.group(1), match.group(2) is not None)
         else:
             raise ValueError("type == %s" % repr(type))
 
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def get_stream_parameters(dist_args, index):
+        """ Get the parameters of the distribution of the given stream from the parameters of the distribution. """
+        return dist_args
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def get_cache_key(dist_args):
+        """ Get a key of the data that the distribution reads from a file, which changes when the file changes, or None
+        if it does not read one.  It is part of the key of the cached arrival traces. """
+        return None
+
     # ------------------------------------------------------------------------------------------------------------------
     @classmethod
     def get_distribution(cls, type, lambd, random_class=None):
@@ -150,6 +394,43 @@ class RandomDistribution:
     def random_sample(self):
         raise NotImplementedError
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def phase_type(self):
+        """ Get the phase-type representation (alpha, T) of the distribution (see PhaseTypeDistribution). """
+        raise NotImplementedError
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def uniforms_per_sample(self):
+        """ Number of uniform samples that each sample draws, or None if it is not fixed. """
+        return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def transform_uniforms(self, uniforms, out):
+        """ Transform the uniform samples (an array of a row of uniforms_per_sample() uniform samples for each sample in
+        the order they were drawn) to the samples in out.  The uniform samples can be overwritten. """
+        raise NotImplementedError
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def sample(self, n):
+        """ Get the next n samples as an array. """
+        return self.sample_into(np.empty(n))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def sample_into(self, buffer):
+        """ Fill the float64 buffer with the next samples, and return it.  The uniform samples are drawn and transformed
+        in chunks, which bounds their memory.  The samples are drawn one at a time with random_sample() if the
+        distribution does not draw a fixed number of uniform samples or the random class is not a random.Random. """
+        num_uniforms = self.uniforms_per_sample()
+        for start in range(0, len(buffer), self.SAMPLE_CHUNK_SIZE):
+            out = buffer[start:start + self.SAMPLE_CHUNK_SIZE]
+            if num_uniforms is not None:
+                uniforms = random_uniforms(self.random_class, len(out) * num_uniforms)
+                if uniforms is not None:
+                    self.transform_uniforms(uniforms.reshape(len(out), num_uniforms), out)
+                    continue
+            out[:] = np.fromiter((self.random_sample() for _ in range(len(out))), dtype=np.float64, count=len(out))
+        return buffer
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 class DiscreteDistribution(RandomDistribution):
@@ -174,6 +455,11 @@ class DiscreteDistribution(RandomDistribution):
     def random_sample(self):
         return 1/self.lambd
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def sample_into(self, buffer):
+        buffer.fill(1/self.lambd)
+        return buffer
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 class ExponentialDistribution(RandomDistribution):
@@ -198,14 +484,39 @@ class ExponentialDistribution(RandomDistribution):
     def random_sample(self):
         return self.random_class.expovariate(self.lambd)
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def phase_type(self):
+        return np.ones(1), np.full((1, 1), -self.lambd)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def uniforms_per_sample(self):
+        return 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def transform_uniforms(self, uniforms, out):
+        # random.expovariate(lambd) is -log(1 - random()) / lambd.
+        np.subtract(1.0, uniforms[:, 0], out=out)
+        np.log(out, out=out)
+        np.divide(out, -self.lambd, out=out)
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 class ErlangDistribution(RandomDistribution):
-    """ The Erlang distribution consists of a sum of k identical exponential distributions. """
+    """ The Erlang distribution consists of a sum of k identical exponential distributions.  The samples that are drawn
+    one at a time sum k exponential samples, which gives the samples of the earlier versions from the same random
+    state.  The block samples (sample()) sum the k exponential samples -log(U_i) / (k lambd) as
+    -log(U_1 U_2 ... U_k) / (k lambd) instead, which takes one log for up to PRODUCT_SIZE uniform samples instead of one
+    for each. """
+
+    # Number of uniform samples in each product.  The product of 100 uniform samples does not underflow in practice,
+    # because its -log is Erlang distributed with a mean of 100 and a standard deviation of 10.
+    PRODUCT_SIZE = 100
+
     # ------------------------------------------------------------------------------------------------------------------
     def __init__(self, lambd, k, random_class=None):
         super().__init__(lambd, random_class)
         self.k = k
+        self.rate = k * lambd
 
     # ------------------------------------------------------------------------------------------------------------------
     def mean(self):
@@ -217,20 +528,35 @@ class ErlangDistribution(RandomDistribution):
 
     # ------------------------------------------------------------------------------------------------------------------
     def moment(self, n):
-        k = self.k
-        lambd = self.lambd
-        if n == 1:
-            return 1/lambd
-        elif n == 2:
-            return (1+k)/(k*lambd**2)
-        elif n == 3:
-            return ((1+k)*(2+k))/(k**2*lambd**3)
-        else:
-            raise NotImplementedError("n == %s" % repr(n))
+        # k (k+1) ... (k+n-1) / (k lambd)^n
+        return math.prod(range(self.k, self.k + n)) / self.rate**n
 
     # ------------------------------------------------------------------------------------------------------------------
     def random_sample(self):
-        return sum(self.random_class.expovariate(self.lambd*self.k) for _ in range(self.k))
+        return sum(self.random_class.expovariate(self.rate) for _ in range(self.k))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def phase_type(self):
+        # k phases of the rate k lambd in sequence.
+        alpha = np.zeros(self.k)
+        alpha[0] = 1.0
+        T = np.diag(np.full(self.k, -self.rate)) + np.diag(np.full(self.k - 1, self.rate), 1)
+        return alpha, T
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def uniforms_per_sample(self):
+        return self.k
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def transform_uniforms(self, uniforms, out):
+        np.subtract(1.0, uniforms, out=uniforms)
+        out.fill(0.0)
+        for start in range(0, self.k, self.PRODUCT_SIZE):
+            product = uniforms[:, start].copy()
+            for j in range(start + 1, min(start + self.PRODUCT_SIZE, self.k)):
+                product *= uniforms[:, j]
+            out -= np.log(product)
+        out /= self.rate
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -258,20 +584,35 @@ class HypoexponentialDistribution(RandomDistribution):
             return self.mean()
         elif n == 2:
             return self.variance() + self.mean()**2
-        elif n == 3:
-            # todo: verify derived formula
-            L = self.lambdas
-            k = len(L)
-            return sum(6/L[i]**3 for i in range(k)) + \
-                nCr(3, 2)*sum(2/(L[i]**2 * L[j]) for i, j in permutations(range(k), 2)) + \
-                sum(1/(L[i] * L[j] * L[h]) for i, j, h in permutations(range(k), 3))
         else:
-            raise NotImplementedError("n == %s" % repr(n))
+            return phase_type_moment(*self.phase_type(), n)
 
     # ------------------------------------------------------------------------------------------------------------------
     def random_sample(self):
         return sum(self.random_class.expovariate(lambd_i) for lambd_i in self.lambdas)
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def phase_type(self):
+        # The phases of the lambdas in sequence.
+        k = len(self.lambdas)
+        alpha = np.zeros(k)
+        alpha[0] = 1.0
+        T = np.diag(-np.array(self.lambdas)) + np.diag(np.array(self.lambdas[:-1]), 1)
+        return alpha, T
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def uniforms_per_sample(self):
+        return len(self.lambdas)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def transform_uniforms(self, uniforms, out):
+        # The exponential samples of the phases are in the columns.
+        np.subtract(1.0, uniforms, out=uniforms)
+        np.log(uniforms, out=uniforms)
+        out.fill(0.0)
+        for j, lambd_i in enumerate(self.lambdas):
+            out -= uniforms[:, j] / lambd_i
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 class HyperexponentialDistribution(RandomDistribution):
@@ -309,6 +650,565 @@ class HyperexponentialDistribution(RandomDistribution):
         choice = self._expo_choice()
         return self.random_class.expovariate(self.lambdas[choice])
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def phase_type(self):
+        # The phases of the lambdas in parallel.
+        return np.array(self.probabilities), np.diag(-np.array(self.lambdas))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def uniforms_per_sample(self):
+        # One for the choice of the exponential distribution and one for its sample.
+        return 2
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def transform_uniforms(self, uniforms, out):
+        choices = self._expo_choice.choices(uniforms[:, 0])
+        np.subtract(1.0, uniforms[:, 1], out=out)
+        np.log(out, out=out)
+        np.divide(out, -np.array(self.lambdas)[choices], out=out)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class PhaseTypeDistribution(RandomDistribution):
+    """ The Phase-type distribution is the time until absorption of a Markov chain with k transient phases.  The chain
+    starts in phase i with the probability alpha_i (or is absorbed at once with the probability 1 - sum(alpha)), and
+    T is the sub-generator matrix of the phases:  T_ij is the transition rate from phase i to phase j, -T_ii is the
+    total rate out of phase i, and the rest of it is the absorption (exit) rate t_i.  T is scaled so that the mean is
+    1/lambd.  The exponential, Erlang, hypoexponential, and hyperexponential distributions are phase-type
+    distributions, with the representations of their phase_type(), which from_distribution() samples with this class.
+
+    The moments are n! alpha (-T)^-n 1.  A sample draws a phase with alpha, and then an exponential holding time in
+    its phase and the next phase (or the exit) for each step of the chain, with the alias tables (see WeightedChoice)
+    of the jump chain.  The block samples run the chains of all of the samples at once, one step at a time, which
+    draws the uniform samples in a different order than random_sample(). """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, lambd, alpha, T, random_class=None):
+        super().__init__(lambd, random_class)
+        alpha = np.array(alpha, dtype=np.float64)
+        T = np.array(T, dtype=np.float64)
+        k = len(alpha)
+        if k < 1 or T.shape != (k, k):
+            raise ValueError("T must be a %d x %d matrix for %d phases, not %s." % (k, k, k, repr(T.tolist())))
+        if np.any(alpha < 0) or alpha.sum() > 1 + 1e-9:
+            raise ValueError("alpha must be probabilities, not %s." % repr(alpha.tolist()))
+        rates = -np.diag(T)
+        exit_rates = -T.sum(axis=1)
+        if np.any(rates <= 0) or np.any(T - np.diag(np.diag(T)) < 0) or np.any(exit_rates < -1e-9 * rates):
+            raise ValueError("T must be a sub-generator matrix, not %s." % repr(T.tolist()))
+        try:
+            unscaled_mean = np.dot(alpha, np.linalg.solve(-T, np.ones(k)))
+        except np.linalg.LinAlgError:
+            raise ValueError("T must be a sub-generator matrix of transient phases, not %s." % repr(T.tolist()))
+        if not 0 < unscaled_mean < math.inf:
+            raise ValueError("The phase-type distribution alpha = %s, T = %s has no positive mean."
+                             % (repr(alpha.tolist()), repr(T.tolist())))
+
+        self.alpha = alpha
+        self.T = T * (unscaled_mean * lambd)
+        self.k = k
+        self.rates = rates * (unscaled_mean * lambd)
+        exit_rates = np.maximum(exit_rates, 0) * (unscaled_mean * lambd)
+
+        # Jump chain:  the choice of the initial phase, and of the next phase of each phase, where k is the exit.
+        self._initial_choice = WeightedChoice(tuple(alpha) + (max(1 - alpha.sum(), 0.0),),
+                                              random_class=self.random_class)
+        self._transition_choices = []
+        for i in range(k):
+            weights = np.append(np.maximum(self.T[i], 0), exit_rates[i])
+            weights[i] = 0.0
+            self._transition_choices.append(WeightedChoice(tuple(weights), random_class=self.random_class))
+
+        # Alias tables of the transition choices of all of the phases, with a row for each phase.
+        self._transition_probabilities = np.array([c.probabilities for c in self._transition_choices])
+        self._transition_aliases = np.array([c.aliases for c in self._transition_choices])
+        utils.assert_float_eq(self.mean(), self.moment(1))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def from_distribution(cls, dist, random_class=None):
+        """ Get the phase-type distribution of a distribution with a phase-type representation (phase_type()). """
+        return cls(dist.lambd, *dist.phase_type(), random_class=random_class)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mean(self):
+        return 1/self.lambd
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def variance(self):
+        return self.moment(2) - self.mean()**2
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def moment(self, n):
+        return phase_type_moment(self.alpha, self.T, n)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def phase_type(self):
+        return self.alpha.copy(), self.T.copy()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def random_sample(self):
+        k = self.k
+        rates = self.rates
+        transition_choices = self._transition_choices
+        expovariate = self.random_class.expovariate
+        total = 0.0
+        phase = self._initial_choice()
+        while phase < k:
+            total += expovariate(rates[phase])
+            phase = transition_choices[phase]()
+        return total
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def sample_into(self, buffer):
+        """ Fill the float64 buffer with the next samples, and return it.  The chains of all of the samples take their
+        steps at once:  each step draws two uniform samples for each chain that is not absorbed yet, one for the
+        holding time and one for the next phase. """
+        uniforms = random_uniforms(self.random_class, len(buffer))
+        if uniforms is None:
+            return super().sample_into(buffer)
+
+        k = self.k
+        buffer.fill(0.0)
+        phases = self._initial_choice.choices(uniforms)
+        active = np.flatnonzero(phases < k)
+        columns = k + 1
+        while len(active):
+            uniforms = random_uniforms(self.random_class, 2 * len(active)).reshape(len(active), 2)
+            active_phases = phases[active]
+            # Holding time in the phase:  -log(1 - u) / rate.
+            holding_times = np.log(1.0 - uniforms[:, 0])
+            holding_times /= -self.rates[active_phases]
+            buffer[active] += holding_times
+            # Next phase with the alias table of the phase.
+            scaled = uniforms[:, 1] * columns
+            column = scaled.astype(np.intp)
+            next_phases = np.where(scaled - column < self._transition_probabilities[active_phases, column],
+                                   column, self._transition_aliases[active_phases, column])
+            phases[active] = next_phases
+            active = active[next_phases < k]
+        return buffer
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class MarkovModulatedPoissonDistribution(RandomDistribution):
+    """ The Markov-modulated Poisson process (MMPP) is a Poisson process whose arrival rate is R_i while a continuous
+    time Markov chain of m states is in state i.  Q is the generator matrix of the chain:  Q_ij is the transition rate
+    from state i to state j, and the rows sum to zero.  The arrivals are bursty while the chain stays in the states of
+    the high rates, so the interarrival times are correlated, unlike those of the other distributions.  R and Q are
+    scaled together so that the mean arrival rate is lambd.  The moments are those of the marginal distribution of the
+    interarrival times, which is the phase-type distribution of phase_type().
+
+    The interarrival times are the times between the arrivals of one process, so each stream needs a distribution of
+    its own, which keeps the state of the chain between its samples.  The chain starts in its stationary distribution.
+    random_sample() draws the next event of the state (an arrival or a transition) with the rates of its competing
+    exponentials until an arrival.  The block samples generate a path of sojourns of the chain, the Poisson number of
+    arrivals in each sojourn, and their uniformly distributed times in it, with NumPy.  The interarrival times that are
+    generated past the block are kept for the next block. """
+
+    MIN_SOJOURNS = 16
+    MAX_SOJOURNS = 1 << 16
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, lambd, rates, Q, random_class=None):
+        super().__init__(lambd, random_class)
+        rates = np.array(rates, dtype=np.float64)
+        Q = np.array(Q, dtype=np.float64)
+        m = len(rates)
+        if m < 2:
+            raise ValueError("An MMPP needs at least 2 states, not %d (the Poisson process is M)." % m)
+        if Q.shape != (m, m):
+            raise ValueError("Q must be a %d x %d matrix for %d states, not %s." % (m, m, m, repr(Q.tolist())))
+        switching_rates = -np.diag(Q)
+        if np.any(switching_rates <= 0) or np.any(Q - np.diag(np.diag(Q)) < 0) or \
+                np.any(np.abs(Q.sum(axis=1)) > 1e-9 * switching_rates):
+            raise ValueError("Q must be a generator matrix, not %s." % repr(Q.tolist()))
+        if np.any(rates < 0):
+            raise ValueError("R must be arrival rates, not %s." % repr(rates.tolist()))
+
+        # Stationary distribution of the chain:  pi Q = 0 and sum(pi) = 1.
+        A = Q.T.copy()
+        A[-1] = 1.0
+        b = np.zeros(m)
+        b[-1] = 1.0
+        try:
+            stationary = np.linalg.solve(A, b)
+        except np.linalg.LinAlgError:
+            stationary = None
+        if stationary is None or np.any(stationary <= 0):
+            raise ValueError("Q must be the generator matrix of an irreducible chain, not %s." % repr(Q.tolist()))
+        if np.dot(stationary, rates) <= 0:
+            raise ValueError("R must have a positive mean arrival rate, not %s." % repr(rates.tolist()))
+
+        scale = lambd / np.dot(stationary, rates)
+        self.rates = rates * scale
+        self.Q = Q * scale
+        self.stationary = stationary
+        self.switching_rates = switching_rates * scale
+        self.event_rates = self.rates + self.switching_rates
+        # Mean number of sojourns of the chain for each arrival.
+        self.sojourns_per_arrival = np.dot(stationary, self.switching_rates) / lambd
+
+        # Event chain:  the choice of the next event in each state, which is a transition to another state or an
+        # arrival (m).  The choice of the next state of a transition is in the alias tables of its rows.
+        self._initial_choice = WeightedChoice(tuple(stationary), random_class=self.random_class)
+        self._event_choices = []
+        transition_choices = []
+        for i in range(m):
+            weights = self.Q[i].copy()
+            weights[i] = 0.0
+            transition_choices.append(WeightedChoice(tuple(weights), random_class=self.random_class))
+            self._event_choices.append(WeightedChoice(tuple(weights) + (self.rates[i],),
+                                                      random_class=self.random_class))
+        self._transition_probabilities = np.array([c.probabilities for c in transition_choices])
+        self._transition_aliases = np.array([c.aliases for c in transition_choices])
+
+        # State of the chain (None before the first sample), the time from the last arrival to the end of the path of
+        # the block samples, and the interarrival times of the block samples that are generated but not returned yet.
+        self.state = None
+        self.time_since_arrival = 0.0
+        self.pending = np.empty(0)
+        utils.assert_float_eq(self.mean(), self.moment(1))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mean(self):
+        return 1/self.lambd
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def variance(self):
+        return self.moment(2) - self.mean()**2
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def moment(self, n):
+        return phase_type_moment(*self.phase_type(), n)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def phase_type(self):
+        # The interarrival time starts in the distribution of the states at the arrivals, and it ends at the next
+        # arrival:  T is Q without the arrival rates.
+        alpha = self.stationary * self.rates
+        return alpha / alpha.sum(), self.Q - np.diag(self.rates)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def random_sample(self):
+        if self.state is None:
+            self.state = self._initial_choice()
+        m = len(self.rates)
+        expovariate = self.random_class.expovariate
+        state = self.state
+        total = 0.0
+        while True:
+            total += expovariate(self.event_rates[state])
+            event = self._event_choices[state]()
+            if event == m:
+                self.state = state
+                return total
+            state = event
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def sample_into(self, buffer):
+        """ Fill the float64 buffer with the next samples, and return it.  The samples are generated in windows of
+        sojourns of the chain (generate_window()). """
+        n = len(buffer)
+        filled = min(n, len(self.pending))
+        buffer[:filled] = self.pending[:filled]
+        self.pending = self.pending[filled:]
+        while filled < n:
+            needed = n - filled
+            interarrival_times = random_generate(self.random_class,
+                                                 lambda generator: self.generate_window(generator, needed))
+            if interarrival_times is None:
+                super().sample_into(buffer[filled:])
+                break
+            count = min(needed, len(interarrival_times))
+            buffer[filled:filled + count] = interarrival_times[:count]
+            self.pending = interarrival_times[count:]
+            filled += count
+        return buffer
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def generate_window(self, generator, n):
+        """ Generate the interarrival times of a path of sojourns of the chain, with enough sojourns for about n
+        arrivals, from the NumPy generator.  Returns an array of the interarrival times, which can be empty. """
+        m = len(self.rates)
+        num_sojourns = int(n * self.sojourns_per_arrival) + self.MIN_SOJOURNS
+        num_sojourns = min(num_sojourns, self.MAX_SOJOURNS)
+        if self.state is None:
+            self.state = int(self._initial_choice.choices(generator.random(1))[0])
+
+        # Path of the chain.  The next state of each transition is chosen for every state at once, and the path follows
+        # them from the current state.
+        if m == 2:
+            # The transitions of two states alternate.
+            states = (self.state + np.arange(num_sojourns + 1)) % 2
+        else:
+            scaled = generator.random(num_sojourns) * m
+            columns = scaled.astype(np.intp)
+            fractions = scaled - columns
+            next_states = np.empty((num_sojourns, m), dtype=np.intp)
+            for i in range(m):
+                next_states[:, i] = np.where(fractions < self._transition_probabilities[i, columns],
+                                             columns, self._transition_aliases[i, columns])
+            path = [self.state]
+            state = self.state
+            for row in next_states.tolist():
+                state = row[state]
+                path.append(state)
+            states = np.array(path)
+        self.state = int(states[-1])
+        states = states[:-1]
+
+        # Sojourn times, and the arrivals in each sojourn.
+        durations = generator.standard_exponential(num_sojourns) / self.switching_rates[states]
+        ends = np.cumsum(durations)
+        counts = generator.poisson(self.rates[states] * durations)
+        arrival_times = np.repeat(ends - durations, counts)
+        arrival_times += generator.random(len(arrival_times)) * np.repeat(durations, counts)
+        arrival_times.sort()
+
+        interarrival_times = np.diff(arrival_times, prepend=-self.time_since_arrival)
+        if len(arrival_times):
+            self.time_since_arrival = ends[-1] - arrival_times[-1]
+        else:
+            self.time_since_arrival += ends[-1]
+        return interarrival_times
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class TraceDistribution(RandomDistribution):
+    """ The Trace distribution replays the interarrival times of one stream of a recorded arrival trace (see
+    arrival_trace_cache) instead of drawing them.  The times are memory mapped and read in chunks, so the memory use
+    does not depend on the size of the trace.  The times are scaled so that the mean interarrival time of the trace is
+    1/lambd, unless raw is set.  The moments are those of the interarrival times of all of the streams of the trace.
+    After the last arrival of the stream, the interarrival time is infinite. """
+
+    CHUNK_SIZE = 4096
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, lambd, trace_path, raw=False, stream=0, random_class=None):
+        super().__init__(lambd, random_class)
+        # The samples are not random.
+        self.random_class = None
+        self.trace_path = trace_path
+        self.raw = raw
+        self.stream = stream
+        self.open()
+        if not 0 <= stream < len(self.offsets) - 1:
+            raise ValueError("Arrival trace %s does not have stream %d." % (repr(trace_path), stream))
+
+        self.moments = arrival_trace_cache.interarrival_moments(self.resolved_trace_path)
+        self.scale = 1.0 if raw else 1 / (lambd * self.moments[0])
+        self.horizon = self.trace_horizon * self.scale
+
+        # Position of the next arrival of the stream in the trace, the time of the previous arrival, and the samples that
+        # were read but not returned yet.
+        self.position = int(self.offsets[stream])
+        self.prev_time = 0.0
+        self.samples = []
+        self.samples_index = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def open(self):
+        self.resolved_trace_path = arrival_trace_cache.resolve_trace(self.trace_path)
+        self.times, self.offsets, self.trace_horizon = arrival_trace_cache.open_trace(self.resolved_trace_path)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getstate__(self):
+        # The memory mapped trace is opened again when the distribution is unpickled, and the samples that were read but
+        # not returned yet are read again from the trace.
+        state = self.__dict__.copy()
+        del state["times"]
+        del state["offsets"]
+        num_unused = len(self.samples) - self.samples_index
+        if num_unused:
+            position = self.position - num_unused
+            state["position"] = position
+            state["prev_time"] = 0.0 if position == self.offsets[self.stream] else float(self.times[position - 1])
+            state["samples"] = []
+            state["samples_index"] = 0
+        return state
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def get_stream_parameters(dist_args, index):
+        lambd, trace_path, raw = dist_args
+        return lambd, trace_path, raw, index
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mean(self):
+        return self.moments[0] * self.scale
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def variance(self):
+        return (self.moments[1] - self.moments[0]**2) * self.scale**2
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def moment(self, n):
+        if 1 <= n <= 3:
+            return self.moments[n - 1] * self.scale**n
+        else:
+            raise NotImplementedError("n == %s" % repr(n))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def read(self, n):
+        """ Read the next interarrival times from the trace, up to n of them. """
+        start = self.position
+        stop = min(start + n, int(self.offsets[self.stream + 1]))
+        times = np.asarray(self.times[start:stop])
+        if stop == start:
+            return times
+        self.position = stop
+        samples = np.diff(times, prepend=self.prev_time) * self.scale
+        self.prev_time = float(times[-1])
+        return samples
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def sample(self, n):
+        """ Get the next n interarrival times as an array. """
+        unused = self.samples[self.samples_index:self.samples_index + n]
+        self.samples_index += len(unused)
+        samples = np.full(n, math.inf)
+        samples[:len(unused)] = unused
+        read_samples = self.read(n - len(unused))
+        samples[len(unused):len(unused) + len(read_samples)] = read_samples
+        return samples
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def random_sample(self):
+        if self.samples_index == len(self.samples):
+            self.samples = self.read(self.CHUNK_SIZE).tolist()
+            self.samples_index = 0
+            if not self.samples:
+                return math.inf
+        sample = self.samples[self.samples_index]
+        self.samples_index += 1
+        return sample
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class EmpiricalDistribution(RandomDistribution):
+    """ The Empirical distribution draws the interarrival times from the empirical distribution of measured interarrival
+    samples.  Its table (see arrival_trace_cache.import_empirical_table) has the quantiles q_0 <= ... <= q_K of the
+    samples at the probabilities j/K, and the inverse of the distribution function interpolates them linearly:  a
+    uniform sample u is the fraction u K - j of the way from q_j to q_j+1, where j = int(u K), so there is nothing to
+    search.  The distribution is uniform between the quantiles, so the moments are exact sums over the K segments of the
+    table.  The samples are scaled so that the mean is 1/lambd, unless raw is set.  The table is read from its file
+    once in each process and shared by the distributions of the streams. """
+
+    # Tables that are open in this process:  the table path to the (table, table list) of the table.
+    tables = {}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, lambd, source_path, raw=False, random_class=None):
+        super().__init__(lambd, random_class)
+        self.source_path = source_path
+        self.raw = raw
+        self.open()
+        self.k = len(self.table) - 1
+        # The moments with a scale of 1 are the moments of the table.
+        self.scale = 1.0
+        if not raw:
+            self.scale = 1 / (lambd * self.moment(1))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def open(self):
+        self.table_path = arrival_trace_cache.resolve_empirical_table(self.source_path)
+        if self.table_path not in self.tables:
+            table, _ = arrival_trace_cache.open_empirical_table(self.table_path)
+            self.tables[self.table_path] = table, table.tolist()
+        self.table, self.table_list = self.tables[self.table_path]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getstate__(self):
+        # The table is opened again when the distribution is unpickled.
+        state = self.__dict__.copy()
+        del state["table"]
+        del state["table_list"]
+        return state
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def get_cache_key(dist_args):
+        table_path = arrival_trace_cache.resolve_empirical_table(dist_args[1])
+        return arrival_trace_cache.open_empirical_table(table_path)[1]["digest"]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mean(self):
+        return self.moment(1)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def variance(self):
+        return self.moment(2) - self.moment(1)**2
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def moment(self, n):
+        # The nth moment of the uniform distribution from a to b is (a^n + a^(n-1) b + ... + b^n) / (n+1).
+        a = self.table[:-1]
+        b = self.table[1:]
+        total = np.zeros(self.k)
+        for i in range(n + 1):
+            total += a**i * b**(n - i)
+        return float(np.mean(total)) / (n + 1) * self.scale**n
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def random_sample(self):
+        table = self.table_list
+        sample = self.random_class.random() * self.k
+        j = int(sample)
+        return (table[j] + (sample - j) * (table[j + 1] - table[j])) * self.scale
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def uniforms_per_sample(self):
+        return 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def transform_uniforms(self, uniforms, out):
+        samples = uniforms[:, 0]
+        samples *= self.k
+        j = samples.astype(np.intp)
+        samples -= j
+        lower = self.table[j]
+        np.subtract(self.table[j + 1], lower, out=out)
+        out *= samples
+        out += lower
+        out *= self.scale
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def check_moments(dist, n=1000000, orders=(1, 2, 3), z_max=4.0):
+    """ Check the moments of n samples of the distribution (sample(n)) against moment().  The difference of each sample
+    moment from the moment is divided by the standard error of the sample moment, which is estimated from the samples,
+    and the check fails if it is more than z_max.  Returns a list of the (order, sample moment, moment, z) of each
+    order, and whether the check passed. """
+    X = dist.sample(n)
+    results = []
+    passed = True
+    for order in orders:
+        X_order = X**order
+        sample_moment = np.mean(X_order)
+        moment = dist.moment(order)
+        standard_error = np.std(X_order) / math.sqrt(n)
+        if standard_error > 0:
+            z = (sample_moment - moment) / standard_error
+        else:
+            z = 0.0 if utils.is_float_eq(sample_moment, moment) else math.inf
+        passed = passed and abs(z) <= z_max
+        results.append((order, sample_moment, moment, z))
+    return results, passed
+
 
 # ######################################################################################################################
 
@@ -318,11 +1218,12 @@ if __name__ == "__main__":
     #choose = WeightedChoice([1, 5, 9, 0.1])
     #print(Counter(choose() for _ in range(10000)))
 
-    import numpy as np
-
-    for type in ("M", "E4", "Hyper(WL=[1, 10], WP=[1, 3.26])"):
+    all_passed = True
+    for type in ("D", "M", "E4", "E10", "Hypo(1, 2, 4)", "Hyper(WL=[1, 10], WP=[1, 3.26])",
+                 "PH(alpha=[0.5, 0.5, 0], T=[[-2, 1, 0.5], [0, -3, 1], [0.5, 0, -1]])",
+                 "MMPP(R=[2, 0.5, 1], Q=[[-1, 0.5, 0.5], [0.2, -0.4, 0.2], [1, 1, -2]])"):
         lambd = 1
-        dist = RandomDistribution.get_distribution(type, lambd)
+        dist = RandomDistribution.get_distribution(type, lambd, random_class=random.Random(0))
         print("%s with lambd = %.4f" % (type, lambd))
         print("-" * 40)
         print_blank = False
@@ -350,5 +1251,16 @@ if __name__ == "__main__":
         print("Var[X]:     %.4f" % np.var(X))
         print("Std[X]:     %.4f" % np.std(X))
         print()
+
+        # Check the moments of the block samples.
+        results, passed = check_moments(dist)
+        for order, sample_moment, moment, z in results:
+            print("sample E[X^%d]: %.4f  (z = %.2f)" % (order, sample_moment, z))
+        print("Moment check %s." % ("passed" if passed else "FAILED"))
+        all_passed = all_passed and passed
+        print()
         print()
 
+    if not all_passed:
+        sys.exit(1)
+
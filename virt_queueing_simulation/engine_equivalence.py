@@ -0,0 +1,191 @@
+""" Engine equivalence module
+
+The simulation engines and the options of the simpy engine must give the same statistics, point for point, as the simpy
+engine (QueueingSystem), which steps the server clock by clock.  This module runs each case of a grid of N, C, S, Rs,
+and arrival distributions on all of them, with the streams sharing one random generator (like the runs of a batch) and
+with a random generator for each stream, and compares the statistics of every virtual queue with those of the simpy
+engine.
+
+The deterministic cases have interarrival times that land on the service slots and on the service completions of the
+virtual queues, which are the event ties that the engines have to order the same way:  an arrival is handled before a
+slot or a completion at the same time, unless the last arrival of its stream is less than a clock before, and a
+completion before a slot at the same time, except for C = 1 in the other rounds of the period.  The slot calendar
+engine is also checked with an event trace, which makes it advance the queues one event at a time instead of with array
+operations, and the slot calendar and vectorized engines are also checked in the steps of a checkpointed run.  LCFS
+and SIRO are checked on the slot calendar engine, but without the job wait and response times of SIRO, as the slot
+calendar engine picks the random jobs in a different order.
+
+Usage:
+    python engine_equivalence.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+from collections import OrderedDict
+
+import distributions
+import event_trace
+import virt_queueing_simulation as qs
+
+Engine = qs.QueueingSystemSimulation.Engine
+ServiceDiscipline = qs.QueueingSystem.ServiceDiscipline
+
+# Cases of (N, C, S, Rs, A_dist, mean interarrival clocks of each stream).  With f_clk = 1, the service time is C
+# clocks, the slots of a virtual queue are C clocks apart in its group, and the period is N / C * (Rs * C + S) clocks.
+CASES = [
+    (8, 4, 4, 2, "M", 16),
+    (6, 2, 3, 2, "E4", 7.5),
+    (10, 5, 7, 3, "M", 40),
+    (8, 1, 2, 4, "E4", 20),
+    (4, 1, 0, 3, "M", 6),
+    # One arrival each period, at a slot of the first virtual queue.
+    (8, 4, 4, 2, "D", 24),
+    # Two arrivals each period, at the slots of the first virtual queue of each group.
+    (8, 4, 4, 2, "D", 12),
+    # Arrivals at the service completions of the jobs before them (a full load).
+    (4, 4, 0, 1, "D", 4),
+    # Arrivals at the slots with C = 1, where the completions and the slots tie in every clock.
+    (4, 1, 0, 1, "D", 8),
+    (4, 1, 0, 3, "D", 6),
+    # Arrivals between the clocks.
+    (4, 2, 0, 1, "D", 5.5),
+    # Arrivals every clock and more than one arrival in a clock (an overload, which grows the queues).
+    (1, 1, 0, 1, "D", 1),
+    (4, 1, 0, 1, "D", 0.25),
+    # Arrivals within the service time of the jobs before them, at some of their slots and service completions.
+    (4, 4, 0, 1, "D", 2.5),
+    (8, 4, 4, 2, "D", 3),
+    (4, 4, 0, 1, "D", 0.5),
+]
+
+SIM_TIME = 3000
+STATS_WARMUP_TIME = 100
+CHECKPOINT_INTERVAL = 433
+
+# Variants of (engine, keyword arguments of QueueingSystemSimulation, checkpointed).  The event trace is made for each
+# run.  The results of each variant of a service discipline are compared with the results of the REFERENCE variant.
+REFERENCE = "SIMPY"
+VARIANTS = OrderedDict([
+    ("SIMPY", (Engine.SIMPY, {}, False)),
+    ("SIMPY skip_idle_clocks", (Engine.SIMPY, {"skip_idle_clocks": True}, False)),
+    ("SIMPY completion_ring", (Engine.SIMPY, {"completion_ring": True}, False)),
+    ("SIMPY merged_arrivals", (Engine.SIMPY, {"merged_arrivals": True}, False)),
+    ("SLOT_CALENDAR", (Engine.SLOT_CALENDAR, {}, False)),
+    ("SLOT_CALENDAR event loop", (Engine.SLOT_CALENDAR, {"event_trace": None}, False)),
+    ("SLOT_CALENDAR checkpointed", (Engine.SLOT_CALENDAR, {}, True)),
+    ("VECTORIZED", (Engine.VECTORIZED, {}, False)),
+    ("VECTORIZED checkpointed", (Engine.VECTORIZED, {}, True)),
+])
+
+# Variants of each service discipline.  The vectorized engine only supports FCFS.
+VARIANT_SERVICE_DISCIPLINES = OrderedDict([
+    (ServiceDiscipline.FCFS, tuple(variant for variant in VARIANTS if variant != REFERENCE)),
+    (ServiceDiscipline.LCFS, ("SLOT_CALENDAR", "SLOT_CALENDAR checkpointed")),
+    (ServiceDiscipline.SIRO, ("SLOT_CALENDAR", "SLOT_CALENDAR checkpointed")),
+])
+
+# Statistics that depend on the order of the random picks of SIRO, which is different in the slot calendar engine.
+SIRO_PICK_RESULT_NAMES = ("job_wait_time", "job_response_time")
+
+# Names of the statistics of each virtual queue in get_results().
+RESULT_NAMES = ("total_arrivals", "total_departures", "total_time", "jobs_waiting", "jobs_receiving_service",
+                "jobs_in_system", "busy_period.start", "busy_period.duration", "busy_period.num_jobs",
+                "idle_period.start", "idle_period.duration", "job_wait_time", "job_service_time", "job_response_time")
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def make_simulation(N, C, S, Rs, A_dist, interarrival_clocks, shared, SD=ServiceDiscipline.FCFS, engine=Engine.SIMPY,
+                    **kwargs):
+    """ Make a simulation of a case.  With shared, the streams share one random generator, otherwise each stream has
+    its own. """
+    lambd = 1 / interarrival_clocks
+    shared_random_class = random.Random(1)
+    arrival_distributions = [distributions.RandomDistribution.get_distribution(
+        A_dist, lambd, random_class=shared_random_class if shared else random.Random(1 + index)) for index in range(N)]
+    return qs.QueueingSystemSimulation(N=N, C=C, S=S, Rs=Rs, arrival_distributions=arrival_distributions, f_clk=1,
+                                       SD=SD, sd_random_class=random.Random(5), stats_warmup_time=STATS_WARMUP_TIME,
+                                       engine=engine, **kwargs)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def get_results(sim):
+    """ Get the statistics of each virtual queue of a simulation that was run, in the order of RESULT_NAMES. """
+    results = []
+    for stats in sim.system.stats:
+        results.append((stats.total_arrivals, stats.total_departures, stats.total_time,
+                        list(stats.jobs_waiting.data_series), list(stats.jobs_receiving_service.data_series),
+                        list(stats.jobs_in_system.data_series), list(stats.busy_period.start),
+                        list(stats.busy_period.duration), list(stats.busy_period.num_jobs),
+                        list(stats.idle_period.start), list(stats.idle_period.duration), list(stats.job_wait_time),
+                        list(stats.job_service_time), list(stats.job_response_time)))
+    return results
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_variant(case, shared, SD, variant):
+    """ Run a variant of a case and get its results. """
+    engine, kwargs, checkpointed = VARIANTS[variant]
+    kwargs = dict(kwargs)
+    if "event_trace" in kwargs:
+        kwargs["event_trace"] = event_trace.EventTrace()
+    sim = make_simulation(*case, shared=shared, SD=SD, engine=engine, **kwargs)
+    if checkpointed:
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            sim.run(SIM_TIME, checkpoint_file=os.path.join(checkpoint_dir, "checkpoint.pkl"),
+                    checkpoint_interval=CHECKPOINT_INTERVAL)
+    else:
+        sim.run(SIM_TIME)
+    return get_results(sim)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def find_difference(expected, results, ignored_names=()):
+    """ Get the first virtual queue and statistic that are different in the results, or None if they are the same.  The
+    statistics of ignored_names are not compared. """
+    for virt_index, (expected_stats, stats) in enumerate(zip(expected, results)):
+        for name, expected_value, value in zip(RESULT_NAMES, expected_stats, stats):
+            if value != expected_value and name not in ignored_names:
+                return virt_index, name
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def check_engines():
+    """ Compare the variants of all of the cases with the reference variant, print the result of each, and get the
+    number of variants that are different. """
+    num_failed = 0
+    for case in CASES:
+        for shared in (True, False):
+            for SD, variants in VARIANT_SERVICE_DISCIPLINES.items():
+                ignored_names = SIRO_PICK_RESULT_NAMES if SD == ServiceDiscipline.SIRO else ()
+                name = "N=%d,C=%d,S=%d,Rs=%d/%s/%s/%s" % (case[:5] + (SD.name, "shared" if shared else "independent"))
+                # The simulation prints its setup and its results.
+                with contextlib.redirect_stdout(io.StringIO()):
+                    expected = run_variant(case, shared, SD, REFERENCE)
+                    differences = [(variant, find_difference(expected, run_variant(case, shared, SD, variant),
+                                                             ignored_names))
+                                   for variant in variants]
+                for variant, difference in differences:
+                    if difference is None:
+                        print("%-60s %-28s ok" % (name, variant))
+                    else:
+                        num_failed += 1
+                        print("%-60s %-28s FAILED (virtual queue %d, %s)" % ((name, variant) + difference))
+    return num_failed
+
+
+# ######################################################################################################################
+
+# ----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    num_failed = check_engines()
+    print("%d variants are different from the %s engine." % (num_failed, REFERENCE))
+    if num_failed:
+        sys.exit(1)
@@ -0,0 +1,199 @@
+""" Event trace module
+
+An event trace records the events of a simulation as fixed-width binary records (time, type, virt_index, job_no) in a
+preallocated ring buffer, which keeps the last capacity events.  The ring buffer is a NumPy array, or a memory mapped
+.npy file when the trace has a path, so the events of a long run can be read after the run (or after it crashed) without
+printing a text line for each event.
+
+The first record of the buffer is a header record, whose job_no is the total number of events that were recorded, so
+the .npy file alone tells where the ring buffer wraps around.  The records are written to the buffer in blocks, and the
+header is updated with each block, so the file is complete after flush() or close().
+
+The job times of the print_job_stat_info() messages are not recorded, because they follow from the ARRIVAL,
+ENTER_SERVICE, and COMPLETE_SERVICE events of the job.
+
+Usage to decode a trace file:  python event_trace.py trace.npy [virt_index]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ("time", "<f8"),        # Simulation time of the event
+    ("type", "u1"),         # Event type
+    ("virt_index", "<i4"),  # Virtual queue, the first queue of the group for SERVER_GROUP, or -1
+    ("job_no", "<i8"),      # Job number within the virtual queue, or -1
+])
+
+# Event types.  The header record has type HEADER.
+HEADER = 0
+ARRIVAL = 1
+ENTER_SERVICE = 2
+COMPLETE_SERVICE = 3
+SERVER_START = 4
+SERVER_GROUP = 5
+SERVER_PERIOD = 6
+SERVER_CONTEXT_SWITCH = 7
+
+EVENT_TYPE_NAMES = {
+    ARRIVAL: "ARRIVAL",
+    ENTER_SERVICE: "ENTER_SERVICE",
+    COMPLETE_SERVICE: "COMPLETE_SERVICE",
+    SERVER_START: "SERVER_START",
+    SERVER_GROUP: "SERVER_GROUP",
+    SERVER_PERIOD: "SERVER_PERIOD",
+    SERVER_CONTEXT_SWITCH: "SERVER_CONTEXT_SWITCH",
+}
+
+DEFAULT_CAPACITY = 1 << 20
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class EventTrace:
+    """ Event trace ring buffer.  The simulation calls record() for each event, which appends the record to a block
+    list, and the block is copied into the ring buffer with one array assignment when it is full, which costs much less
+    per event than a NumPy scalar assignment. """
+
+    BLOCK_SIZE = 4096
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, capacity=DEFAULT_CAPACITY, path=None):
+        """ capacity is the number of records that are kept.  With a path, the ring buffer is a memory mapped .npy file
+        that is created (or overwritten) there. """
+        if capacity <= 0:
+            raise ValueError("Event trace capacity (%s) is not positive." % repr(capacity))
+        self.capacity = capacity
+        self.path = path
+        if path is None:
+            self.records = np.zeros(capacity + 1, dtype=RECORD_DTYPE)
+        else:
+            self.records = np.lib.format.open_memmap(path, mode="w+", dtype=RECORD_DTYPE, shape=(capacity + 1,))
+        self.records[0] = (np.nan, HEADER, -1, 0)
+        self.num_events = 0
+        self.block = []
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __len__(self):
+        """ Number of events that were recorded, including the ones that were overwritten. """
+        return self.num_events + len(self.block)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def record(self, time, event_type, virt_index=-1, job_no=-1):
+        block = self.block
+        block.append((time, event_type, virt_index, job_no))
+        if len(block) >= self.BLOCK_SIZE:
+            self.flush()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def record_arrays(self, times, event_types, virt_indices, job_nos):
+        """ Record the events of arrays, which are in time order. """
+        self.flush()
+        events = np.empty(len(times), dtype=RECORD_DTYPE)
+        events["time"] = times
+        events["type"] = event_types
+        events["virt_index"] = virt_indices
+        events["job_no"] = job_nos
+        self.write(events)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def flush(self):
+        """ Copy the block of the recorded events into the ring buffer. """
+        if self.block:
+            events = np.array(self.block, dtype=RECORD_DTYPE)
+            self.block = []
+            self.write(events)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def write(self, events):
+        """ Write the events array into the ring buffer after the last event, and update the header. """
+        capacity = self.capacity
+        ring = self.records[1:]
+        num_events = self.num_events + len(events)
+        if len(events) > capacity:
+            events = events[-capacity:]
+        start = (num_events - len(events)) % capacity
+        end = start + len(events)
+        if end <= capacity:
+            ring[start:end] = events
+        else:
+            split = capacity - start
+            ring[start:] = events[:split]
+            ring[:end - capacity] = events[split:]
+        self.num_events = num_events
+        self.records[0]["job_no"] = num_events
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        """ Flush the recorded events, and flush a memory mapped ring buffer to its file. """
+        self.flush()
+        if self.path is not None:
+            self.records.flush()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def events(self):
+        """ Get the events in the ring buffer in the order they were recorded. """
+        self.flush()
+        return ordered_events(self.records)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def save(self, path):
+        """ Save the ring buffer as a .npy file that read_events() can decode. """
+        self.flush()
+        np.save(path, self.records)
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def ordered_events(records):
+    """ Get the events of the records of a ring buffer (with the header record) in the order they were recorded. """
+    if len(records) == 0 or records[0]["type"] != HEADER:
+        raise ValueError("The records do not start with an event trace header.")
+    ring = records[1:]
+    capacity = len(ring)
+    num_events = int(records[0]["job_no"])
+    if num_events <= capacity:
+        return np.array(ring[:num_events])
+    start = num_events % capacity
+    return np.concatenate((ring[start:], ring[:start]))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def read_events(path):
+    """ Read the events of an event trace file in the order they were recorded. """
+    return ordered_events(np.load(path, mmap_mode="r"))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def format_event(event):
+    """ Format an event record as a text line like the show_*_info messages of the simulation. """
+    time, event_type, virt_index, job_no = event.item()
+    name = EVENT_TYPE_NAMES.get(event_type, "TYPE_%d" % event_type)
+    if job_no >= 0:
+        return "[%s]  %-21s  virt_index:%d, job_no:%d" % (("%.2f" % time).rjust(9), name, virt_index, job_no)
+    elif virt_index >= 0:
+        return "[%s]  %-21s  virt_index:%d" % (("%.2f" % time).rjust(9), name, virt_index)
+    else:
+        return "[%s]  %s" % (("%.2f" % time).rjust(9), name)
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: %s trace.npy [virt_index]" % os.path.basename(sys.argv[0]), file=sys.stderr)
+        sys.exit(2)
+
+    events = read_events(sys.argv[1])
+    if len(sys.argv) == 3:
+        events = events[events["virt_index"] == int(sys.argv[2])]
+    for event in events:
+        print(format_event(event))
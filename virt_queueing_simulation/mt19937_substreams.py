@@ -1,31 +1,217 @@
-""" mt19937 sub-streams module """
+""" mt19937 sub-streams module
+
+The substreams are the states of the MT19937 random number generator of C++ (and Boost), seeded with its default seed
+5489, after (index + 1) 2^50 outputs.  They are the states that mt19937/generate.cpp wrote to mt19937_states.dat, but
+they are calculated here on demand with the jump-ahead of the generator, so the C++ program is not needed.
+
+The state of MT19937 is a sliding window of 624 words of the sequence x_k of its recurrence, and the state after j
+outputs is the window at x_j.  The state after J outputs is g(B) applied to the state, where B is the transition of
+one output, phi is the characteristic polynomial of B (of degree 19937, found with the Berlekamp-Massey algorithm), and
+g(t) = t^J mod phi(t) over GF(2).  So each word of the window at x_J is the XOR of the words of the window at x_j for
+the coefficients g_j of g that are 1, which are read from the first 19937 + 624 words of the sequence.  The polynomials
+are Python ints, where bit i is the coefficient of t^i.  Calculating g for a substream takes most of the time, so the
+states are kept in an LRU cache, and the next substream of a cached state is one jump of 2^50 with a fixed g.
+"""
 
-import os
 import random
+from collections import OrderedDict
+from functools import lru_cache
 from itertools import chain
 
 import numpy as np
 
 # ######################################################################################################################
 
-MT19937_STATES_FILE = os.path.join(os.path.dirname(__file__), "..", "mt19937", "mt19937_states.dat")
+# MT19937 parameters.
+N = 624
+M = 397
+MATRIX_A = 0x9908b0df
+UPPER_MASK = 0x80000000
+LOWER_MASK = 0x7fffffff
+DEGREE = 19937
+DEFAULT_SEED = 5489
+
+# Number of outputs between the substreams, and the number of substreams.
+SUBSTREAM_STEPS = 1 << 50
+nstreams = 10000
+
+# Number of substream states in the LRU cache.
+STATE_CACHE_SIZE = 1024
+
+# Bits of each byte spread to the even bits of 16 bits, for squaring polynomials over GF(2).
+_SPREAD_BYTES = np.array([sum(((v >> i) & 1) << (2 * i) for i in range(8)) for v in range(256)], dtype="<u2")
+
+# Number of bits that are 1 in an int (int.bit_count() is new in Python 3.10).
+_bit_count = getattr(int, "bit_count", lambda value: bin(value).count("1"))
+
+_state_cache = OrderedDict()
+
 
 # ######################################################################################################################
 
-# Load the state data file, which contains an nstreams x 624 array of unsigned ints (type np.uint32).
-state_array = np.fromfile(MT19937_STATES_FILE, dtype=np.uint32)
-state_array = state_array.reshape(10000, 624)
-nstreams = state_array.shape[0]
+# ----------------------------------------------------------------------------------------------------------------------
+def seed_state(seed=DEFAULT_SEED):
+    """ Get the 624 words of the state of MT19937 seeded with the given seed (init_genrand). """
+    state = [seed & 0xffffffff]
+    for i in range(1, N):
+        state.append((1812433253 * (state[-1] ^ (state[-1] >> 30)) + i) & 0xffffffff)
+    return state
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def generate_words(state, n):
+    """ Get the first n words of the sequence of the MT19937 recurrence that starts with the 624 words of the state, as
+    an array.  Each word depends on the words 624, 623, and 227 before it, so the words are calculated in blocks of 227
+    with NumPy. """
+    x = np.empty(max(n, N), dtype=np.uint32)
+    x[:N] = state
+    for start in range(N, n, N - M):
+        stop = min(start + N - M, n)
+        y = (x[start - N:stop - N] & UPPER_MASK) | (x[start - N + 1:stop - N + 1] & LOWER_MASK)
+        x[start:stop] = x[start - N + M:stop - N + M] ^ (y >> 1) ^ ((y & 1) * np.uint32(MATRIX_A))
+    return x[:n]
 
 
 # ######################################################################################################################
 
 # ----------------------------------------------------------------------------------------------------------------------
-def get_random_state_at_index(index):
-    # Convert the array of np.uint32s to a list of Python ints.
-    state_list = [int(x) for x in state_array[index]]
+@lru_cache(maxsize=None)
+def characteristic_polynomial():
+    """ Get the characteristic polynomial phi of the MT19937 transition.  It is the minimal polynomial of the sequence
+    of the top bits of the words, which is found with the Berlekamp-Massey algorithm from 2 DEGREE of them. """
+    bits = (generate_words(seed_state(), 2 * DEGREE + N) >> 31).tolist()
+
+    # Connection polynomials C (the current one) and B (before the last length change), where bit j is the
+    # coefficient of x^j, and the window of the sequence, where bit j is the bit j before the current one.
+    C = 1
+    B = 1
+    L = 0
+    m = 1
+    window = 0
+    for i, bit in enumerate(bits):
+        window = (window << 1) | bit
+        if _bit_count(C & window) & 1:
+            T = C
+            C ^= B << m
+            if 2 * L <= i:
+                L = i + 1 - L
+                B = T
+                m = 1
+                continue
+        m += 1
+    if L != DEGREE:
+        raise ArithmeticError("The minimal polynomial of MT19937 has degree %d, not %d." % (L, DEGREE))
+
+    # phi(t) = t^L C(1/t)
+    return int(bin(C)[2:].zfill(L + 1)[::-1], 2)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+@lru_cache(maxsize=None)
+def _reduction_table():
+    """ Get the multiples of phi whose bits DEGREE to DEGREE + 7 are each byte value, for reducing polynomials modulo
+    phi a byte at a time. """
+    phi = characteristic_polynomial()
+    table = []
+    for value in range(256):
+        multiple = 0
+        for bit in range(7, -1, -1):
+            if ((value ^ (multiple >> DEGREE)) >> bit) & 1:
+                multiple ^= phi << bit
+        table.append(multiple)
+    return table
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def poly_mod(a):
+    """ Reduce the polynomial a modulo phi. """
+    table = _reduction_table()
+    while a.bit_length() > DEGREE:
+        shift = max(a.bit_length() - DEGREE - 8, 0)
+        a ^= table[a >> (DEGREE + shift)] << shift
+    return a
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def poly_square(a):
+    """ Square the polynomial a, which spreads its coefficients to the even powers. """
+    a_bytes = np.frombuffer(a.to_bytes((a.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    return int.from_bytes(_SPREAD_BYTES[a_bytes].tobytes(), "little")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def jump_polynomial(steps):
+    """ Get the jump polynomial t^steps mod phi. """
+    phi = characteristic_polynomial()
+    g = 1
+    for bit in bin(steps)[2:]:
+        g = poly_mod(poly_square(g))
+        if bit == "1":
+            g <<= 1
+            if g >> DEGREE:
+                g ^= phi
+    return g
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def jump_state(state, steps, g=None):
+    """ Get the 624 words of the state after the given number of outputs (at least 1) from the 624 words of a state.
+    The window at x_steps is calculated from the words after the first one with g = t^(steps - 1) mod phi, because only
+    the top bit of the first word is part of the state of the recurrence. """
+    if g is None:
+        g = jump_polynomial(steps - 1)
+    words = generate_words(state, DEGREE + N + 1)
+    g_bits = np.unpackbits(np.frombuffer(g.to_bytes((g.bit_length() + 7) // 8, "little"), dtype=np.uint8),
+                           bitorder="little")
+    offsets = np.arange(1, N + 1)
+    jumped = np.zeros(N, dtype=np.uint32)
+    # XOR the windows of the coefficients that are 1, a chunk of them at a time.
+    ones = np.flatnonzero(g_bits)
+    for start in range(0, len(ones), 1024):
+        jumped ^= np.bitwise_xor.reduce(words[ones[start:start + 1024, None] + offsets], axis=0)
+    return jumped.tolist()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+@lru_cache(maxsize=None)
+def _substream_jump_polynomial():
+    """ Get the jump polynomial of the jump of SUBSTREAM_STEPS from a state (see jump_state()). """
+    return jump_polynomial(SUBSTREAM_STEPS - 1)
+
+
+# ######################################################################################################################
+
+# ----------------------------------------------------------------------------------------------------------------------
+def get_substream_state(index):
+    """ Get the 624 words of the state of the substream with the given index.  The state is jumped from the nearest
+    cached state of a lower index, or from the seed state if there is none. """
+    index = range(nstreams)[index]
+    if index in _state_cache:
+        _state_cache.move_to_end(index)
+        return _state_cache[index]
+
+    lower_indices = [cached_index for cached_index in _state_cache if cached_index < index]
+    if lower_indices:
+        base_index = max(lower_indices)
+        base_state = _state_cache[base_index]
+    else:
+        base_index = -1
+        base_state = seed_state()
+    if index - base_index == 1:
+        state = jump_state(base_state, SUBSTREAM_STEPS, g=_substream_jump_polynomial())
+    else:
+        state = jump_state(base_state, (index - base_index) * SUBSTREAM_STEPS)
+
+    _state_cache[index] = state
+    if len(_state_cache) > STATE_CACHE_SIZE:
+        _state_cache.popitem(last=False)
+    return state
+
 
+# ----------------------------------------------------------------------------------------------------------------------
+def get_random_state_at_index(index):
     # Append the required value of 624 to the list.
+    state_list = list(get_substream_state(index))
     state_list.append(624)
 
     # Define the required internal state tuple and use it to set the state for a new RNG instance.
@@ -59,3 +245,38 @@ index_generator = generate_substream_indices()
 
 
 # ######################################################################################################################
+
+# ----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    import os
+    import sys
+
+    # The 10000th output of the default seeded MT19937 is 4123659995 (C++ standard [rand.predef]).
+    rng = random.Random()
+    rng.setstate((3, tuple(seed_state()) + (N,), None))
+    outputs = [rng.getrandbits(32) for _ in range(10000)]
+    passed = outputs[-1] == 4123659995
+    print("10000th output of the seed state:  %d  %s" % (outputs[-1], "ok" if passed else "FAILED"))
+
+    # The jumps match stepping the generator.
+    for steps in (1, 623, 624, 625, 5000, 100000):
+        rng.setstate((3, tuple(seed_state()) + (N,), None))
+        for _ in range(steps):
+            rng.getrandbits(32)
+        expected = [rng.getrandbits(32) for _ in range(1000)]
+        rng.setstate((3, tuple(jump_state(seed_state(), steps)) + (N,), None))
+        ok = [rng.getrandbits(32) for _ in range(1000)] == expected
+        print("Jump of %d outputs:  %s" % (steps, "ok" if ok else "FAILED"))
+        passed = passed and ok
+
+    # The states match the state file of generate.cpp, if it is there.
+    states_file = os.path.join(os.path.dirname(__file__), "..", "mt19937", "mt19937_states.dat")
+    if os.path.exists(states_file):
+        state_array = np.fromfile(states_file, dtype=np.uint32).reshape(-1, N)
+        for index in (0, 1, 2, len(state_array) - 1):
+            ok = get_substream_state(index) == state_array[index].tolist()
+            print("Substream %d matches %s:  %s" % (index, states_file, "ok" if ok else "FAILED"))
+            passed = passed and ok
+
+    if not passed:
+        sys.exit(1)
@@ -1,10 +1,11 @@
 """ Queueing simulation common module """
 
+import array
 import math
 import statistics
 import sys
 from collections import defaultdict, deque
-from itertools import zip_longest
+from itertools import chain, islice, zip_longest
 
 import numpy as np
 
@@ -34,6 +35,74 @@ def var(X):
         return np.var(X, ddof=1)
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def time_weighted_statistics(times, counts):
+    """ Calculate the time weighted mean, standard deviation, and histogram of a step function of counts in one pass.
+    The count changes to counts[i] at times[i], and the step function ends at times[-1].  There must be at least two
+    times and they must be increasing.  Returns (mean, std, histogram) as TimeCountSeries does. """
+    durations = np.diff(times)
+    segment_counts = counts[:-1]
+    total = float(times[-1] - times[0])
+    weighted_counts = segment_counts * durations
+    mean = float(np.sum(weighted_counts)) / total
+    E2 = float(np.dot(weighted_counts, segment_counts)) / total
+    std = math.sqrt(E2 - mean**2)
+    histogram = np.bincount(segment_counts, weights=durations).tolist()
+    return mean, std, histogram
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def time_weighted_cov(x_times, x_counts, y_times, y_counts):
+    """ Calculate the time weighted covariance of two step functions of counts.  The product of the step functions is
+    integrated from the later start to the later end, as TimeCountSeries.cov() does. """
+    start = max(x_times[0], y_times[0])
+    times = np.union1d(x_times, y_times)
+    times = times[times >= start]
+    x = x_counts[np.searchsorted(x_times, times[:-1], side="right") - 1]
+    y = y_counts[np.searchsorted(y_times, times[:-1], side="right") - 1]
+    durations = np.diff(times)
+    total = float(times[-1] - times[0])
+    EX = float(np.dot(x_counts[:-1], np.diff(x_times))) / float(x_times[-1] - x_times[0])
+    EY = float(np.dot(y_counts[:-1], np.diff(y_times))) / float(y_times[-1] - y_times[0])
+    EXY = float(np.dot(x * y, durations)) / total
+    return EXY - EX*EY
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def mser_truncation(observations, batch_size=5):
+    """ Choose the warmup truncation point of a series of observations with the MSER rule.  The observations are
+    averaged in batches of batch_size (MSER-5 for the default batch size), and the number of batches d to discard
+    minimizes the squared standard error of the mean of the remaining batches,
+        MSER(d) = sum((Z[j] - mean(Z[d:]))**2 for j >= d) / (m - d)**2,
+    for d up to half of the m batches.  Returns the number of observations to discard. """
+    num_batches = len(observations) // batch_size
+    if num_batches < 2:
+        return 0
+    batch_means = np.mean(np.reshape(np.asarray(observations[:num_batches * batch_size], dtype=np.float64),
+                                     (num_batches, batch_size)), axis=1)
+
+    # Sums of the batches from each d to the end.  The batch means are centered first to reduce cancellation.
+    batch_means = batch_means - np.mean(batch_means)
+    sum_1 = np.cumsum(batch_means[::-1])[::-1]
+    sum_2 = np.cumsum((batch_means**2)[::-1])[::-1]
+    n = np.arange(num_batches, 0, -1)
+    mser = (sum_2 - sum_1**2 / n) / n**2
+    return int(np.argmin(mser[:num_batches // 2 + 1])) * batch_size
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def student_t_quantile(p, df):
+    """ Calculate the quantile of Student's t distribution with df degrees of freedom from the normal quantile with
+    the Cornish-Fisher expansion (Abramowitz and Stegun 26.7.5).  The error is below 1e-3 for df >= 5 and the usual
+    confidence levels. """
+    z = statistics.NormalDist().inv_cdf(p)
+    g1 = (z**3 + z) / 4
+    g2 = (5*z**5 + 16*z**3 + 3*z) / 96
+    g3 = (3*z**7 + 19*z**5 + 17*z**3 - 15*z) / 384
+    g4 = (79*z**9 + 776*z**7 + 1482*z**5 - 1920*z**3 - 945*z) / 92160
+    return z + g1/df + g2/df**2 + g3/df**3 + g4/df**4
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 def mean_histogram(*histograms):
     return [statistics.mean(counts) for counts in zip_longest(*histograms, fillvalue=0)]
@@ -59,6 +128,32 @@ class TimeCountSeries:
         else:
             self.data_series = data_series
 
+        # Index of a final point and the integral up to it for integral().
+        self._integral_state = (0, 0.0)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def data_series(self):
+        """ The (t, c) points.  The points of extend_arrays() are kept as (times, counts) arrays after the points of the
+        data series, and they are only moved to it when it is used, so the points of the array engines are not made
+        into tuples unless the series is used point by point.  to_arrays() and num_points() use the arrays as they are.
+        """
+        if self._array_points:
+            for times, counts in self._array_points:
+                self._data_series.extend(zip(times.tolist(), counts.tolist()))
+            self._array_points = []
+        return self._data_series
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @data_series.setter
+    def data_series(self, data_series):
+        self._data_series = data_series
+        self._array_points = []
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def num_points(self):
+        return len(self._data_series) + sum(len(times) for times, _ in self._array_points)
+
     # ------------------------------------------------------------------------------------------------------------------
     @classmethod
     def _get_data_series(cls, data_series, _make_iter=False):
@@ -80,17 +175,221 @@ class TimeCountSeries:
 
     # ------------------------------------------------------------------------------------------------------------------
     def append(self, t, c):
-        if len(self.data_series) <= 1:
-            if len(self.data_series) == 1:
-                pt, pc = self.data_series[-1]
+        if self._array_points:
+            (pt, pc), ppc = self._pop_last_point()
+            points = [(t, c)] if pt == t or pc == ppc else [(pt, pc), (t, c)]
+            self._array_points.append((np.array([point[0] for point in points], dtype=np.float64),
+                                       np.array([point[1] for point in points], dtype=np.int64)))
+            return
+        series = self._data_series
+        if len(series) <= 1:
+            if len(series) == 1:
+                pt, pc = series[-1]
                 if pt == t:
-                    del self.data_series[-1]
+                    del series[-1]
         else:
-            ppt, ppc = self.data_series[-2]
-            pt, pc = self.data_series[-1]
+            ppt, ppc = series[-2]
+            pt, pc = series[-1]
             if pt == t or pc == ppc:
-                del self.data_series[-1]
-        self.data_series.append((t, c))
+                del series[-1]
+        series.append((t, c))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def extend(self, data_series):
+        """ Append each (t, c) point of the data series in order.  The result is the same as calling append() for
+        each point, but it is much faster for a large number of points. """
+        series = self.data_series
+
+        # The last point is held as pending until it is known whether a later point replaces it.
+        pending = series.pop() if series else None
+        prev_c = series[-1][1] if series else None
+
+        for t, c in data_series:
+            if pending is not None:
+                pt, pc = pending
+                if pt != t and pc != prev_c:
+                    series.append(pending)
+                    prev_c = pc
+            pending = (t, c)
+
+        if pending is not None:
+            series.append(pending)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _pop_last_point(self):
+        """ Remove the last point, which can still be replaced by the points after it.  Returns the last point and the
+        count of the point before it, which are None if there is no such point. """
+        array_points = self._array_points
+        if array_points:
+            times, counts = array_points.pop()
+            last_point = (float(times[-1]), int(counts[-1]))
+            if len(times) >= 2:
+                array_points.append((times[:-1], counts[:-1]))
+                return last_point, int(counts[-2])
+            elif array_points:
+                return last_point, int(array_points[-1][1][-1])
+            elif self._data_series:
+                return last_point, self._data_series[-1][1]
+            else:
+                return last_point, None
+        series = self._data_series
+        if not series:
+            return None, None
+        last_point = series.pop()
+        return last_point, series[-1][1] if series else None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def extend_arrays(self, times, counts):
+        """ Append the points of the times and counts arrays in order.  The result is the same as extend(), but the
+        points are reduced with NumPy array operations, and they are kept as arrays (see data_series). """
+        if len(times) == 0:
+            return
+
+        # The last point can still be replaced by the new points, so it is reduced with them.
+        last_point, prev_c = self._pop_last_point()
+        if last_point is not None:
+            pt, pc = last_point
+            times = np.concatenate(([pt], times))
+            counts = np.concatenate(([pc], counts))
+
+        # Keep the last point at each time.
+        keep = np.ones(len(times), dtype=bool)
+        keep[:-1] = times[1:] != times[:-1]
+        times, counts = times[keep], counts[keep]
+
+        # Keep the first point of each run of equal counts, and always keep the last point.
+        keep = np.ones(len(times), dtype=bool)
+        keep[1:] = counts[1:] != counts[:-1]
+        if prev_c is not None:
+            keep[0] = counts[0] != prev_c
+        keep[-1] = True
+        self._array_points.append((times[keep], np.asarray(counts[keep], dtype=np.int64)))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def extend_segments(series_list, times, counts, offsets):
+        """ Append the points of segment i of the flat times and counts arrays, times[offsets[i]:offsets[i + 1]], to
+        series i of the list.  The result is the same as extend_arrays() for each series, but the points of all of the
+        series are reduced together, so there are no array operations for each series. """
+        if not all(isinstance(series, TimeCountSeries) for series in series_list):
+            for series, start, stop in zip(series_list, offsets[:-1], offsets[1:]):
+                series.extend_arrays(times[start:stop], counts[start:stop])
+            return
+        num_series = len(series_list)
+        sizes = np.diff(offsets)
+
+        # The last point of a series can still be replaced by the new points, so it is reduced with them.
+        has_last = np.zeros(num_series, dtype=bool)
+        has_prev = np.zeros(num_series, dtype=bool)
+        last_point = np.zeros((num_series, 2))
+        prev_c = np.zeros(num_series, dtype=np.int64)
+        for index, series in enumerate(series_list):
+            if sizes[index]:
+                series_last_point, series_prev_c = series._pop_last_point()
+                if series_last_point is not None:
+                    has_last[index] = True
+                    last_point[index] = series_last_point
+                    if series_prev_c is not None:
+                        has_prev[index] = True
+                        prev_c[index] = series_prev_c
+        new_offsets = offsets + np.concatenate(([0], np.cumsum(has_last)))
+        segment = np.repeat(np.arange(num_series), np.diff(new_offsets))
+        last_position = new_offsets[:-1][has_last]
+        is_new = np.ones(new_offsets[-1], dtype=bool)
+        is_new[last_position] = False
+        all_times = np.empty(new_offsets[-1])
+        all_times[last_position] = last_point[has_last, 0]
+        all_times[is_new] = times
+        all_counts = np.empty(new_offsets[-1], dtype=np.int64)
+        all_counts[last_position] = last_point[has_last, 1]
+        all_counts[is_new] = counts
+
+        # Keep the last point at each time.
+        keep = np.ones(len(all_times), dtype=bool)
+        keep[:-1] = (all_times[1:] != all_times[:-1]) | (segment[1:] != segment[:-1])
+        all_times, all_counts, segment = all_times[keep], all_counts[keep], segment[keep]
+
+        # Keep the first point of each run of equal counts, and always keep the last point of each series.
+        is_first = np.ones(len(segment), dtype=bool)
+        is_first[1:] = segment[1:] != segment[:-1]
+        is_last = np.ones(len(segment), dtype=bool)
+        is_last[:-1] = is_first[1:]
+        keep = np.ones(len(segment), dtype=bool)
+        keep[1:] = all_counts[1:] != all_counts[:-1]
+        keep[is_first] = ~has_prev[segment[is_first]] | (all_counts[is_first] != prev_c[segment[is_first]])
+        keep |= is_last
+        all_times, all_counts = all_times[keep], all_counts[keep]
+        reduced_offsets = np.zeros(num_series + 1, dtype=np.int64)
+        np.cumsum(np.bincount(segment[keep], minlength=num_series), out=reduced_offsets[1:])
+
+        for index, series in enumerate(series_list):
+            begin, end = reduced_offsets[index], reduced_offsets[index + 1]
+            if end > begin:
+                series._array_points.append((all_times[begin:end], all_counts[begin:end]))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_arrays(self):
+        """ Get the points as a times array and a counts array. """
+        series = self._data_series
+        points = np.fromiter(chain.from_iterable(series), dtype=np.float64, count=2 * len(series)).reshape(-1, 2)
+        if not self._array_points:
+            return points[:, 0], points[:, 1].astype(np.int64)
+        return (np.concatenate([points[:, 0]] + [times for times, _ in self._array_points]),
+                np.concatenate([points[:, 1].astype(np.int64)] + [counts for _, counts in self._array_points]))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def cumulative_integral(self, times):
+        """ Get the integral of the counts from the first point up to each of the times.  The count of the last point
+        continues after it. """
+        series_times, series_counts = self.to_arrays()
+        times = np.asarray(times, dtype=np.float64)
+        if len(series_times) == 0:
+            return np.zeros(len(times))
+        areas = np.zeros(len(series_times))
+        np.cumsum(series_counts[:-1] * np.diff(series_times), out=areas[1:])
+        index = np.maximum(np.searchsorted(series_times, times, side="right") - 1, 0)
+        return np.where(times > series_times[0], areas[index] + series_counts[index] * (times - series_times[index]), 0)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def integral(self, t):
+        """ Get the integral of the counts from the first point up to time t, which is not before the last point.  Only
+        the last point can still be replaced, so the integral up to the second to last point is kept and each call only
+        integrates the points added since the previous call. """
+        series = self.data_series
+        if not series:
+            return 0.0
+        index, area = self._integral_state
+        last_index = len(series) - 1
+        points = list(islice(reversed(series), last_index - index + 1))
+        points.reverse()
+        for (pt, pc), (nt, _) in zip(points[:-2], points[1:-1]):
+            area += pc * (nt - pt)
+        self._integral_state = (max(index, last_index - 1), area)
+        if len(points) >= 2:
+            (pt, pc), (nt, _) = points[-2:]
+            area += pc * (nt - pt)
+        pt, pc = points[-1]
+        return area + pc * (t - pt)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def truncate(self, t):
+        """ Discard the points before time t.  The series then starts at time t with the count at that time. """
+        series = self.data_series
+        if not series or series[0][0] >= t:
+            return
+        times, _ = self.to_arrays()
+        index = int(np.searchsorted(times, t, side="right")) - 1
+        c = series[index][1]
+        points = list(islice(series, index + 1, None))
+
+        # The points after t are already reduced.  The first one is redundant if it has the same count, unless it is
+        # the last point.
+        if len(points) >= 2 and points[0][1] == c:
+            del points[0]
+        series.clear()
+        series.append((t, c))
+        series.extend(points)
+        self._integral_state = (0, 0.0)
 
     # ------------------------------------------------------------------------------------------------------------------
     @staticmethod
@@ -283,43 +582,571 @@ class TimeCountSeries:
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-class DataArray(list):
+class OnlineTimeCountSeries:
+    """ Time count series that updates its statistics as the points are appended instead of storing the points.  The
+    memory is constant in the number of points.  The points are reduced the same way as TimeCountSeries.append(), and
+    the integrals are accumulated over the same segments in the same order, so the mean, var, std, and histogram are
+    the same as TimeCountSeries for the same points.  A moment with a statefunc is calculated from the histogram,
+    which is the same up to floating point rounding.
+
+    cov() needs the integral of the product with the other series, which is only accumulated for the series set up
+    with track_product(). """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, data_series=None):
+        # First time, and the last two points of the reduced series.  Only the last point can still be replaced.
+        self.t_first = None
+        self.last_points = []
+
+        # Integrals over the segments before the last two points.
+        self.integral_1 = 0.0
+        self.integral_2 = 0.0
+        self.histogram_dict = defaultdict(int)
+        self.max_c = 0
+
+        # Products with other series as (other series, product, side).  The other series is kept instead of its id so
+        # that the series can be pickled.
+        self.products = []
+
+        if data_series is not None:
+            self.extend(TimeCountSeries._get_data_series(data_series, _make_iter=True))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _add_segment(self, t, nt, c):
+        dt = nt - t
+        self.integral_1 += c**1 * dt
+        self.integral_2 += c**2 * dt
+        self.histogram_dict[c] += dt
+        if c > self.max_c:
+            self.max_c = c
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def append(self, t, c):
+        last_points = self.last_points
+        if len(last_points) <= 1:
+            if len(last_points) == 1:
+                pt, pc = last_points[-1]
+                if pt == t:
+                    del last_points[-1]
+            else:
+                self.t_first = t
+        else:
+            ppt, ppc = last_points[-2]
+            pt, pc = last_points[-1]
+            if pt == t or pc == ppc:
+                del last_points[-1]
+            else:
+                # The second to last point is final, so its segment is added to the integrals.
+                self._add_segment(ppt, pt, ppc)
+                del last_points[0]
+        last_points.append((t, c))
+
+        for _, product, side in self.products:
+            product.add(side, t, c)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def extend(self, data_series):
+        """ Append each (t, c) point of the data series in order. """
+        for t, c in data_series:
+            self.append(t, c)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def extend_arrays(self, times, counts):
+        """ Append the points of the times and counts arrays in order. """
+        self.extend(zip(times.tolist(), counts.tolist()))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def track_product(self, other):
+        """ Accumulate the integral of the product of this series and the other series, which cov() needs.  Both series
+        must be empty. """
+        if self.last_points or other.last_points:
+            raise ValueError("The product can only be tracked from the start of the series.")
+        product = TimeCountProduct()
+        self.products.append((other, product, 0))
+        other.products.append((self, product, 1))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def copy(self):
+        result = self.__class__()
+        result.t_first = self.t_first
+        result.last_points = list(self.last_points)
+        result.integral_1 = self.integral_1
+        result.integral_2 = self.integral_2
+        result.histogram_dict = defaultdict(int, self.histogram_dict)
+        result.max_c = self.max_c
+        return result
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _totals(self):
+        """ Get the integrals including the last segment, and the total time. """
+        integral_1 = self.integral_1
+        integral_2 = self.integral_2
+        if len(self.last_points) == 2:
+            (t, c), (nt, _) = self.last_points
+            integral_1 += c**1 * (nt - t)
+            integral_2 += c**2 * (nt - t)
+        total = self.last_points[-1][0] - self.t_first if self.last_points else 0
+        return integral_1, integral_2, total
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def integral(self, t):
+        """ Get the integral of the counts from the first point up to time t, which is not before the last point. """
+        if not self.last_points:
+            return 0.0
+        integral_1, _, _ = self._totals()
+        pt, pc = self.last_points[-1]
+        return integral_1 + pc * (t - pt)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def moment(self, moment=1, statefunc=None):
+        if not self.last_points:
+            return 0.0
+        if statefunc is None and moment in (1, 2):
+            integral_1, integral_2, total = self._totals()
+            result = integral_1 if moment == 1 else integral_2
+        else:
+            if statefunc is None:
+                statefunc = lambda c: c
+            histogram = self.histogram()
+            result = 0.0
+            for c, duration in enumerate(histogram):
+                result += statefunc(c)**moment * duration
+            total = self.last_points[-1][0] - self.t_first
+
+        if total == 0:
+            return np.nan
+        else:
+            return result / total
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mean(self, statefunc=None):
+        return self.moment(moment=1, statefunc=statefunc)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def var(self, statefunc=None):
+        E1 = self.moment(moment=1, statefunc=statefunc)
+        E2 = self.moment(moment=2, statefunc=statefunc)
+        return E2 - E1**2
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def std(self, statefunc=None):
+        return math.sqrt(self.var(statefunc=statefunc))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def cov(self, other):
+        for series, product, _ in self.products:
+            if series is other:
+                break
+        else:
+            raise ValueError("The product with the other series is not tracked.  Call track_product() first.")
+
+        EX = self.moment(moment=1)
+        EY = other.moment(moment=1)
+        EXY = product.series().moment(moment=1)
+
+        # cov[X,Y] = E[(X-ux)(Y-uy)] = E[XY] - ux*uy
+        return EXY - EX*EY
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def histogram(self, normalize=False):
+        """ Calculate the histogram of the counts.
+        Returns a list where the index into the list is the count and the
+        list elements are the cumulative time for each count.
+        """
+        histogram_dict = self.histogram_dict
+        max_c = self.max_c
+        if len(self.last_points) == 2:
+            (t, c), (nt, _) = self.last_points
+            histogram_dict = defaultdict(int, histogram_dict)
+            histogram_dict[c] += nt - t
+            max_c = max(max_c, c)
+
+        # Calculate histogram as list.
+        histogram = [histogram_dict[n] for n in range(max_c + 1)]
+
+        # Normalize the histogram if necessary.
+        if normalize:
+            # Check for errors caused by empty data or zero time.
+            total = self.last_points[-1][0] - self.t_first if self.last_points else 0
+            if total == 0:
+                raise ValueError("Data series is empty or has zero time. Cannot normalize histogram data.")
+
+            # Do normalization.
+            histogram = [value / total for value in histogram]
+
+        # Return the histogram result.
+        return histogram
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class TimeCountProduct:
+    """ Product of two online time count series.  The points of the two series arrive separately, so they are held
+    until the time is known for both series, and then they are merged in time order into the product series. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self):
+        self.pending = (deque(), deque())
+        self.counts = [None, None]
+        self.last_times = [None, None]
+        self.product_series = OnlineTimeCountSeries()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def add(self, side, t, c):
+        pending = self.pending
+        counts = self.counts
+        other_last_time = self.last_times[1 - side]
+        self.last_times[side] = t
+        if other_last_time is None:
+            pending[side].append((t, c))
+        elif t <= other_last_time and not pending[0] and not pending[1]:
+            # The point is already known for both series, so it is merged directly.
+            counts[side] = c
+            if counts[1 - side] is not None:
+                self.product_series.append(t, counts[0] * counts[1])
+        else:
+            pending[side].append((t, c))
+            self._merge(self.product_series, pending, counts, min(t, other_last_time))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _merge(product_series, pending, counts, until):
+        """ Merge the pending points up to and including the until time into the product series.  A later point at the
+        until time replaces the product point at that time. """
+        left, right = pending
+        while True:
+            if left and (not right or left[0][0] <= right[0][0]):
+                t = left[0][0]
+            elif right:
+                t = right[0][0]
+            else:
+                return
+            if t > until:
+                return
+            while left and left[0][0] == t:
+                counts[0] = left.popleft()[1]
+            while right and right[0][0] == t:
+                counts[1] = right.popleft()[1]
+            if counts[0] is not None and counts[1] is not None:
+                product_series.append(t, counts[0] * counts[1])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def series(self):
+        """ Get the product series including all of the pending points. """
+        if not self.pending[0] and not self.pending[1]:
+            return self.product_series
+        product_series = self.product_series.copy()
+        self._merge(product_series, tuple(deque(points) for points in self.pending), list(self.counts), inf)
+        return product_series
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class DataArray(array.array):
+    """ Array of data values in a compact growable buffer.  The values are stored as C doubles by default, and the
+    reductions are calculated with NumPy on a view of the buffer. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __new__(cls, data=(), typecode="d"):
+        return super().__new__(cls, typecode, data)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __reduce_ex__(self, protocol):
+        # The array pickling calls the constructor with the array arguments, which are in a different order here.
+        return self.__class__, (self.tobytes(), self.typecode)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def extend(self, data):
+        """ Append the values.  A NumPy array is appended as a block of bytes instead of one value at a time. """
+        if isinstance(data, np.ndarray):
+            self.frombytes(np.ascontiguousarray(data, dtype=self.typecode).tobytes())
+        else:
+            super().extend(data)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def as_ndarray(self):
+        """ Get a NumPy view of the values.  The view must not be kept while values are added. """
+        return np.frombuffer(self, dtype=self.typecode)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def sum(self):
+        return float(np.sum(self.as_ndarray()))
+
     # ------------------------------------------------------------------------------------------------------------------
     def mean(self):
         if len(self) >= 1:
-            return statistics.mean(self)
+            return float(np.mean(self.as_ndarray()))
         else:
             return nan
 
     # ------------------------------------------------------------------------------------------------------------------
     def var(self):
         if len(self) >= 2:
-            return statistics.variance(self)
+            return float(np.var(self.as_ndarray(), ddof=1))
         else:
             return nan
 
     # ------------------------------------------------------------------------------------------------------------------
     def std(self):
         if len(self) >= 2:
-            return statistics.stdev(self)
+            return math.sqrt(self.var())
         else:
             return nan
 
     # ------------------------------------------------------------------------------------------------------------------
     def sdom(self):
         if len(self) >= 2:
-            return statistics.stdev(self) / math.sqrt(len(self))
+            return self.std() / math.sqrt(len(self))
         else:
             return nan
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def cov(self, other):
+        return cov(self.as_ndarray(), other.as_ndarray())
+
     # ------------------------------------------------------------------------------------------------------------------
     def cdf(self):
-        data_array = np.array(self)
+        data_array = np.array(self.as_ndarray(), dtype=np.float64)
         data_array.sort()
         probability = np.linspace(0, 1, data_array.size)
         return data_array, probability
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+class OnlineDataArray:
+    """ Data array that updates the moments of the values as they are added instead of storing them (Welford's
+    algorithm).  A block of values from extend() is combined with the parallel form of the algorithm.  The results
+    are the same as DataArray up to floating point rounding.
+
+    cov() needs the co-moment with the other data array, which is only accumulated for the data arrays set up with
+    track_comoment(). """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, data=()):
+        self.count = 0
+        self._mean = 0.0
+        self.m2 = 0.0
+        self.comoments = []
+        self.extend(data)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __len__(self):
+        return self.count
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def append(self, value):
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self.m2 += delta * (value - self._mean)
+
+        for _, comoment, side in self.comoments:
+            comoment.add(side, (value,))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def extend(self, data):
+        values = np.asarray(data, dtype=np.float64)
+        if values.size == 0:
+            return
+        if values.size == 1:
+            self.append(float(values[0]))
+            return
+
+        # Combine the moments of the block with the moments so far.
+        count_b = values.size
+        mean_b = float(np.mean(values))
+        m2_b = float(np.sum((values - mean_b)**2))
+        count = self.count + count_b
+        delta = mean_b - self._mean
+        self._mean += delta * count_b / count
+        self.m2 += m2_b + delta**2 * self.count * count_b / count
+        self.count = count
+
+        for _, comoment, side in self.comoments:
+            comoment.add(side, values)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def track_comoment(self, other):
+        """ Accumulate the co-moment of this data array and the other data array, which cov() needs.  The values of the
+        two data arrays are paired in the order they are added.  Both data arrays must be empty. """
+        if self.count or other.count:
+            raise ValueError("The co-moment can only be tracked from the start of the data arrays.")
+        comoment = DataComoment()
+        self.comoments.append((other, comoment, 0))
+        other.comoments.append((self, comoment, 1))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def sum(self):
+        return self._mean * self.count
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mean(self):
+        if self.count >= 1:
+            return self._mean
+        else:
+            return nan
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def var(self):
+        if self.count >= 2:
+            return self.m2 / (self.count - 1)
+        else:
+            return nan
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def std(self):
+        if self.count >= 2:
+            return math.sqrt(self.var())
+        else:
+            return nan
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def sdom(self):
+        if self.count >= 2:
+            return self.std() / math.sqrt(self.count)
+        else:
+            return nan
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def cov(self, other):
+        for data_array, comoment, _ in self.comoments:
+            if data_array is other:
+                break
+        else:
+            raise ValueError("The co-moment with the other data array is not tracked.  Call track_comoment() first.")
+        return comoment.cov()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class DataComoment:
+    """ Co-moment of two online data arrays.  The values of the two data arrays arrive separately, so the values of
+    one data array are held until the paired values of the other data array arrive. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self):
+        self.pending = ([], [])
+        self.count = 0
+        self.means = [0.0, 0.0]
+        self.c2 = 0.0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def add(self, side, values):
+        pending = self.pending
+        pending[side].extend(values)
+        num_pairs = min(len(pending[0]), len(pending[1]))
+        if num_pairs == 0:
+            return
+
+        x, y = pending[0][:num_pairs], pending[1][:num_pairs]
+        del pending[0][:num_pairs], pending[1][:num_pairs]
+        mean_x, mean_y = self.means
+        if num_pairs == 1:
+            self.count += 1
+            delta_x = x[0] - mean_x
+            mean_x += delta_x / self.count
+            mean_y += (y[0] - mean_y) / self.count
+            self.c2 += delta_x * (y[0] - mean_y)
+        else:
+            # Combine the co-moment of the block with the co-moment so far.
+            x, y = np.array(x, dtype=np.float64), np.array(y, dtype=np.float64)
+            mean_x_b, mean_y_b = float(np.mean(x)), float(np.mean(y))
+            c2_b = float(np.sum((x - mean_x_b) * (y - mean_y_b)))
+            count = self.count + num_pairs
+            delta_x, delta_y = mean_x_b - mean_x, mean_y_b - mean_y
+            self.c2 += c2_b + delta_x * delta_y * self.count * num_pairs / count
+            mean_x += delta_x * num_pairs / count
+            mean_y += delta_y * num_pairs / count
+            self.count = count
+        self.means = [mean_x, mean_y]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def cov(self):
+        if self.count >= 2:
+            return self.c2 / (self.count - 1)
+        else:
+            return nan
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class BatchMeans:
+    """ Batch means confidence interval of a steady-state mean for a sequential stopping rule.  The run is observed in
+    chunks, and each chunk adds the total and the weight of its observations, for example the sum and the number of the
+    job wait times.  The chunks are grouped into batches whose means are the ratio of the totals to the weights.  When
+    there are 2 * min_batches batches, the adjacent batches are merged in pairs, so the number of batches stays between
+    min_batches and 2 * min_batches while the batch size grows with the run, which keeps the batch means close to
+    independent.  The chunks of the last batch are not used until the batch is full. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, min_batches=10, confidence=0.95):
+        if min_batches < 2:
+            raise ValueError("min_batches = %s" % repr(min_batches))
+        self.min_batches = min_batches
+        self.confidence = confidence
+        self.chunks_per_batch = 1
+        self.num_chunks = 0
+        self.batch_totals = []
+        self.batch_weights = []
+        self.partial = [0.0, 0.0, 0]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def add(self, total, weight):
+        """ Add the total and the weight of the observations of a chunk. """
+        self.num_chunks += 1
+        partial = self.partial
+        partial[0] += total
+        partial[1] += weight
+        partial[2] += 1
+        if partial[2] < self.chunks_per_batch:
+            return
+        self.batch_totals.append(partial[0])
+        self.batch_weights.append(partial[1])
+        self.partial = [0.0, 0.0, 0]
+
+        if len(self.batch_totals) == 2 * self.min_batches:
+            self.batch_totals = [a + b for a, b in zip(self.batch_totals[0::2], self.batch_totals[1::2])]
+            self.batch_weights = [a + b for a, b in zip(self.batch_weights[0::2], self.batch_weights[1::2])]
+            self.chunks_per_batch *= 2
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def num_batches(self):
+        return len(self.batch_totals)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def batch_means(self):
+        totals = np.array(self.batch_totals, dtype=np.float64)
+        weights = np.array(self.batch_weights, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return totals / weights
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mean(self):
+        if self.num_batches >= 1:
+            return float(np.mean(self.batch_means()))
+        else:
+            return nan
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def half_width(self):
+        """ Get the half-width of the confidence interval of the mean.  It is inf until there are min_batches
+        batches. """
+        num_batches = self.num_batches
+        if num_batches < self.min_batches:
+            return inf
+        t = student_t_quantile(0.5 + self.confidence / 2, num_batches - 1)
+        return t * float(np.std(self.batch_means(), ddof=1)) / math.sqrt(num_batches)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def relative_half_width(self):
+        """ Get the half-width of the confidence interval relative to the mean.  It is 0 when all of the batch means
+        are the same, including a mean of 0. """
+        half_width = self.half_width()
+        if half_width == 0:
+            return 0.0
+        mean = abs(self.mean())
+        if mean == 0:
+            return inf
+        return half_width / mean
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 class BusyPeriodData:
     # ------------------------------------------------------------------------------------------------------------------
@@ -327,7 +1154,7 @@ class BusyPeriodData:
         # Create stats objects.
         self.start = DataArray()
         self.duration = DataArray()
-        self.num_jobs = DataArray()
+        self.num_jobs = DataArray(typecode="q")
 
     # ------------------------------------------------------------------------------------------------------------------
     def append(self, start, duration, num_jobs):
@@ -336,6 +1163,20 @@ class BusyPeriodData:
         self.duration.append(duration)
         self.num_jobs.append(num_jobs)
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def extend(self, start, duration, num_jobs):
+        self.start.extend(start)
+        self.duration.extend(duration)
+        self.num_jobs.extend(num_jobs)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def truncate(self, t):
+        """ Discard the busy periods that end before time t. """
+        num_discarded = np.count_nonzero(self.start.as_ndarray() + self.duration.as_ndarray() < t)
+        del self.start[:num_discarded]
+        del self.duration[:num_discarded]
+        del self.num_jobs[:num_discarded]
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 class IdlePeriodData:
@@ -351,24 +1192,84 @@ class IdlePeriodData:
         self.start.append(start)
         self.duration.append(duration)
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def extend(self, start, duration):
+        self.start.extend(start)
+        self.duration.extend(duration)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def truncate(self, t):
+        """ Discard the idle periods that end before time t. """
+        num_discarded = np.count_nonzero(self.start.as_ndarray() + self.duration.as_ndarray() < t)
+        del self.start[:num_discarded]
+        del self.duration[:num_discarded]
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 class QueueStats:
     # ------------------------------------------------------------------------------------------------------------------
-    def __init__(self):
+    def __init__(self, online=False):
+        """
+        online selects OnlineTimeCountSeries for the jobs_waiting, jobs_receiving_service, and jobs_in_system
+        statistics and OnlineDataArray for the job_wait_time, job_service_time, and job_response_time statistics, which
+        do not store the points.  The busy and idle periods are still stored.
+        """
+
         # Create stats objects.
-        self.jobs_waiting = TimeCountSeries()
-        self.jobs_receiving_service = TimeCountSeries()
-        self.jobs_in_system = TimeCountSeries()
+        if online:
+            self.jobs_waiting = OnlineTimeCountSeries()
+            self.jobs_receiving_service = OnlineTimeCountSeries()
+            self.jobs_in_system = OnlineTimeCountSeries()
+            self.jobs_waiting.track_product(self.jobs_receiving_service)
+        else:
+            self.jobs_waiting = TimeCountSeries()
+            self.jobs_receiving_service = TimeCountSeries()
+            self.jobs_in_system = TimeCountSeries()
         self.busy_period = BusyPeriodData()
         self.idle_period = IdlePeriodData()
-        self.job_wait_time = DataArray()
-        self.job_service_time = DataArray()
-        self.job_response_time = DataArray()
+        if online:
+            self.job_wait_time = OnlineDataArray()
+            self.job_service_time = OnlineDataArray()
+            self.job_response_time = OnlineDataArray()
+            self.job_wait_time.track_comoment(self.job_service_time)
+        else:
+            self.job_wait_time = DataArray()
+            self.job_service_time = DataArray()
+            self.job_response_time = DataArray()
         self.total_arrivals = 0
         self.total_departures = 0
         self.total_time = 0
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def truncate(self, t, num_arrivals, num_departures):
+        """ Discard the statistics before time t, where num_arrivals and num_departures are the number of arrivals and
+        departures before time t.  The job times are discarded for the jobs that departed before time t. """
+        if isinstance(self.jobs_waiting, OnlineTimeCountSeries) or isinstance(self.job_wait_time, OnlineDataArray):
+            raise QueueingSystemError("Online statistics cannot be truncated.")
+        self.jobs_waiting.truncate(t)
+        self.jobs_receiving_service.truncate(t)
+        self.jobs_in_system.truncate(t)
+        self.busy_period.truncate(t)
+        self.idle_period.truncate(t)
+        del self.job_wait_time[:num_departures]
+        del self.job_service_time[:num_departures]
+        del self.job_response_time[:num_departures]
+        self.total_arrivals -= num_arrivals
+        self.total_departures -= num_departures
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def buffer_size(self):
+        """ Get the number of stored entries, which are the points of the stored series, the job times, and the busy and
+        idle periods.  This is the part of the statistics that grows with the length of a run. """
+        size = len(self.busy_period.start) + len(self.idle_period.start)
+        for series in (self.jobs_waiting, self.jobs_receiving_service, self.jobs_in_system):
+            if isinstance(series, TimeCountSeries):
+                size += series.num_points()
+        for data in (self.job_wait_time, self.job_service_time, self.job_response_time):
+            if isinstance(data, DataArray):
+                size += len(data)
+        return size
+
     # ------------------------------------------------------------------------------------------------------------------
     def P_jobs_waiting(self, cond):
         """ Calculate mean P[cond(jobs_waiting)].
@@ -421,6 +1322,40 @@ class QueueStats:
     def mean_p0(self):
         return self.P_jobs_in_system(cond=lambda X: X == 0)
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def count_statistics(self):
+        """ Calculate the statistics of the jobs_waiting, jobs_receiving_service, and jobs_in_system series that a
+        simulation result reports.  Each stored series is converted to arrays once, and the statistics are calculated
+        with array operations, which is much faster than calling mean(), std(), histogram(), and cov() separately.
+        The results are the same up to floating point rounding.  Returns a dict of the statistics. """
+        series = (self.jobs_waiting, self.jobs_receiving_service, self.jobs_in_system)
+        if not all(isinstance(s, TimeCountSeries) and s.num_points() >= 2 for s in series):
+            return {
+                "mean_jobs_waiting": self.jobs_waiting.mean(),
+                "std_jobs_waiting": self.jobs_waiting.std(),
+                "histogram_jobs_waiting": self.jobs_waiting.histogram(),
+                "mean_jobs_receiving_service": self.jobs_receiving_service.mean(),
+                "std_jobs_receiving_service": self.jobs_receiving_service.std(),
+                "mean_jobs_in_system": self.jobs_in_system.mean(),
+                "std_jobs_in_system": self.jobs_in_system.std(),
+                "cov_jobs_waiting_and_jobs_receiving_service": self.cov_jobs_waiting_and_jobs_receiving_service(),
+            }
+
+        jobs_waiting, jobs_receiving_service, jobs_in_system = (s.to_arrays() for s in series)
+        mean_jobs_waiting, std_jobs_waiting, histogram_jobs_waiting = time_weighted_statistics(*jobs_waiting)
+        mean_jobs_receiving_service, std_jobs_receiving_service, _ = time_weighted_statistics(*jobs_receiving_service)
+        mean_jobs_in_system, std_jobs_in_system, _ = time_weighted_statistics(*jobs_in_system)
+        return {
+            "mean_jobs_waiting": mean_jobs_waiting,
+            "std_jobs_waiting": std_jobs_waiting,
+            "histogram_jobs_waiting": histogram_jobs_waiting,
+            "mean_jobs_receiving_service": mean_jobs_receiving_service,
+            "std_jobs_receiving_service": std_jobs_receiving_service,
+            "mean_jobs_in_system": mean_jobs_in_system,
+            "std_jobs_in_system": std_jobs_in_system,
+            "cov_jobs_waiting_and_jobs_receiving_service": time_weighted_cov(*jobs_waiting, *jobs_receiving_service),
+        }
+
     # ------------------------------------------------------------------------------------------------------------------
     def cov_jobs_waiting_and_jobs_receiving_service(self):
         jobs_waiting_stats = self.jobs_waiting
@@ -460,9 +1395,7 @@ class QueueStats:
 
     # ------------------------------------------------------------------------------------------------------------------
     def cov_job_wait_time_and_job_service_time(self):
-        job_wait_time = np.array(self.job_wait_time)
-        job_service_time = np.array(self.job_service_time)
-        return cov(job_wait_time, job_service_time)
+        return self.job_wait_time.cov(self.job_service_time)
 
     # ------------------------------------------------------------------------------------------------------------------
     def print(self, title=None, job_unit="jobs", time_unit="time unit", indent=3, step_indent=3, width=37, file=sys.stdout):
@@ -507,6 +1440,47 @@ class QueueStats:
 # ######################################################################################################################
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+class FCFSJobQueue(deque):
+    """ Job queue of the FCFS service discipline.  A job arrives with appendleft(job), and get_next_job() removes and
+    returns the job to serve next, which for FCFS is the oldest job at the right end. """
+
+    get_next_job = deque.pop
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class LCFSJobQueue(deque):
+    """ Job queue of the LCFS service discipline.  The job to serve next is the newest job at the left end. """
+
+    get_next_job = deque.popleft
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class SIROJobQueue(list):
+    """ Job queue of the SIRO service discipline.  The jobs are kept in a list in no particular order.  The job to
+    serve next is picked at random and swapped with the last job, which is then popped, so a job is picked and removed
+    in constant time instead of deleting it from the middle of a deque. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, jobs=(), random_class=None):
+        super().__init__(jobs)
+        self.random_class = random_class
+
+    # The order of the jobs does not matter, so a job arrives at the end of the list.
+    appendleft = list.append
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def get_next_job(self):
+        index = self.random_class.randrange(len(self))
+        job = self[index]
+        self[index] = self[-1]
+        self.pop()
+        return job
+
+
+# ######################################################################################################################
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 class QueueingSystemError(Exception): pass
 
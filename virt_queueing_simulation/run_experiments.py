@@ -10,6 +10,10 @@ import virt_queueing_model as qm
 import virt_queueing_simulation as qs
 
 ServiceDiscipline = qs.QueueingSystem.ServiceDiscipline
+Scheduler = qs.QueueingSystem.Scheduler
+StoppingMetric = qs.QueueingSystemSimulation.StoppingMetric
+Profile = qs.QueueingSystemSimulationBatch.Profile
+ArrivalSubstreams = qs.QueueingSystemSimulationBatch.ArrivalSubstreams
 
 SHOW_PLOTS = False
 
@@ -24,6 +28,45 @@ def main_experiments(skip_csv_headers=False):
     # Max workers.
     max_workers = None
 
+    # Simulation engine.  The vectorized engine gives the same results as the simpy engine for FCFS.
+    engine = qs.QueueingSystemSimulation.Engine.VECTORIZED
+
+    # Service discipline of the input queues.  The vectorized engine only supports FCFS.
+    service_discipline = ServiceDiscipline.FCFS
+
+    # Scheduler of the real server.  The work-conserving RR_SKIP and MOST_FULL schedulers need the SIMPY engine and
+    # experiments with S = 0 and Rs = 1.
+    scheduler = Scheduler.ROUND_ROBIN
+
+    # Warmup mode.  FIXED discards the first 100 clocks, and MSER5 chooses the warmup of each run from its output.
+    warmup = qs.QueueingSystemSimulation.Warmup.FIXED
+
+    # Online statistics of the queue counts.  True accumulates them online instead of storing their change points, which
+    # keeps the memory of the long runs constant.  The MSER5 warmup needs the stored statistics (False).
+    online_stats = False
+
+    # Checkpoint directory.  The runs save their state there every checkpoint_interval_clocks, so that the batch can be
+    # run again after it was killed and the runs continue where they were.  None disables the checkpoints.
+    checkpoint_dir = None
+    checkpoint_interval_clocks = 1000000
+
+    # Arrival trace cache directory.  The arrival times of each distribution, N, lambda, and replication are generated
+    # once and replayed from the memory mapped trace by every Rs of the sweep.  None generates them in each run.
+    arrival_trace_dir = "MG1_sim.arrival_traces"
+
+    # Profile of one run.  CPROFILE or TRACEMALLOC profiles the run with the detail index profile_detail_index and saves
+    # the profile next to the detail file.  None disables it.
+    profile = None
+    profile_detail_index = 0
+
+    # MT19937 substreams of the arrival times.  SHARED draws the streams of a replication from one substream one at a
+    # time, as the earlier versions did, and PER_STREAM draws each stream from its own substream in blocks.
+    arrival_substreams = ArrivalSubstreams.SHARED
+
+    # Progress report interval of the batch in seconds of wall-clock time.  The batch prints the number of runs that are
+    # done and in flight, the simulated clocks per second, and the estimated time remaining.  None disables it.
+    progress_interval = 60
+
     # Result file parameters.
     result_file_prefix = "MG1_sim"
     result_file_open_mode = "a"
@@ -38,6 +81,17 @@ def main_experiments(skip_csv_headers=False):
         f_clk = 1
         t_clk = 1 / f_clk
 
+        # Sequential stopping rule.  With a relative half-width target (for example 0.01), each run stops as soon as
+        # the batch means confidence interval of the mean wait time is that tight, and sim_clocks is the maximum number
+        # of clocks.  None runs every experiment for sim_clocks.
+        precision_rel_half_width = None
+        precision_chunk_clocks = 10000
+        if precision_rel_half_width is None:
+            precision = None
+        else:
+            precision = qs.QueueingSystemSimulation.PrecisionTarget(
+                StoppingMetric.MEAN_JOB_WAIT_TIME, precision_rel_half_width, precision_chunk_clocks * t_clk)
+
         # Define the distributions of interest.
         distributions = OrderedDict([
             ("M at Sigma", "M"),
@@ -71,12 +125,20 @@ def main_experiments(skip_csv_headers=False):
                             A_dist,
                             lambd,
                             sim_clocks,
+                            precision,
                         )
 
     # Create batch simulator class instance.
     batch_sim = qs.QueueingSystemSimulationBatch(detail_csv_file, summary_csv_file, max_workers=max_workers,
                                                  skip_csv_headers=skip_csv_headers,
-                                                 csv_file_open_mode=result_file_open_mode)
+                                                 csv_file_open_mode=result_file_open_mode, engine=engine,
+                                                 warmup=warmup, checkpoint_dir=checkpoint_dir,
+                                                 checkpoint_interval_clocks=checkpoint_interval_clocks,
+                                                 arrival_trace_dir=arrival_trace_dir, SD=service_discipline,
+                                                 scheduler=scheduler, profile=profile,
+                                                 profile_detail_index=profile_detail_index,
+                                                 progress_interval=progress_interval,
+                                                 arrival_substreams=arrival_substreams, online_stats=online_stats)
 
     # Run the batch simulations.
     batch_sim.run(generate_parameters())
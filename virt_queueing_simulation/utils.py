@@ -54,6 +54,59 @@ def guard(func, value):
         return value
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def format_duration(seconds):
+    """ Format a duration in seconds as H:MM:SS, or "-" if it is not known (nan or infinite). """
+    if not 0 <= seconds < float("inf"):
+        return "-"
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def reset_peak_rss():
+    """ Reset the peak resident set size of this process to its current size, so that peak_rss() is the peak from now
+    on.  This is only possible on Linux, and elsewhere the peak stays the peak of the whole process.  Returns whether it
+    was reset. """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def peak_rss():
+    """ Get the peak resident set size of this process in bytes, or nan if it is not available. """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        pass
+    else:
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    try:
+        import psutil
+    except ImportError:
+        return float("nan")
+    return getattr(psutil.Process().memory_info(), "peak_wset", float("nan"))
+
+
 # ######################################################################################################################
 
 
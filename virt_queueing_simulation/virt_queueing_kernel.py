@@ -0,0 +1,205 @@
+""" Virtualized hardware queueing simulation kernel
+
+The functions in this module simulate discrete-slot queues with NumPy array operations instead of a Python loop per
+event.  A discrete-slot queue serves at most one job in each of its service slots, and the slot times are given, which is
+what a virtual queue of the round-robin C-slow schedule is once its slot times are known.
+
+Many queues (streams and replications) are simulated at once by concatenating their arrays into one flat array with an
+offsets array, where segment i is flat[offsets[i]:offsets[i + 1]].  The offsets can be omitted for a single queue.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+inf = float('inf')
+nan = float('nan')
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def concatenate_segments(arrays, dtype=np.float64):
+    """ Concatenate the arrays into a flat array.  Returns the flat array and the segment offsets. """
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(array) for array in arrays], out=offsets[1:])
+    if offsets[-1] == 0:
+        return np.empty(0, dtype=dtype), offsets
+    return np.concatenate(arrays).astype(dtype, copy=False), offsets
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def split_segments(flat, offsets):
+    """ Split a flat array into a list of the segment arrays. """
+    return np.split(flat, offsets[1:-1])
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def single_segment_offsets(array):
+    return np.array([0, len(array)], dtype=np.int64)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def segment_ids(offsets):
+    """ Get the segment index of each element of the flat array. """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def segment_local_index(offsets):
+    """ Get the index of each element of the flat array within its segment. """
+    return np.arange(offsets[-1]) - np.repeat(offsets[:-1], np.diff(offsets))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def segmented_maximum_accumulate(values, offsets):
+    """ Cumulative maximum of integer values that restarts at each segment. """
+    values = np.asarray(values, dtype=np.int64)
+    if values.size == 0:
+        return values.copy()
+
+    # Shift each segment above the previous one so the cumulative maximum never crosses a segment boundary.
+    shift = segment_ids(offsets) * (int(values.max()) - int(values.min()) + 1)
+    return np.maximum.accumulate(values + shift) - shift
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def segmented_searchsorted(values, value_offsets, keys, key_offsets, side="left"):
+    """ Find the index of each key within the sorted values of its own segment, which is np.searchsorted() applied
+    to each segment.  There is one search per segment, which is much faster than sorting the values and keys of all of
+    the segments together. """
+    result = np.empty(len(keys), dtype=np.int64)
+    for segment in range(len(key_offsets) - 1):
+        key_begin, key_end = key_offsets[segment], key_offsets[segment + 1]
+        if key_end > key_begin:
+            result[key_begin:key_end] = np.searchsorted(values[value_offsets[segment]:value_offsets[segment + 1]],
+                                                        keys[key_begin:key_end], side=side)
+    return result
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def fcfs_slot_queue(arrival_times, slot_times, arrival_offsets=None, slot_offsets=None):
+    """ Assign a service slot to each job of FCFS discrete-slot queues.
+
+    Job j is served in the first slot at or after its arrival time that comes after the slot of job j - 1, which is the
+    Lindley-style recursion k[j] = max(f[j], k[j - 1] + 1), where f[j] is the first slot at or after the arrival.  The
+    recursion unrolls to k[j] = j + max(f[i] - i for i <= j), which is a cumulative maximum.  A job that arrives at the
+    same time as a slot is served in it.
+
+    Returns the slot index of each job within its queue's slots.  It is the number of slots of the queue for a job that
+    is not served within the given slots.
+    """
+    if arrival_offsets is None:
+        arrival_offsets = single_segment_offsets(arrival_times)
+    if slot_offsets is None:
+        slot_offsets = single_segment_offsets(slot_times)
+
+    first_slot = segmented_searchsorted(slot_times, slot_offsets, arrival_times, arrival_offsets, side="left")
+    job_index = segment_local_index(arrival_offsets)
+    slot_index = segmented_maximum_accumulate(first_slot - job_index, arrival_offsets) + job_index
+
+    num_slots = np.diff(slot_offsets)[segment_ids(arrival_offsets)]
+    return np.minimum(slot_index, num_slots)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+SlotQueueResult = namedtuple("SlotQueueResult", [
+    "slot_index",           # Slot index of each job within its queue's slots.
+    "start_time",           # Time each job enters service (inf if it is not served).
+    "completion_time",      # Time each job completes service (inf if it does not complete before until).
+    "wait_time",            # The per job times are nan for a job that does not complete before until.
+    "service_time",
+    "response_time",
+])
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def simulate_slot_queues(arrival_times, slot_times, service_time, arrival_offsets=None, slot_offsets=None, until=inf):
+    """ Simulate FCFS discrete-slot queues.  A job entering service in a slot completes service_time later.  The
+    arrival times must be sorted within each queue, for example the cumulative sum of interarrival samples.
+
+    Returns a SlotQueueResult of per job arrays.
+    """
+    arrival_times = np.asarray(arrival_times, dtype=np.float64)
+    slot_times = np.asarray(slot_times, dtype=np.float64)
+    if arrival_offsets is None:
+        arrival_offsets = single_segment_offsets(arrival_times)
+    if slot_offsets is None:
+        slot_offsets = single_segment_offsets(slot_times)
+
+    slot_index = fcfs_slot_queue(arrival_times, slot_times, arrival_offsets, slot_offsets)
+
+    # Look up the slot time of each served job.
+    segment_slot_offsets = slot_offsets[:-1][segment_ids(arrival_offsets)]
+    served = slot_index < (slot_offsets[1:][segment_ids(arrival_offsets)] - segment_slot_offsets)
+    start_time = np.full(len(arrival_times), inf)
+    start_time[served] = slot_times[segment_slot_offsets[served] + slot_index[served]]
+    start_time[start_time >= until] = inf
+
+    # Calculate the per job times of the completed jobs.
+    completion_time = start_time + service_time
+    completed = completion_time < until
+    completion_time[~completed] = inf
+    wait_time = np.full(len(arrival_times), nan)
+    job_service_time = np.full(len(arrival_times), nan)
+    response_time = np.full(len(arrival_times), nan)
+    wait_time[completed] = start_time[completed] - arrival_times[completed]
+    job_service_time[completed] = completion_time[completed] - start_time[completed]
+    response_time[completed] = completion_time[completed] - arrival_times[completed]
+
+    return SlotQueueResult(slot_index, start_time, completion_time, wait_time, job_service_time, response_time)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def occupancy_change_points(up_times, down_times, up_offsets=None, down_offsets=None, initial_counts=0):
+    """ Get the change points of the number of items in queues, where an item is added at each up time and removed at
+    each down time.  For example, the number of jobs waiting has the arrival times as up times and the enter service
+    times as down times.
+
+    Returns (times, counts, offsets), which has one point for each distinct event time of a queue with the count after
+    all of the events at that time.
+    """
+    up_times = np.asarray(up_times, dtype=np.float64)
+    down_times = np.asarray(down_times, dtype=np.float64)
+    if up_offsets is None:
+        up_offsets = single_segment_offsets(up_times)
+    if down_offsets is None:
+        down_offsets = single_segment_offsets(down_times)
+    num_segments = len(up_offsets) - 1
+
+    # Merge the events of each queue in time order.  The up times are already sorted within each queue, and so are the
+    # down times, so each time is put after the times of the other kind of its queue before it, and a down time after
+    # the up times at the same time.
+    offsets = up_offsets + down_offsets
+    up_sizes = np.diff(up_offsets)
+    down_sizes = np.diff(down_offsets)
+    up_position = np.repeat(offsets[:-1] - up_offsets[:-1], up_sizes) + np.arange(len(up_times)) + \
+        segmented_searchsorted(down_times, down_offsets, up_times, up_offsets, side="left")
+    down_position = np.repeat(offsets[:-1] - down_offsets[:-1], down_sizes) + np.arange(len(down_times)) + \
+        segmented_searchsorted(up_times, up_offsets, down_times, down_offsets, side="right")
+    times = np.empty(offsets[-1])
+    times[up_position] = up_times
+    times[down_position] = down_times
+    delta = np.ones(offsets[-1], dtype=np.int64)
+    delta[down_position] = -1
+
+    # Count with a cumulative sum, which continues from the count at the end of the previous queue, so each queue is
+    # shifted to start from its initial count.
+    count_before = np.zeros(num_segments, dtype=np.int64)
+    np.cumsum((up_sizes - down_sizes)[:-1], out=count_before[1:])
+    counts = np.cumsum(delta)
+    counts += np.repeat(np.broadcast_to(np.asarray(initial_counts, dtype=np.int64), (num_segments,)) - count_before,
+                        np.diff(offsets))
+
+    # Keep the last event at each time of each queue.
+    keep = np.ones(len(times), dtype=bool)
+    keep[:-1] = times[1:] != times[:-1]
+    keep[offsets[1:][offsets[1:] > offsets[:-1]] - 1] = True
+    num_kept = np.zeros(len(times) + 1, dtype=np.int64)
+    np.cumsum(keep, out=num_kept[1:])
+    return times[keep], counts[keep], num_kept[offsets]
+
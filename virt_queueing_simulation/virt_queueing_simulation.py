@@ -1,32 +1,41 @@
 """ Virtualized hardware queueing simulation """
 
 import concurrent.futures
+import contextlib
+import cProfile
 import csv
+import heapq
 import json
 import math
 import os
+import pickle
+import pstats
 import random
 import sys
 import time
 import traceback
+import tracemalloc
 from collections import defaultdict, deque, namedtuple
 from enum import Enum
 from itertools import count
 
+import numpy as np
 import simpy
 import simpy.util
 
+import arrival_trace_cache
 import distributions
+import event_trace
 import queueing_simulation_common as qsc
 import utils
+import virt_queueing_kernel as vqk
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-class QueueingSystem:
-    """ Queueing system class.  The class models the queueing system which includes the queue and server.
-    When an arrival occurs, the arrival() function is to be called.  The process_server() function is the
-    server process that simulates jobs being serviced and completed.  This class handles the queue
-    count. """
+class QueueingSystemBase:
+    """ Queueing system base class.  The class holds the virtual queues, the server state, and the statistics of the
+    queueing system, and it handles the arrival, enter service, and complete service events that update them.  The
+    simulation engines derive from this class and decide when these events happen. """
 
     # ------------------------------------------------------------------------------------------------------------------
     class ServiceDiscipline(Enum):
@@ -36,9 +45,30 @@ class QueueingSystem:
 
     VALID_QUEUE_DISCIPLINES = tuple(ServiceDiscipline.__members__)
 
+    # ------------------------------------------------------------------------------------------------------------------
+    class Scheduler(Enum):
+        ROUND_ROBIN = 1     # Round-robin C-slow schedule of the groups of C queues with context switches
+        RR_SKIP = 2         # Round-robin that skips a queue that is not ready (rr_skip_one.vhd)
+        MOST_FULL = 3       # Capacity prioritization of the ready queue with the most jobs waiting (most_full_sch.vhd)
+
+    VALID_SCHEDULERS = tuple(Scheduler.__members__)
+
+    # The messages of the job events and of the server events.
+    JOB_EVENT_MESSAGES = {
+        event_trace.ARRIVAL: "New job %(job_no)d arrived in input queue %(virt_index)d",
+        event_trace.ENTER_SERVICE: "Job %(job_no)d entered service for virtual computation %(virt_index)d",
+        event_trace.COMPLETE_SERVICE: "Job %(job_no)d completed service",
+    }
+    SERVER_EVENT_MESSAGES = {
+        event_trace.SERVER_START: "Starting",
+        event_trace.SERVER_GROUP: "Now processing queues %d-%d.",
+        event_trace.SERVER_PERIOD: "Completed a schedule period",
+        event_trace.SERVER_CONTEXT_SWITCH: "Context-switching",
+    }
+
     # ------------------------------------------------------------------------------------------------------------------
     def __init__(self, sim, N, C, S, Rs, arrival_distributions, f_clk, SD=ServiceDiscipline.FCFS,
-                 sd_random_class=None, stats_warmup_time=0):
+                 sd_random_class=None, stats_warmup_time=0, online_stats=False):
         """
         AD is the arrival distribution.
         N is the number of streams.
@@ -49,11 +79,13 @@ class QueueingSystem:
             First Come, First Served (FCFS)
             Last Come, First Served (LCFS)
             Service In, Random Order (SIRO)
+        online_stats selects the online statistics of the queue counts, which do not store the change points
+        (QueueStats(online=True)).
         """
 
-        # Simulation and environment
+        # Simulation
         self.sim = sim
-        self.env = sim.env
+        self.set_event_hooks()
 
         # System parameters
         if N < C or N % C != 0:
@@ -73,140 +105,126 @@ class QueueingSystem:
         assert len(arrival_distributions) == N
         self.arrival_distributions = arrival_distributions
 
-        # Setup the interarrival time random sample generators.
-        self.next_interarrival_time = [dist.random_sample for dist in self.arrival_distributions]
-
-        # Setup arrival queues
-        self.queue = [deque() for _ in range(N)]
-        self.total_arrivals = [0 for _ in range(N)]
-        self.total_departures = [0 for _ in range(N)]
-
         # Setup the service discipline random number generator.
         if sd_random_class is None:
             self.sd_random_class = distributions.default_random_class
         else:
             self.sd_random_class = sd_random_class
 
-        # Setup the service discipline.
-        if SD == self.ServiceDiscipline.FCFS:
-            def get_next_job(queue):
-                return queue.pop()
-        elif SD == self.ServiceDiscipline.LCFS:
-            def get_next_job(queue):
-                return queue.popleft()
-        elif SD == self.ServiceDiscipline.SIRO:
-            def get_next_job(queue):
-                index = self.sd_random_class.randrange(len(queue))
-                job = queue[index]
-                del queue[index]
-                return job
-        else:
-            raise qsc.QueueingSystemError("Queue discipline (%s) is not one of %s",
-                                      (repr(SD), repr(self.VALID_QUEUE_DISCIPLINES)))
-        self.get_next_job = get_next_job
+        # Setup the interarrival time random sample generators.  The streams that do not share their random class draw
+        # their interarrival times in blocks.  The SIRO picks interleave with the arrivals in their random class.
+        block_streams = distributions.block_sampled_streams(
+            arrival_distributions, (self.sd_random_class,) if SD == self.ServiceDiscipline.SIRO else ())
+        self.next_interarrival_time = [distributions.SampleBuffer(dist) if index in block_streams else dist.random_sample
+                                       for index, dist in enumerate(arrival_distributions)]
+
+        # Setup arrival queues
+        self.queue = [self.make_job_queue() for _ in range(N)]
+        self.total_arrivals = [0 for _ in range(N)]
+        self.total_departures = [0 for _ in range(N)]
 
         # Setup server
         self.jobs_receiving_service = [0 for _ in range(self.N)]
         self.total_jobs_receiving_service = 0
+        self.server_wakeups = 0     # Number of service slots that the server handled
 
-        # Setup callbacks
-        self.sim.callbacks_before_run.append(lambda sim: self.event_before_run())
-        self.sim.callbacks_after_run.append(lambda sim: self.event_after_run())
+        # Setup callbacks.  They look up the system of the simulation, which is replaced when a checkpoint is loaded.
+        self.sim.callbacks_before_run.append(lambda sim: sim.system.event_before_run())
+        self.sim.callbacks_after_run.append(lambda sim: sim.system.event_after_run())
 
         # Setup job stats
         self.stats_warmup_time = stats_warmup_time
-        self.stats = [qsc.QueueStats() for _ in range(N)]
+        self.stats = [qsc.QueueStats(online=online_stats) for _ in range(N)]
 
         # Busy and idle period setup.
         self.busy_period_num_jobs = [0 for _ in range(self.N)]
         self.busy_period_start = [None for _ in range(self.N)]
-        self.idle_period_start = [self.env.now for _ in range(self.N)]
-
-        # Create the arrival processes.
-        for index in range(N):
-            self.env.process(self.process_arrival(index))
-
-        # Create the real server process.
-        self.env.process(self.process_real_server())
+        self.idle_period_start = [self.now for _ in range(self.N)]
 
     # ------------------------------------------------------------------------------------------------------------------
-    def process_arrival(self, index):
-        """ Job arrival process.  New jobs are generated from this process that are spaced out by
-        the interarrival time.  The interarrival time is determined by the selected arrival process
-        distribution chosen above. """
-
-        get_next_interarrival_time = self.next_interarrival_time[index]
-
-        while True:
-            next_interarrival_time = get_next_interarrival_time()
-            yield self.env.timeout(next_interarrival_time)
-            now = self.env.now
-            self.total_arrivals[index] += 1
-            job_no = self.total_arrivals[index]
-            if now >= self.stats_warmup_time:
-                self.stats[index].total_arrivals += 1
-            self.queue[index].appendleft((job_no, now))
-            self.event_arrival(index, job_no)
+    def make_job_queue(self, jobs=()):
+        """ Make an input queue for the service discipline.  Each queue class adds an arriving job with appendleft(job)
+        and removes the job to serve next with get_next_job() in constant time. """
+        SD = self.SD
+        if SD == self.ServiceDiscipline.FCFS:
+            return qsc.FCFSJobQueue(jobs)
+        elif SD == self.ServiceDiscipline.LCFS:
+            return qsc.LCFSJobQueue(jobs)
+        elif SD == self.ServiceDiscipline.SIRO:
+            return qsc.SIROJobQueue(jobs, random_class=self.sd_random_class)
+        else:
+            raise qsc.QueueingSystemError("Queue discipline (%s) is not one of %s" %
+                                          (repr(SD), repr(self.VALID_QUEUE_DISCIPLINES)))
 
     # ------------------------------------------------------------------------------------------------------------------
-    def process_real_server(self):
-        """ Real server process. """
+    def __getstate__(self):
+        """ Get the state for pickling a checkpoint.  The simulation and its event trace are not part of the state. """
+        state = self.__dict__.copy()
+        del state["sim"]
+        del state["event_trace"]
+        return state
 
-        # Helper functions to handle when a job enters and completes service.
-        def job_entered_service(virt_index, job_no):
-            self.jobs_receiving_service[virt_index] += 1
-            self.total_jobs_receiving_service += 1
-            self.busy_period_num_jobs[virt_index] += 1
-            self.event_enter_service(virt_index, job_no)
+    # ------------------------------------------------------------------------------------------------------------------
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.sim = None
+        self.event_trace = None
 
-        num_groups = self.N // self.C
+    # ------------------------------------------------------------------------------------------------------------------
+    def set_event_hooks(self):
+        """ Set the event trace and the flags of the job and server event hooks from the simulation.  The events check
+        the flags before they call the hooks, so disabled hooks cost one attribute check and no message formatting. """
+        sim = self.sim
+        self.event_trace = sim.event_trace
+        self.job_event_hooks = sim.show_job_event_info or sim.event_trace is not None
+        self.server_event_hooks = sim.show_server_info or sim.event_trace is not None
 
-        self.print_server_info("Starting")
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def now(self):
+        raise NotImplementedError
 
-        while True:
-            for active_group_index in range(num_groups):
-                self.print_server_info("Now processing queues %d-%d.", active_group_index * self.C,
-                                       (active_group_index + 1) * self.C - 1)
+    # ------------------------------------------------------------------------------------------------------------------
+    def run(self, until):
+        raise NotImplementedError
 
-                for schedule_period_count in range(self.Rs):
-                    for active_group_queue_index in range(self.C):
-                        yield self.env.timeout(self.t_clk)
+    # ------------------------------------------------------------------------------------------------------------------
+    def arrival(self, index):
+        """ A new job arrives in the input queue. """
+        now = self.now
+        self.total_arrivals[index] += 1
+        job_no = self.total_arrivals[index]
+        if now >= self.stats_warmup_time:
+            self.stats[index].total_arrivals += 1
+        self.queue[index].appendleft((job_no, now))
+        self.event_arrival(index, job_no)
 
-                        virt_index = active_group_index * self.C + active_group_queue_index
+    # ------------------------------------------------------------------------------------------------------------------
+    def begin_service(self, virt_index):
+        """ The next job in the (non-empty) input queue enters service.  Returns the job number and the job arrival
+        time. """
+        now = self.now
+        if self.jobs_receiving_service[virt_index] == 0:
+            # Begin a busy period.
+            if now >= self.stats_warmup_time:
+                idle_period_duration = now - self.idle_period_start[virt_index]
+                self.stats[virt_index].idle_period.append(
+                    self.idle_period_start[virt_index], idle_period_duration)
 
-                        if len(self.queue[virt_index]) > 0:
-                            if self.jobs_receiving_service[virt_index] == 0:
-                                # Begin a busy period.
-                                if self.env.now >= self.stats_warmup_time:
-                                    idle_period_duration = self.env.now - self.idle_period_start[virt_index]
-                                    self.stats[virt_index].idle_period.append(
-                                        self.idle_period_start[virt_index], idle_period_duration)
-
-                                self.busy_period_start[virt_index] = self.env.now
-                                self.busy_period_num_jobs[virt_index] = 0
-
-                            job_no, job_arrival_time = self.get_next_job(self.queue[virt_index])
-                            job_entered_service(virt_index, job_no)
-                            self.env.process(self.process_virt_computation(
-                                virt_index,
-                                job_no=job_no,
-                                job_arrival_time=job_arrival_time,
-                                job_entered_service_time=self.env.now))
-                    self.print_server_info("Completed a schedule period")
+            self.busy_period_start[virt_index] = now
+            self.busy_period_num_jobs[virt_index] = 0
 
-                # Context switch to the next group.
-                self.print_server_info("Context-switching")
-                yield self.env.timeout(self.S * self.t_clk)
+        job_no, job_arrival_time = self.queue[virt_index].get_next_job()
+        self.jobs_receiving_service[virt_index] += 1
+        self.total_jobs_receiving_service += 1
+        self.busy_period_num_jobs[virt_index] += 1
+        self.event_enter_service(virt_index, job_no)
+        return job_no, job_arrival_time
 
     # ------------------------------------------------------------------------------------------------------------------
-    def process_virt_computation(self, virt_index, job_no, job_arrival_time, job_entered_service_time):
-        """ Virtual computation process. """
-
-        # Service time.
-        yield self.env.timeout(self.C * self.t_clk)
-
-        # Complete service.
-        now = self.env.now
+    def complete_service(self, virt_index, job_no, job_arrival_time, job_entered_service_time):
+        """ The job completes service in the virtual computation. """
+        now = self.now
         job_completed_service_time = now
         job_wait_time = job_entered_service_time - job_arrival_time
         job_service_time = job_completed_service_time - job_entered_service_time
@@ -233,7 +251,7 @@ class QueueingSystem:
 
     # ------------------------------------------------------------------------------------------------------------------
     def event_before_run(self):
-        now = self.env.now
+        now = self.now
         if now >= self.stats_warmup_time:
             for virt_index in range(self.N):
                 self.stats[virt_index].jobs_waiting.append(now, self.jobs_waiting(virt_index))
@@ -243,16 +261,18 @@ class QueueingSystem:
 
     # ------------------------------------------------------------------------------------------------------------------
     def event_arrival(self, virt_index, job_no):
-        self.print_job_event_info(virt_index, "New job %d arrived in input queue %d" % (job_no, virt_index))
-        now = self.env.now
+        if self.job_event_hooks:
+            self.job_event(event_trace.ARRIVAL, virt_index, job_no)
+        now = self.now
         if now >= self.stats_warmup_time:
             self.stats[virt_index].jobs_waiting.append(now, self.jobs_waiting(virt_index))
             self.stats[virt_index].jobs_in_system.append(now, self.jobs_in_system(virt_index))
 
     # ------------------------------------------------------------------------------------------------------------------
     def event_enter_service(self, virt_index, job_no):
-        self.print_job_event_info(virt_index, "Job %d entered service for virtual computation %d" % (job_no, virt_index))
-        now = self.env.now
+        if self.job_event_hooks:
+            self.job_event(event_trace.ENTER_SERVICE, virt_index, job_no)
+        now = self.now
         if now >= self.stats_warmup_time:
             self.stats[virt_index].jobs_waiting.append(now, self.jobs_waiting(virt_index))
             self.stats[virt_index].jobs_receiving_service.append(
@@ -260,8 +280,9 @@ class QueueingSystem:
 
     # ------------------------------------------------------------------------------------------------------------------
     def event_complete_service(self, virt_index, job_no):
-        self.print_job_event_info(virt_index, "Job %d completed service" % job_no)
-        now = self.env.now
+        if self.job_event_hooks:
+            self.job_event(event_trace.COMPLETE_SERVICE, virt_index, job_no)
+        now = self.now
         if now >= self.stats_warmup_time:
             self.stats[virt_index].jobs_receiving_service.append(
                 now, self.jobs_receiving_service[virt_index])
@@ -269,7 +290,7 @@ class QueueingSystem:
 
     # ------------------------------------------------------------------------------------------------------------------
     def event_after_run(self):
-        now = self.env.now
+        now = self.now
         if now >= self.stats_warmup_time:
             for virt_index in range(self.N):
                 self.stats[virt_index].jobs_waiting.append(now, self.jobs_waiting(virt_index))
@@ -278,6 +299,23 @@ class QueueingSystem:
                 self.stats[virt_index].jobs_in_system.append(now, self.jobs_in_system(virt_index))
                 self.stats[virt_index].total_time = now - self.stats_warmup_time
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def truncate_stats(self, t, num_arrivals, num_departures):
+        """ Move the start of the statistics to time t after a run.  num_arrivals and num_departures are the number of
+        arrivals and departures of each virtual queue before time t. """
+        now = self.now
+        for virt_index in range(self.N):
+            self.stats[virt_index].truncate(t, num_arrivals[virt_index], num_departures[virt_index])
+            self.stats[virt_index].total_time = now - t
+        self.stats_warmup_time = t
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def num_events(self):
+        """ Get the number of job events (arrivals, service starts, and service completions) so far, including the ones
+        before the warmup time. """
+        num_departures = sum(self.total_departures)
+        return sum(self.total_arrivals) + num_departures + self.total_jobs_receiving_service + num_departures
+
     # ------------------------------------------------------------------------------------------------------------------
     def jobs_waiting(self, index):
         return len(self.queue[index])
@@ -286,6 +324,26 @@ class QueueingSystem:
     def jobs_in_system(self, index):
         return len(self.queue[index]) + self.jobs_receiving_service[index]
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def job_event(self, event_type, virt_index, job_no):
+        """ Record a job event in the event trace and print its job event information. """
+        if self.event_trace is not None:
+            self.event_trace.record(self.now, event_type, virt_index, job_no)
+        if self.sim.show_job_event_info:
+            self.print_job_event_info(virt_index, self.JOB_EVENT_MESSAGES[event_type] %
+                                      {"job_no": job_no, "virt_index": virt_index})
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def server_event(self, event_type, virt_index=-1):
+        """ Record a server event in the event trace and print its server information. """
+        if self.event_trace is not None:
+            self.event_trace.record(self.now, event_type, virt_index)
+        if self.sim.show_server_info:
+            if event_type == event_trace.SERVER_GROUP:
+                self.print_server_info(self.SERVER_EVENT_MESSAGES[event_type], virt_index, virt_index + self.C - 1)
+            else:
+                self.print_server_info(self.SERVER_EVENT_MESSAGES[event_type])
+
     # ------------------------------------------------------------------------------------------------------------------
     def print_server_info(self, msg, *args):
         """ Print server information. """
@@ -310,47 +368,1372 @@ class QueueingSystem:
                          (virt_index, job_number, job_wait_time, job_service_time, job_response_time))
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+class QueueingSystem(QueueingSystemBase):
+    """ Queueing system class.  The class models the queueing system which includes the queue and server.
+    When an arrival occurs, the arrival() function is to be called.  The process_server() function is the
+    server process that simulates jobs being serviced and completed.  This class handles the queue
+    count. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, sim, N, C, S, Rs, arrival_distributions, f_clk, SD=QueueingSystemBase.ServiceDiscipline.FCFS,
+                 sd_random_class=None, stats_warmup_time=0, online_stats=False, skip_idle_clocks=False,
+                 completion_ring=False, merged_arrivals=False):
+        """
+        skip_idle_clocks selects the real server process that skips the clocks of empty queues
+        (process_real_server_skip_idle_clocks) instead of waking up every clock.
+        completion_ring makes the real server process retire the service completions from a ring of the jobs in service
+        instead of running a process_virt_computation() process for each job.
+        merged_arrivals generates the arrivals of all of the streams in one process (process_merged_arrivals) instead of
+        running a process_arrival() process for each stream, which is faster for a large number of streams.
+        """
+
+        # Environment
+        self.env = sim.env
+
+        super().__init__(sim, N, C, S, Rs, arrival_distributions, f_clk, SD=SD, sd_random_class=sd_random_class,
+                         stats_warmup_time=stats_warmup_time, online_stats=online_stats)
+
+        # Create the arrival processes.  The time of the next arrival of each stream is saved for the real server process
+        # that skips the idle clocks.
+        self.next_arrival_time = [qsc.inf for _ in range(N)]
+        self.merged_arrivals = merged_arrivals
+        if merged_arrivals:
+            self.env.process(self.process_merged_arrivals())
+        else:
+            for index in range(N):
+                self.env.process(self.process_arrival(index))
+
+        # Setup the completion ring.  The service time is always C clocks, so the jobs complete service in the order
+        # that they enter service, and at most C jobs are in service.
+        self.completion_ring = deque() if completion_ring else None
+
+        # Create the real server process.
+        self.skip_idle_clocks = skip_idle_clocks
+        if skip_idle_clocks:
+            self.env.process(self.process_real_server_skip_idle_clocks())
+        else:
+            self.env.process(self.process_real_server())
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getstate__(self):
+        raise qsc.QueueingSystemError("The simpy engine cannot be checkpointed, because the state of its processes "
+                                      "(generators) cannot be saved.")
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def now(self):
+        return self.env.now
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run(self, until):
+        """ Run the simpy environment until the given simulation time. """
+        self.env.run(until=until)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def process_arrival(self, index):
+        """ Job arrival process.  New jobs are generated from this process that are spaced out by
+        the interarrival time.  The interarrival time is determined by the selected arrival process
+        distribution chosen above. """
+
+        get_next_interarrival_time = self.next_interarrival_time[index]
+
+        while True:
+            next_interarrival_time = get_next_interarrival_time()
+            timeout = self.env.timeout(next_interarrival_time)
+            self.next_arrival_time[index] = self.env.now + next_interarrival_time
+            yield timeout
+            self.arrival(index)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def process_merged_arrivals(self):
+        """ Merged job arrival process.  The arrivals of all of the streams are generated from this one process with a
+        calendar (heap) of the next arrival of each stream.  The calendar entries are ordered by arrival time and then
+        by the order they were scheduled in, which is the order that simpy processes the process_arrival() timeouts.
+        Therefore the interarrival times are drawn in the same order as the process_arrival() processes, even when the
+        streams share a random class.  The arrivals at the same time are handled in one wake up, which is the order of
+        process_arrival(). """
+
+        env = self.env
+        next_interarrival_time = self.next_interarrival_time
+        next_arrival_time = self.next_arrival_time
+        calendar = []
+        sequence = count()
+
+        # Schedule the first arrival of each stream.
+        for index in range(self.N):
+            t = env.now + next_interarrival_time[index]()
+            next_arrival_time[index] = t
+            calendar.append((t, next(sequence), index))
+        heapq.heapify(calendar)
+
+        while True:
+            t = calendar[0][0]
+            yield self.timeout_at(t)
+
+            while calendar[0][0] == t:
+                _, _, index = calendar[0]
+                self.arrival(index)
+
+                # Schedule the next arrival of the stream.
+                t_next = env.now + next_interarrival_time[index]()
+                next_arrival_time[index] = t_next
+                heapq.heapreplace(calendar, (t_next, next(sequence), index))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def process_real_server(self):
+        """ Real server process. """
+
+        num_groups = self.N // self.C
+        completion_ring = self.completion_ring
+
+        if self.server_event_hooks:
+            self.server_event(event_trace.SERVER_START)
+
+        while True:
+            for active_group_index in range(num_groups):
+                if self.server_event_hooks:
+                    self.server_event(event_trace.SERVER_GROUP, active_group_index * self.C)
+
+                for schedule_period_count in range(self.Rs):
+                    for active_group_queue_index in range(self.C):
+                        if completion_ring is None:
+                            yield self.env.timeout(self.t_clk)
+                        else:
+                            yield from self.wait_for_clock(self.env.now, self.env.now + self.t_clk, self.t_clk)
+                            if self.C > 1 or schedule_period_count == 0:
+                                self.retire_completions()
+                        self.server_wakeups += 1
+
+                        virt_index = active_group_index * self.C + active_group_queue_index
+
+                        if len(self.queue[virt_index]) > 0:
+                            job_no, job_arrival_time = self.begin_service(virt_index)
+                            self.start_virt_computation(virt_index, job_no, job_arrival_time)
+
+                        if completion_ring is not None:
+                            self.retire_completions()
+                    if self.server_event_hooks:
+                        self.server_event(event_trace.SERVER_PERIOD)
+
+                # Context switch to the next group.
+                if self.server_event_hooks:
+                    self.server_event(event_trace.SERVER_CONTEXT_SWITCH)
+                if completion_ring is None:
+                    yield self.env.timeout(self.S * self.t_clk)
+                else:
+                    yield from self.wait_for_clock(self.env.now, self.env.now + self.S * self.t_clk,
+                                                   self.S * self.t_clk)
+                    self.retire_completions()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def process_real_server_skip_idle_clocks(self):
+        """ Real server process that skips the idle clocks.  The server steps through the same clocks as
+        process_real_server() by adding up the clock periods, but it only wakes up for the slot of a queue that is
+        non-empty or has its next arrival at or before the slot.  When every queue of the active group is idle, it
+        therefore jumps to the next arrival or across the group boundary.
+
+        To keep the event order of process_real_server(), the server wakes up one clock before the slot and then waits
+        for the slot with a clock timeout, which is when process_real_server() schedules the slot.  When the server is
+        already awake at the clock before the slot, it waits for the slot directly.  The statistics and job timings are
+        the same as process_real_server(). """
+
+        env = self.env
+        queue = self.queue
+        next_arrival_time = self.next_arrival_time
+        completion_ring = self.completion_ring
+        C = self.C
+        t_clk = self.t_clk
+        switch_time = self.S * t_clk
+        num_groups = self.N // C
+
+        if self.server_event_hooks:
+            self.server_event(event_trace.SERVER_START)
+
+        # The time of the current clock.  The server is awake at that time if it is the simulation time.
+        t = env.now
+
+        while True:
+            for active_group_index in range(num_groups):
+                for schedule_period_count in range(self.Rs):
+                    for virt_index in range(active_group_index * C, (active_group_index + 1) * C):
+                        prev_t = t
+                        t = t + t_clk
+                        if not queue[virt_index] and next_arrival_time[virt_index] > t:
+                            continue
+
+                        # Wait for the slot.
+                        yield from self.wait_for_clock(prev_t, t, t_clk)
+                        if completion_ring is not None and (C > 1 or schedule_period_count == 0):
+                            self.retire_completions()
+                        self.server_wakeups += 1
+
+                        if len(queue[virt_index]) > 0:
+                            job_no, job_arrival_time = self.begin_service(virt_index)
+                            self.start_virt_computation(virt_index, job_no, job_arrival_time)
+
+                        if completion_ring is not None:
+                            self.retire_completions()
+
+                # Context switch to the next group.  The server waits for it if it is awake, which keeps the event order
+                # of a slot right after the context switch.
+                prev_t = t
+                t = t + switch_time
+                if env.now == prev_t:
+                    yield from self.wait_for_clock(prev_t, t, switch_time)
+                    if completion_ring is not None:
+                        self.retire_completions()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def wait_for_clock(self, prev_t, t, delay):
+        """ Wait for the clock at time t, which is the delay after the clock at time prev_t.  If the server is awake at
+        time prev_t, it waits with a timeout of the delay, which is how process_real_server() waits.  If it is not awake
+        yet, it first wakes up at time prev_t.  With the completion ring, the completions before time t are retired at
+        their times on the way. """
+        env = self.env
+        completion_ring = self.completion_ring
+
+        while completion_ring and completion_ring[0][0] < t:
+            completion_time = completion_ring[0][0]
+            if completion_time > env.now:
+                yield self.timeout_at(completion_time)
+            self.retire_completions()
+
+        now = env.now
+        if now < prev_t:
+            yield self.timeout_at(prev_t)
+            now = prev_t
+        if now == prev_t:
+            yield env.timeout(delay)
+        else:
+            yield self.timeout_at(t)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def timeout_at(self, t):
+        """ Get a timeout event at simulation time t.  The delay is corrected for floating point rounding, so the
+        timeout is at exactly t. """
+        now = self.env.now
+        delay = t - now
+        while now + delay < t:
+            delay = math.nextafter(delay, qsc.inf)
+        while now + delay > t:
+            delay = math.nextafter(delay, -qsc.inf)
+        return self.env.timeout(delay)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def start_virt_computation(self, virt_index, job_no, job_arrival_time):
+        """ Start the virtual computation of the job that entered service now. """
+        now = self.env.now
+        if self.completion_ring is None:
+            self.env.process(self.process_virt_computation(
+                virt_index,
+                job_no=job_no,
+                job_arrival_time=job_arrival_time,
+                job_entered_service_time=now))
+        else:
+            self.completion_ring.append((now + self.C * self.t_clk, virt_index, job_no, job_arrival_time, now))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def retire_completions(self):
+        """ Complete service of the jobs in the completion ring that complete at the current time. """
+        completion_ring = self.completion_ring
+        now = self.env.now
+        while completion_ring and completion_ring[0][0] <= now:
+            _, virt_index, job_no, job_arrival_time, job_entered_service_time = completion_ring.popleft()
+            self.complete_service(virt_index, job_no, job_arrival_time, job_entered_service_time)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def process_virt_computation(self, virt_index, job_no, job_arrival_time, job_entered_service_time):
+        """ Virtual computation process. """
+
+        # Service time.
+        yield self.env.timeout(self.C * self.t_clk)
+
+        # Complete service.
+        self.complete_service(virt_index, job_no, job_arrival_time, job_entered_service_time)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class ScheduledQueueingSystem(QueueingSystem):
+    """ Queueing system class with a work-conserving scheduler instead of the round-robin C-slow schedule.  These are the
+    schedulers of logic_simulation/c_slow_sched_hdl, where the contexts of all N streams stay in the server, so there
+    are no context switches (S = 0) or schedule periods (Rs = 1).  Every clock, the scheduler picks a ready queue, which
+    is a queue with a job waiting and no job in service, and its next job enters service for C clocks.  The round-robin
+    scheduler of the logic simulation is the ROUND_ROBIN schedule of QueueingSystem with S = 0 and Rs = 1. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, sim, N, C, S, Rs, arrival_distributions, f_clk, SD=QueueingSystemBase.ServiceDiscipline.FCFS,
+                 sd_random_class=None, stats_warmup_time=0, online_stats=False, completion_ring=False,
+                 merged_arrivals=False, scheduler=QueueingSystemBase.Scheduler.RR_SKIP):
+        if S != 0 or Rs != 1:
+            raise qsc.QueueingSystemError("The %s scheduler has no context switches or schedule periods, so S must be 0 "
+                                          "and Rs must be 1.  S is %s and Rs is %s." % (scheduler.name, S, Rs))
+        if scheduler == self.Scheduler.RR_SKIP:
+            scheduler_class = RoundRobinSkipScheduler
+        elif scheduler == self.Scheduler.MOST_FULL:
+            scheduler_class = MostFullScheduler
+        else:
+            raise qsc.QueueingSystemError("Scheduler (%s) is not one of %s" %
+                                          (repr(scheduler), repr((self.Scheduler.RR_SKIP, self.Scheduler.MOST_FULL))))
+
+        super().__init__(sim, N, C, S, Rs, arrival_distributions, f_clk, SD=SD, sd_random_class=sd_random_class,
+                         stats_warmup_time=stats_warmup_time, online_stats=online_stats,
+                         completion_ring=completion_ring, merged_arrivals=merged_arrivals)
+
+        self.scheduler = scheduler_class(self)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def process_real_server(self):
+        """ Real server process that starts the job of the queue picked by the scheduler every clock. """
+        env = self.env
+        completion_ring = self.completion_ring
+        t_clk = self.t_clk
+
+        if self.server_event_hooks:
+            self.server_event(event_trace.SERVER_START)
+
+        while True:
+            if completion_ring is None:
+                yield env.timeout(t_clk)
+            else:
+                yield from self.wait_for_clock(env.now, env.now + t_clk, t_clk)
+                self.retire_completions()
+            self.server_wakeups += 1
+
+            virt_index = self.scheduler.select()
+            if virt_index is not None:
+                job_no, job_arrival_time = self.begin_service(virt_index)
+                self.start_virt_computation(virt_index, job_no, job_arrival_time)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def event_arrival(self, virt_index, job_no):
+        super().event_arrival(virt_index, job_no)
+        self.scheduler.update(virt_index)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def event_complete_service(self, virt_index, job_no):
+        super().event_complete_service(virt_index, job_no)
+        self.scheduler.update(virt_index)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class RoundRobinSkipScheduler:
+    """ Round-robin skip scheduler class (rr_skip_one.vhd).  The scheduler steps through the queues in order, one queue
+    per clock, but it skips the next queue if it is not ready.  It skips at most one queue per clock, so the queue that
+    it steps to can still be not ready, and then no job enters service in that clock. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, system):
+        self.system = system
+        self.N = system.N
+
+        # The queue of the previous clock.  The first clock is at queue 0.
+        self.position = self.N - 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def is_ready(self, virt_index):
+        system = self.system
+        return len(system.queue[virt_index]) > 0 and system.jobs_receiving_service[virt_index] == 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def select(self):
+        """ Step to the queue of this clock.  Returns its index if it is ready, or None. """
+        virt_index = (self.position + 1) % self.N
+        if not self.is_ready(virt_index):
+            virt_index = (virt_index + 1) % self.N
+        self.position = virt_index
+        return virt_index if self.is_ready(virt_index) else None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def update(self, virt_index):
+        pass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class MostFullScheduler:
+    """ Most full (capacity prioritization) scheduler class (most_full_sch.vhd).  The scheduler picks the ready queue
+    with the most jobs waiting.  The ready queues are kept in a bucket queue keyed by the number of jobs waiting, so a
+    pick and an update take constant (amortized) time instead of a scan over the N queues every clock.  Among the
+    ready queues with the same number of jobs waiting, the one that was updated last is picked.  The hardware picks
+    the one with the highest index instead. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, system):
+        self.system = system
+
+        # Bucket n holds the ready queues with n jobs waiting (bucket 0 is always empty), and key is the bucket of each
+        # queue, or None if the queue is not ready.  The buckets are dicts used as ordered sets.
+        self.buckets = [{}]
+        self.key = [None for _ in range(system.N)]
+
+        # The highest bucket that can be non-empty.
+        self.max_key = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def select(self):
+        """ Pick the ready queue with the most jobs waiting.  Returns its index, or None if no queue is ready. """
+        buckets = self.buckets
+        max_key = self.max_key
+        while max_key > 0 and not buckets[max_key]:
+            max_key -= 1
+        self.max_key = max_key
+        if max_key == 0:
+            return None
+        virt_index, _ = buckets[max_key].popitem()
+        self.key[virt_index] = None
+        return virt_index
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def update(self, virt_index):
+        """ Move the queue to the bucket of its number of jobs waiting, or remove it if it is not ready. """
+        system = self.system
+        n = len(system.queue[virt_index])
+        new_key = n if n > 0 and system.jobs_receiving_service[virt_index] == 0 else None
+        old_key = self.key[virt_index]
+        if new_key == old_key:
+            return
+        buckets = self.buckets
+        if old_key is not None:
+            del buckets[old_key][virt_index]
+        if new_key is not None:
+            while len(buckets) <= new_key:
+                buckets.append({})
+            buckets[new_key][virt_index] = None
+            if new_key > self.max_key:
+                self.max_key = new_key
+        self.key[virt_index] = new_key
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class RoundRobinSchedule:
+    """ Round-robin C-slow schedule class.  The real server processes the N virtual queues in N/C groups of C queues.
+    A group is active for Rs schedule period rounds of C clocks, where each queue in the group gets one service slot
+    per round, and a context switch of S clocks follows.  The service slots of a virtual queue therefore only depend
+    on (N, C, S, Rs, virt_index), and this class calculates them arithmetically.  Slot k of a virtual queue is its
+    k-th service slot counting from time 0. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, N, C, S, Rs, t_clk):
+        self.N = N
+        self.C = C
+        self.S = S
+        self.Rs = Rs
+        self.t_clk = t_clk
+
+        self.num_groups = N // C
+        self.group_clocks = Rs * C + S
+        self.period_clocks = self.num_groups * self.group_clocks
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def slot_clock(self, virt_index, k):
+        """ Get the clock number of slot k of the virtual queue.  k can also be an array of slot indices. """
+        group_index, group_queue_index = divmod(virt_index, self.C)
+        period_index, round_index = divmod(k, self.Rs)
+        return (period_index * self.period_clocks + group_index * self.group_clocks + round_index * self.C +
+                group_queue_index + 1)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def slot_time(self, virt_index, k):
+        """ Get the time of slot k of the virtual queue.  k can also be an array of slot indices. """
+        return self.slot_clock(virt_index, k) * self.t_clk
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def first_slot_at_or_after(self, virt_index, t):
+        """ Get the index of the first slot of the virtual queue at or after time t. """
+        group_index, group_queue_index = divmod(virt_index, self.C)
+        clocks = t / self.t_clk - (group_index * self.group_clocks + group_queue_index + 1)
+        if clocks <= 0:
+            return 0
+        period_index, period_clocks = divmod(clocks, self.period_clocks)
+        round_index = math.ceil(period_clocks / self.C)
+        k = int(period_index) * self.Rs + min(round_index, self.Rs)
+
+        # Correct for floating point rounding against the slot times.
+        while k > 0 and self.slot_time(virt_index, k - 1) >= t:
+            k -= 1
+        while self.slot_time(virt_index, k) < t:
+            k += 1
+        return k
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def first_slots_at_or_after(self, virt_index, times):
+        """ Get the index of the first slot of the virtual queue at or after each of the times, as an array.  This is
+        first_slot_at_or_after() with array operations.  virt_index can also be an array of the virtual queue of each
+        of the times. """
+        first_clock = self.slot_clock(virt_index, 0)
+        clocks = times / self.t_clk - first_clock
+        period_index, period_clocks = np.divmod(clocks, self.period_clocks)
+        k = period_index.astype(np.int64) * self.Rs + np.minimum(np.ceil(period_clocks / self.C), self.Rs).astype(
+            np.int64)
+        k[clocks <= 0] = 0
+
+        # Correct for floating point rounding against the slot times.
+        def slot_times(k):
+            period_index, round_index = np.divmod(k, self.Rs)
+            return (period_index * self.period_clocks + round_index * self.C + first_clock) * self.t_clk
+
+        while True:
+            late = (k > 0) & (slot_times(k - 1) >= times)
+            if not late.any():
+                break
+            k[late] -= 1
+        while True:
+            early = slot_times(k) < times
+            if not early.any():
+                break
+            k[early] += 1
+        return k
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def slots_before(self, virt_index, k_from, until):
+        """ Get the slot indices from k_from of the virtual queue with a slot time before the given time, and their
+        slot times, as arrays. """
+        k_until = max(k_from, self.first_slot_at_or_after(virt_index, until))
+        k = np.arange(k_from, k_until, dtype=np.int64)
+        group_index, group_queue_index = divmod(virt_index, self.C)
+        period_index, round_index = np.divmod(k, self.Rs)
+        clocks = (period_index * self.period_clocks + group_index * self.group_clocks + round_index * self.C +
+                  group_queue_index + 1)
+        return k, clocks * self.t_clk
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def completes_before_slot(self, k):
+        """ Check if a service completion at the same time as slot k is handled before the slot.  This follows the event
+        order of the simpy server process:  the completion comes first unless C is 1 and the slot is not the first
+        one of the active group, in which case the server timeout was scheduled before the completion.  k can also be
+        an array of slot indices. """
+        return (self.C > 1) | (k % self.Rs == 0)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class SlotQueueingSystemBase(QueueingSystemBase):
+    """ Slot queueing system base class.  This is the base class of the engines that calculate the service slots of the
+    round-robin C-slow schedule arithmetically from the RoundRobinSchedule instead of stepping the server clock by
+    clock (SlotCalendarQueueingSystem and VectorizedQueueingSystem).  It has the next slot and the pending service
+    completions of each virtual queue, and advances the FCFS virtual queues through a run at once with array operations
+    (advance_fcfs_queues()), which both engines use for their FCFS queues. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, sim, N, C, S, Rs, arrival_distributions, f_clk, SD=QueueingSystemBase.ServiceDiscipline.FCFS,
+                 sd_random_class=None, stats_warmup_time=0, online_stats=False):
+        # Simulation time
+        self._now = 0
+
+        super().__init__(sim, N, C, S, Rs, arrival_distributions, f_clk, SD=SD, sd_random_class=sd_random_class,
+                         stats_warmup_time=stats_warmup_time, online_stats=online_stats)
+
+        # Setup the schedule.
+        self.schedule = RoundRobinSchedule(N, C, S, Rs, self.t_clk)
+
+        # Setup the next slot and the pending service completions of each virtual queue.  The slot time is saved with
+        # the slot index as it is only calculated when the slot index changes.
+        self.next_slot = [0 for _ in range(N)]
+        self.next_slot_time = [self.schedule.slot_time(virt_index, 0) for virt_index in range(N)]
+        self.pending_completions = [deque() for _ in range(N)]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def now(self):
+        return self._now
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def advance_fcfs_queues(self, new_arrival_times, until):
+        """ Advance the FCFS virtual queues through the new arrival times of each stream (an array for each), and their
+        slots and service completions, until the given time with array operations.  This gives the same statistics and
+        state as the event loop of SlotCalendarQueueingSystem (advance_queue()).  Job j of a virtual queue is served in
+        slot k[j] = max(f[j], k[j - 1] + 1), where f[j] is the first slot at or after its arrival, which is a
+        cumulative maximum.  The statistics are then derived from the times of the jobs in the order of the events of
+        advance_queue().  The jobs of all of the virtual queues are calculated together in flat arrays (see
+        virt_queueing_kernel), and only the statistics and the state are updated one virtual queue at a time.  The job
+        events are recorded in the event trace, if there is one, but the job event and job stat messages are not
+        printed.  Returns the number of jobs that started service. """
+        N = self.N
+        schedule = self.schedule
+        service_time = self.C * self.t_clk
+        warmup_time = self.stats_warmup_time
+
+        # Get the jobs that are not in service yet, which are the waiting jobs followed by the new arrivals.  They are
+        # the last arrivals of each virtual queue, so their job numbers are consecutive.
+        new_arrival_times_flat, new_arrival_offsets = vqk.concatenate_segments(new_arrival_times)
+        num_new_arrivals = np.diff(new_arrival_offsets)
+        num_waiting = np.array([len(queue) for queue in self.queue], dtype=np.int64)
+        if num_waiting.any():
+            arrival_times, job_offsets = vqk.concatenate_segments(
+                [array for queue, new in zip(self.queue, new_arrival_times)
+                 for array in ([a for _, a in reversed(queue)], new)])
+            job_offsets = job_offsets[::2]
+        else:
+            arrival_times, job_offsets = new_arrival_times_flat, new_arrival_offsets
+        num_jobs = np.diff(job_offsets)
+        job_segment = vqk.segment_ids(job_offsets)
+        job_index = vqk.segment_local_index(job_offsets)
+        job_nos = job_index + (np.array(self.total_arrivals, dtype=np.int64) - num_waiting + 1)[job_segment]
+
+        # Get the slot and the start time of each job, and the jobs that start before the given time.
+        slots = np.maximum(vqk.segmented_maximum_accumulate(
+            schedule.first_slots_at_or_after(job_segment, arrival_times) - job_index, job_offsets),
+            np.array(self.next_slot, dtype=np.int64)[job_segment]) + job_index
+        start_times = schedule.slot_time(job_segment, slots)
+        started = start_times < until
+        num_started = np.bincount(job_segment[started], minlength=N)
+
+        # Make the service sequence of each virtual queue, which is the jobs in service from the last run followed by
+        # the jobs that start service in this run.
+        num_pending = np.array([len(jobs) for jobs in self.pending_completions], dtype=np.int64)
+        seq_offsets = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(num_pending + num_started, out=seq_offsets[1:])
+        seq_segment = vqk.segment_ids(seq_offsets)
+        seq_local_index = vqk.segment_local_index(seq_offsets)
+        is_pending = seq_local_index < num_pending[seq_segment]
+        seq_start = np.empty(len(seq_segment))
+        seq_arrival = np.empty(len(seq_segment))
+        seq_slot = np.full(len(seq_segment), -1, dtype=np.int64)
+        seq_job_no = np.empty(len(seq_segment), dtype=np.int64)
+        if num_pending.any():
+            pending = np.array([job for jobs in self.pending_completions for job in jobs]).reshape(-1, 4)
+            seq_start[is_pending] = pending[:, 3]
+            seq_arrival[is_pending] = pending[:, 2]
+            seq_job_no[is_pending] = pending[:, 1]
+        is_start = ~is_pending
+        seq_start[is_start] = start_times[started]
+        seq_arrival[is_start] = arrival_times[started]
+        seq_slot[is_start] = slots[started]
+        seq_job_no[is_start] = job_nos[started]
+        seq_completion = seq_start + service_time
+        completed = seq_completion < until
+
+        # Find the starts that are handled before the completion of the job before them, which can only happen for
+        # C = 1.  These starts continue the busy period, and the other starts of this run begin a new one.
+        start_first = np.zeros(len(seq_segment), dtype=bool)
+        next_start = seq_start[1:]
+        completion = seq_completion[:-1]
+        start_first[:-1] = is_start[1:] & (seq_local_index[1:] > 0) & (
+            (next_start < completion) | ((next_start == completion) & ~schedule.completes_before_slot(seq_slot[1:])))
+        new_busy_period = is_start.copy()
+        new_busy_period[1:] &= ~start_first[:-1]
+
+        # Count the starts of this run up to each completion.  A completion leaves the queue empty if the next job that
+        # is not in service has not arrived by then.
+        starts_before_completion = np.maximum(seq_local_index - num_pending[seq_segment] + 1, 0) + start_first
+        has_next_job = starts_before_completion < num_jobs[seq_segment]
+        next_arrival_time = np.full(len(seq_segment), qsc.inf)
+        next_arrival_time[has_next_job] = arrival_times[
+            (job_offsets[:-1][seq_segment] + starts_before_completion)[has_next_job]]
+        empty = completed & (next_arrival_time > seq_completion)
+
+        # Calculate the busy periods that end with the completions that leave the queue empty.
+        seq_begin = seq_offsets[:-1][seq_segment]
+        busy_period_index = vqk.segmented_maximum_accumulate(np.where(new_busy_period, seq_local_index, -1),
+                                                             seq_offsets)
+        has_busy_period_start = busy_period_index >= 0
+        busy_period_start = np.where(
+            has_busy_period_start, seq_start[seq_begin + busy_period_index],
+            np.array([qsc.nan if t is None else t for t in self.busy_period_start])[seq_segment])
+        busy_period_num_jobs = np.where(
+            has_busy_period_start, seq_local_index - busy_period_index + 1 + start_first,
+            np.array(self.busy_period_num_jobs, dtype=np.int64)[seq_segment] + starts_before_completion)
+        busy_record = empty & (seq_completion >= warmup_time)
+
+        # Calculate the idle periods that end with the starts of the new busy periods.
+        empty_index = vqk.segmented_maximum_accumulate(np.where(empty, seq_local_index, -1), seq_offsets)
+        prev_empty_index = np.full(len(seq_segment), -1, dtype=np.int64)
+        prev_empty_index[1:] = empty_index[:-1]
+        prev_empty_index[seq_local_index == 0] = -1
+        idle_period_start = np.where(prev_empty_index >= 0, seq_completion[seq_begin + prev_empty_index],
+                                     np.array(self.idle_period_start, dtype=np.float64)[seq_segment])
+        idle_record = new_busy_period & (seq_start >= warmup_time)
+
+        # Get the per job times and the busy and idle periods.
+        num_completed = np.bincount(seq_segment[completed], minlength=N)
+        completed_offsets = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(num_completed, out=completed_offsets[1:])
+        completed_start = seq_start[completed]
+        completed_arrival = seq_arrival[completed]
+        completion_times = seq_completion[completed]
+        job_wait_time = completed_start - completed_arrival
+        job_service_time = completion_times - completed_start
+        job_response_time = completion_times - completed_arrival
+        busy_record_offsets = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(np.bincount(seq_segment[busy_record], minlength=N), out=busy_record_offsets[1:])
+        busy_start = busy_period_start[busy_record]
+        busy_period_data = (busy_start, seq_completion[busy_record] - busy_start, busy_period_num_jobs[busy_record])
+        idle_record_offsets = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(np.bincount(seq_segment[idle_record], minlength=N), out=idle_record_offsets[1:])
+        idle_start = idle_period_start[idle_record]
+        idle_period_data = (idle_start, seq_start[idle_record] - idle_start)
+        num_stats_arrivals = np.bincount(vqk.segment_ids(new_arrival_offsets)[new_arrival_times_flat >= warmup_time],
+                                         minlength=N)
+        num_stats_departures = np.bincount(seq_segment[completed & (seq_completion >= warmup_time)], minlength=N)
+
+        # Get the change points of the jobs_waiting, jobs_receiving_service, and jobs_in_system statistics.
+        start_offsets = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(num_started, out=start_offsets[1:])
+        starts = start_times[started]
+        change_points = (
+            vqk.occupancy_change_points(new_arrival_times_flat, starts, new_arrival_offsets, start_offsets,
+                                        num_waiting),
+            vqk.occupancy_change_points(starts, completion_times, start_offsets, completed_offsets, num_pending),
+            vqk.occupancy_change_points(new_arrival_times_flat, completion_times, new_arrival_offsets,
+                                        completed_offsets, num_waiting + num_pending))
+
+        # Get the state at the end of the run.
+        in_service = seq_start[~completed], seq_job_no[~completed], seq_arrival[~completed]
+        in_service_offsets = seq_offsets - completed_offsets
+        last_busy_period_index = np.full(N, -1, dtype=np.int64)
+        last_empty_index = np.full(N, -1, dtype=np.int64)
+        has_seq = seq_offsets[1:] > seq_offsets[:-1]
+        last_busy_period_index[has_seq] = busy_period_index[seq_offsets[1:][has_seq] - 1]
+        last_empty_index[has_seq] = empty_index[seq_offsets[1:][has_seq] - 1]
+        has_waiting = num_started < num_jobs
+        next_slot = np.array(self.next_slot, dtype=np.int64)
+        next_slot[num_started > 0] = slots[(job_offsets[:-1] + num_started - 1)[num_started > 0]] + 1
+        next_slot[has_waiting] = slots[(job_offsets[:-1] + num_started)[has_waiting]]
+
+        # Record the job events of this run in time order.  The completions at a time come before the arrivals, which
+        # come before the starts.
+        if self.event_trace is not None:
+            arrival_segment = vqk.segment_ids(new_arrival_offsets)
+            arrival_job_no = (vqk.segment_local_index(new_arrival_offsets) + 1 +
+                              np.array(self.total_arrivals, dtype=np.int64)[arrival_segment])
+            event_times = np.concatenate((completion_times, new_arrival_times_flat, starts))
+            event_order = np.argsort(event_times, kind="stable")
+            self.event_trace.record_arrays(
+                event_times[event_order],
+                np.repeat([event_trace.COMPLETE_SERVICE, event_trace.ARRIVAL, event_trace.ENTER_SERVICE],
+                          [len(completion_times), len(new_arrival_times_flat), len(starts)])[event_order],
+                np.concatenate((seq_segment[completed], arrival_segment, seq_segment[is_start]))[event_order],
+                np.concatenate((seq_job_no[completed], arrival_job_no, seq_job_no[is_start]))[event_order])
+
+        # Update the statistics of the virtual queues with the change points, and the state and the other statistics of
+        # each virtual queue.
+        for series_list, (times, counts, offsets) in zip(
+                ([stats.jobs_waiting for stats in self.stats], [stats.jobs_receiving_service for stats in self.stats],
+                 [stats.jobs_in_system for stats in self.stats]), change_points):
+            stats_points = times >= warmup_time
+            stats_offsets = np.zeros(N + 1, dtype=np.int64)
+            np.cumsum(np.bincount(vqk.segment_ids(offsets)[stats_points], minlength=N), out=stats_offsets[1:])
+            qsc.TimeCountSeries.extend_segments(series_list, times[stats_points], counts[stats_points], stats_offsets)
+
+        for virt_index in range(N):
+            stats = self.stats[virt_index]
+            job_begin = job_offsets[virt_index]
+            num_queue_started = num_started[virt_index]
+            seq_begin = seq_offsets[virt_index]
+
+            # Statistics
+            begin, end = completed_offsets[virt_index], completed_offsets[virt_index + 1]
+            stats.job_wait_time.extend(job_wait_time[begin:end])
+            stats.job_service_time.extend(job_service_time[begin:end])
+            stats.job_response_time.extend(job_response_time[begin:end])
+            begin, end = busy_record_offsets[virt_index], busy_record_offsets[virt_index + 1]
+            stats.busy_period.extend(*(data[begin:end] for data in busy_period_data))
+            begin, end = idle_record_offsets[virt_index], idle_record_offsets[virt_index + 1]
+            stats.idle_period.extend(*(data[begin:end] for data in idle_period_data))
+
+            self.total_arrivals[virt_index] += int(num_new_arrivals[virt_index])
+            stats.total_arrivals += int(num_stats_arrivals[virt_index])
+            self.total_departures[virt_index] += int(num_completed[virt_index])
+            stats.total_departures += int(num_stats_departures[virt_index])
+
+            # Jobs in service
+            begin, end = in_service_offsets[virt_index], in_service_offsets[virt_index + 1]
+            if end > begin:
+                start, job_no, arrival = (data[begin:end] for data in in_service)
+                self.pending_completions[virt_index] = deque(zip(
+                    (start + service_time).tolist(), job_no.tolist(), arrival.tolist(), start.tolist()))
+            else:
+                self.pending_completions[virt_index].clear()
+            self.jobs_receiving_service[virt_index] = int(end - begin)
+
+            # Waiting jobs and the next slot
+            begin, end = job_begin + num_queue_started, job_offsets[virt_index + 1]
+            self.queue[virt_index] = self.make_job_queue(zip(job_nos[begin:end][::-1].tolist(),
+                                                             arrival_times[begin:end][::-1].tolist()))
+            if next_slot[virt_index] != self.next_slot[virt_index]:
+                self.next_slot[virt_index] = int(next_slot[virt_index])
+                self.next_slot_time[virt_index] = schedule.slot_time(virt_index, self.next_slot[virt_index])
+
+            # Busy and idle periods
+            if last_busy_period_index[virt_index] >= 0:
+                self.busy_period_start[virt_index] = float(seq_start[seq_begin + last_busy_period_index[virt_index]])
+                self.busy_period_num_jobs[virt_index] = int(seq_offsets[virt_index + 1] - seq_begin -
+                                                            last_busy_period_index[virt_index])
+            else:
+                self.busy_period_num_jobs[virt_index] += int(num_queue_started)
+            if last_empty_index[virt_index] >= 0:
+                self.idle_period_start[virt_index] = float(seq_completion[seq_begin + last_empty_index[virt_index]])
+
+        self.total_jobs_receiving_service = sum(self.jobs_receiving_service)
+        self._now = until
+        return int(num_started.sum())
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class SlotCalendarQueueingSystem(SlotQueueingSystemBase):
+    """ Slot-calendar queueing system class.  This is an alternative to the simpy engine of QueueingSystem for the
+    round-robin C-slow schedule.  The server is never stepped clock by clock.  Instead, the service slots of each
+    virtual queue are calculated arithmetically from the RoundRobinSchedule, and each virtual queue is advanced through
+    its slots and service completions by a Lindley-style recursion.
+
+    With FCFS queues, the arrival times of all streams up to the run time are generated with the ArrivalTimesGenerator,
+    and each virtual queue is advanced through the whole run at once with array operations (advance_fcfs_queues()).
+    The other service disciplines, and the runs that trace or print the job events, advance each virtual queue lazily
+    one event at a time whenever it gets a new arrival.  The arrivals of all streams are then dispatched in time order
+    from a heap of the next arrival time of each stream, which draws the interarrival times in the same order as the
+    simpy arrival processes.
+
+    The statistics are recorded with the same events and the same event order as QueueingSystem.  An arrival at the
+    same time as a slot or a service completion is handled first, unless the last arrival of its stream is less than a
+    clock before, when simpy has scheduled the slot first.  SIRO picks its random jobs in a different order than the
+    simpy engine, and the job event messages are printed in time order for each virtual queue rather than across all of
+    them. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, sim, N, C, S, Rs, arrival_distributions, f_clk, SD=QueueingSystemBase.ServiceDiscipline.FCFS,
+                 sd_random_class=None, stats_warmup_time=0, online_stats=False):
+        super().__init__(sim, N, C, S, Rs, arrival_distributions, f_clk, SD=SD, sd_random_class=sd_random_class,
+                         stats_warmup_time=stats_warmup_time, online_stats=online_stats)
+
+        # FCFS queues are advanced with array operations, unless the job events are traced or printed one at a time.
+        self.vectorized_fcfs = SD == self.ServiceDiscipline.FCFS and not self.job_event_hooks and \
+            not sim.show_job_stat_info
+
+        # Setup the buffers of the (t, c) points for the jobs_waiting, jobs_receiving_service, and jobs_in_system
+        # statistics of each virtual queue.  They are added to the statistics at the end of a run, which is much faster
+        # than appending each point as it happens.
+        self.stats_points = [([], [], []) for _ in range(N)]
+
+        # Setup the arrival times generator, or the arrival calendar with the first arrival of each stream and the time
+        # of the last arrival of each stream, which is when simpy schedules the next one.
+        if self.vectorized_fcfs:
+            self.arrival_times_generator = ArrivalTimesGenerator(arrival_distributions, self._now)
+        else:
+            self.arrival_counter = count()
+            self.arrival_calendar = []
+            self.last_arrival_time = [self._now for _ in range(N)]
+            for index in range(N):
+                heapq.heappush(self.arrival_calendar,
+                               (self._now + self.next_interarrival_time[index](), next(self.arrival_counter), index))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getstate__(self):
+        # The arrival counter only orders the calendar entries with the same time, so it is saved as its next value.
+        state = super().__getstate__()
+        if not self.vectorized_fcfs:
+            state["arrival_counter"] = next(self.arrival_counter)
+        return state
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if not self.vectorized_fcfs:
+            self.arrival_counter = count(self.arrival_counter)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run(self, until):
+        """ Run the simulation until the given simulation time.  Events at the given time are not handled, which is the
+        same as simpy. """
+        if self.vectorized_fcfs:
+            # The server only wakes up for the slots that serve a job.
+            self.server_wakeups += self.advance_fcfs_queues(self.arrival_times_generator.generate(until), until)
+            return
+
+        arrival_calendar = self.arrival_calendar
+        next_interarrival_time = self.next_interarrival_time
+
+        queue = self.queue
+        pending_completions = self.pending_completions
+        arrival_counter = self.arrival_counter
+        last_arrival_time = self.last_arrival_time
+        t_clk = self.t_clk
+
+        while arrival_calendar[0][0] < until:
+            now, _, index = heapq.heappop(arrival_calendar)
+            if queue[index] or pending_completions[index]:
+                # simpy handles the slot at the time of the arrival first if it was scheduled first, which is when the
+                # last arrival of the stream is less than a clock before the slot.  The service completions at that
+                # time are then also handled first, as they are scheduled at least a clock before it.
+                if last_arrival_time[index] > now - t_clk:
+                    self.advance_queue(index, math.nextafter(now, qsc.inf))
+                else:
+                    self.advance_queue(index, now)
+            self._now = now
+            if not queue[index]:
+                # The queue was idle, so its next slot is the first one at or after the arrival.
+                k = self.schedule.first_slot_at_or_after(index, now)
+                if k > self.next_slot[index]:
+                    self.next_slot[index] = k
+                    self.next_slot_time[index] = self.schedule.slot_time(index, k)
+            self.arrival(index)
+            last_arrival_time[index] = now
+            heapq.heappush(arrival_calendar, (now + next_interarrival_time[index](), next(arrival_counter), index))
+
+        for virt_index in range(self.N):
+            self.advance_queue(virt_index, until)
+        self._now = until
+
+        # Add the buffered points to the statistics.
+        for virt_index in range(self.N):
+            stats = self.stats[virt_index]
+            for series, points in zip((stats.jobs_waiting, stats.jobs_receiving_service, stats.jobs_in_system),
+                                      self.stats_points[virt_index]):
+                series.extend(points)
+                points.clear()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def advance_queue(self, virt_index, until):
+        """ Advance the virtual queue through its slots and service completions before the given time. """
+        queue = self.queue[virt_index]
+        pending_completions = self.pending_completions[virt_index]
+        schedule = self.schedule
+        service_time = self.C * self.t_clk
+
+        while True:
+            # Get the next slot, which is only used if there is a job waiting.
+            if queue:
+                k = self.next_slot[virt_index]
+                slot_time = self.next_slot_time[virt_index]
+            else:
+                k = None
+                slot_time = qsc.inf
+
+            # Complete service of the oldest job in service if it is next.
+            if pending_completions:
+                completion_time = pending_completions[0][0]
+                if completion_time < slot_time or \
+                        (completion_time == slot_time and schedule.completes_before_slot(k)):
+                    if completion_time >= until:
+                        return
+                    self._now = completion_time
+                    _, job_no, job_arrival_time, job_entered_service_time = pending_completions.popleft()
+                    self.complete_service(virt_index, job_no, job_arrival_time, job_entered_service_time)
+                    continue
+
+            # Serve the next job in the slot.
+            if slot_time >= until:
+                return
+            self._now = slot_time
+            self.next_slot[virt_index] = k + 1
+            self.next_slot_time[virt_index] = schedule.slot_time(virt_index, k + 1)
+            self.server_wakeups += 1
+            job_no, job_arrival_time = self.begin_service(virt_index)
+            pending_completions.append((slot_time + service_time, job_no, job_arrival_time, slot_time))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def event_arrival(self, virt_index, job_no):
+        if self.job_event_hooks:
+            self.job_event(event_trace.ARRIVAL, virt_index, job_no)
+        now = self._now
+        if now >= self.stats_warmup_time:
+            jobs_waiting = len(self.queue[virt_index])
+            points = self.stats_points[virt_index]
+            points[0].append((now, jobs_waiting))
+            points[2].append((now, jobs_waiting + self.jobs_receiving_service[virt_index]))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def event_enter_service(self, virt_index, job_no):
+        if self.job_event_hooks:
+            self.job_event(event_trace.ENTER_SERVICE, virt_index, job_no)
+        now = self._now
+        if now >= self.stats_warmup_time:
+            points = self.stats_points[virt_index]
+            points[0].append((now, len(self.queue[virt_index])))
+            points[1].append((now, self.jobs_receiving_service[virt_index]))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def event_complete_service(self, virt_index, job_no):
+        if self.job_event_hooks:
+            self.job_event(event_trace.COMPLETE_SERVICE, virt_index, job_no)
+        now = self._now
+        if now >= self.stats_warmup_time:
+            jobs_receiving_service = self.jobs_receiving_service[virt_index]
+            points = self.stats_points[virt_index]
+            points[1].append((now, jobs_receiving_service))
+            points[2].append((now, len(self.queue[virt_index]) + jobs_receiving_service))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class ArrivalTimesGenerator:
+    """ Arrival times generator class.  The arrival times of the N streams are generated in blocks up to a given time
+    instead of one at a time.  A stream with its own random class draws its interarrival times in blocks and the arrival
+    times are their cumulative sum.  Streams that share a random class are merged in time order with a heap of their
+    next arrival times, because their draws interleave in the shared random class.  Either way the interarrival times
+    are drawn in the same order as the simpy arrival processes, so the arrival times are the same.  The independent
+    streams are the ones that the other engines draw in blocks (distributions.block_sampled_streams()), and they are
+    taken from the same blocks of a distributions.SampleBuffer, so the samples are the same for any distribution. """
+
+    BLOCK_SIZE_MARGIN = 16
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, arrival_distributions, now=0):
+        self.arrival_distributions = arrival_distributions
+        self.next_interarrival_time = [dist.random_sample for dist in arrival_distributions]
+        independent_streams = distributions.block_sampled_streams(arrival_distributions)
+
+        # Setup the arrival times that are generated but not returned yet for each independent stream, and the arrival
+        # calendar of the next arrival time of each shared stream.  The first arrivals are drawn in stream order.
+        self.sample_buffers = {}
+        self.future_arrival_times = {}
+        self.arrival_counter = count()
+        self.arrival_calendar = []
+        for index, dist in enumerate(arrival_distributions):
+            if index in independent_streams:
+                self.sample_buffers[index] = distributions.SampleBuffer(dist)
+                self.future_arrival_times[index] = now + self.sample_buffers[index].take(1)
+            else:
+                t = now + self.next_interarrival_time[index]()
+                heapq.heappush(self.arrival_calendar, (t, next(self.arrival_counter), index))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getstate__(self):
+        # The arrival counter only orders the calendar entries with the same time, so it is saved as its next value.
+        state = self.__dict__.copy()
+        state["arrival_counter"] = next(self.arrival_counter)
+        return state
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.arrival_counter = count(self.arrival_counter)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def generate(self, until):
+        """ Generate the arrival times before the given time.  Returns a list of the arrival times array of each
+        stream. """
+        arrival_times = [None for _ in self.arrival_distributions]
+
+        for index in self.future_arrival_times:
+            arrival_times[index] = self.generate_independent(index, until)
+
+        # Merge the shared streams in time order.
+        shared_arrival_times = defaultdict(list)
+        arrival_calendar = self.arrival_calendar
+        next_interarrival_time = self.next_interarrival_time
+        arrival_counter = self.arrival_counter
+        while arrival_calendar and arrival_calendar[0][0] < until:
+            t, _, index = arrival_calendar[0]
+            shared_arrival_times[index].append(t)
+            heapq.heapreplace(arrival_calendar, (t + next_interarrival_time[index](), next(arrival_counter), index))
+
+        for index in range(len(arrival_times)):
+            if arrival_times[index] is None:
+                arrival_times[index] = np.array(shared_arrival_times.get(index, ()), dtype=np.float64)
+        return arrival_times
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def generate_independent(self, index, until):
+        """ Generate the arrival times of an independent stream before the given time. """
+        blocks = [self.future_arrival_times[index]]
+        take = self.sample_buffers[index].take
+        mean = self.arrival_distributions[index].mean()
+        t = blocks[-1][-1]
+        while t < until:
+            # Draw enough interarrival times to reach the given time on average.  The cumulative sum adds the
+            # interarrival times one at a time, which is the same rounding as the simpy arrival process.
+            block_size = int((until - t) / mean) + self.BLOCK_SIZE_MARGIN
+            samples = take(block_size)
+            samples[0] += t
+            blocks.append(np.cumsum(samples))
+            t = blocks[-1][-1]
+
+        times = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+        split = np.searchsorted(times, until, side="left")
+        self.future_arrival_times[index] = times[split:]
+        return times[:split]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class ArrivalTraceReplay:
+    """ Arrival trace replay class.  The arrival times of the N streams are read from an arrival trace file
+    (arrival_trace_cache) instead of being generated, with the same generate() as ArrivalTimesGenerator.  The trace is
+    memory mapped, so the arrival times are not drawn again or read into memory in full.  A trace generated by
+    ArrivalTimesGenerator gives the same arrival times as the generator up to the horizon of the trace. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, trace_path, N):
+        self.trace_path = trace_path
+        self.open()
+        if len(self.offsets) != N + 1:
+            raise qsc.QueueingSystemError("Arrival trace %s has %d streams instead of %d." %
+                                          (repr(trace_path), len(self.offsets) - 1, N))
+
+        # Position of the next arrival of each stream in the trace.
+        self.position = self.offsets[:-1].tolist()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def open(self):
+        self.times, self.offsets, self.horizon = arrival_trace_cache.open_trace(self.trace_path)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getstate__(self):
+        # The memory mapped trace is opened again when a checkpoint is loaded.
+        state = self.__dict__.copy()
+        del state["times"]
+        del state["offsets"]
+        return state
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def generate(self, until):
+        """ Get the arrival times before the given time.  Returns a list of the arrival times array of each stream. """
+        if until > self.horizon:
+            raise qsc.QueueingSystemError("The run until %r goes past the horizon %r of arrival trace %s." %
+                                          (until, self.horizon, repr(self.trace_path)))
+        times = self.times
+        arrival_times = []
+        for index, start in enumerate(self.position):
+            segment = times[start:self.offsets[index + 1]]
+            stop = start + int(np.searchsorted(segment, until, side="left"))
+            arrival_times.append(times[start:stop])
+            self.position[index] = stop
+        return arrival_times
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class VectorizedQueueingSystem(SlotQueueingSystemBase):
+    """ Vectorized queueing system class.  This is an alternative to the simpy engine of QueueingSystem for the
+    round-robin C-slow schedule with FCFS queues.  Each run generates the arrival times of all streams up to the run
+    time with the ArrivalTimesGenerator, and advances all of the virtual queues at once with the array operations of
+    advance_fcfs_queues(), which is the same as the FCFS queues of SlotCalendarQueueingSystem.  The server wakeups are
+    all of the slots of the run, as for the simpy server, rather than only the slots that serve a job.
+
+    The state at the end of a run (waiting jobs, jobs in service, busy and idle periods) carries over to the next run,
+    so the simulation can be run in steps.  The job event and job stat messages are not printed.
+
+    With an arrival trace, the arrival times are replayed from the trace file with ArrivalTraceReplay instead of being
+    generated from the arrival distributions. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, sim, N, C, S, Rs, arrival_distributions, f_clk, SD=QueueingSystemBase.ServiceDiscipline.FCFS,
+                 sd_random_class=None, stats_warmup_time=0, online_stats=False, arrival_trace=None):
+        super().__init__(sim, N, C, S, Rs, arrival_distributions, f_clk, SD=SD, sd_random_class=sd_random_class,
+                         stats_warmup_time=stats_warmup_time, online_stats=online_stats)
+
+        if SD != self.ServiceDiscipline.FCFS:
+            raise qsc.QueueingSystemError("The vectorized engine only supports the FCFS queue discipline, not %s." %
+                                          repr(SD))
+
+        # Setup the arrival times generator.
+        if arrival_trace is None:
+            self.arrival_times_generator = ArrivalTimesGenerator(arrival_distributions, self._now)
+        else:
+            self.arrival_times_generator = ArrivalTraceReplay(arrival_trace, N)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run(self, until):
+        """ Run the simulation until the given simulation time.  Events at the given time are not handled, which is the
+        same as simpy. """
+        # The server wakes up for each slot from the current time.
+        virt_indices = np.arange(self.N)
+        first_slots = self.schedule.first_slots_at_or_after(virt_indices, np.full(self.N, self._now))
+        self.server_wakeups += int(np.sum(self.schedule.first_slots_at_or_after(virt_indices, np.full(self.N, until)) -
+                                          first_slots))
+        self.advance_fcfs_queues(self.arrival_times_generator.generate(until), until)
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 class QueueingSystemSimulation:
-    PROGRESS_PCT_STEPS = 10        # in percent
+    PROGRESS_INTERVAL = 10.0       # in seconds of wall-clock time
+    PROGRESS_CHECK_STEPS = 100     # number of steps of the simulation time at which the progress interval is checked
+
+    # ------------------------------------------------------------------------------------------------------------------
+    class Engine(Enum):
+        SIMPY = 1
+        SLOT_CALENDAR = 2
+        VECTORIZED = 3
+
+    VALID_ENGINES = tuple(Engine.__members__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    class Warmup(Enum):
+        FIXED = 1
+        MSER5 = 2
+
+    VALID_WARMUPS = tuple(Warmup.__members__)
+
+    WARMUP_TRACE_INTERVALS = 250    # Number of intervals of the trace for the warmup detection
+    WARMUP_MSER_BATCH_SIZE = 5      # Number of trace intervals in an MSER batch
+
+    CHECKPOINT_FORMAT = 9           # Format of the checkpoint files
+
+    # Attributes of the run that are saved in a checkpoint with the queueing system.
+    CHECKPOINT_RUN_ATTRIBUTES = ("warmup_trace_times", "warmup_trace_arrivals", "warmup_trace_departures",
+                                 "batch_means", "sequential_time", "sequential_totals", "peak_stats_buffer_size")
+
+    # ------------------------------------------------------------------------------------------------------------------
+    class StoppingMetric(Enum):
+        MEAN_JOB_WAIT_TIME = 1
+        MEAN_JOBS_WAITING = 2
+
+    VALID_STOPPING_METRICS = tuple(StoppingMetric.__members__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    class PrecisionTarget(namedtuple("PrecisionTarget", [
+        "metric",               # StoppingMetric, pooled over all of the virtual queues
+        "rel_half_width",       # Target relative half-width of the confidence interval
+        "chunk_time",           # Simulation time of a chunk
+        "confidence",           # Confidence level of the confidence interval
+        "min_batches",          # Minimum number of batches (see qsc.BatchMeans)
+    ], defaults=(0.95, 10))):
+        """ Precision target of the sequential stopping rule.  The simulation runs in chunks of chunk_time until the
+        relative half-width of the batch means confidence interval of the metric is at most rel_half_width.  It is a
+        nested class instead of a namedtuple attribute so that it can be pickled for the batch worker processes. """
+        __slots__ = ()
 
     # ------------------------------------------------------------------------------------------------------------------
     def __init__(self, N, C, S, Rs, arrival_distributions, f_clk, SD=QueueingSystem.ServiceDiscipline.FCFS,
                  sd_random_class=None, stats_warmup_time=0, show_server_info=False, show_job_event_info=False,
-                 show_job_stat_info=False, show_progress_info=False):
+                 show_job_stat_info=False, show_progress_info=False, engine=Engine.SIMPY, online_stats=False,
+                 skip_idle_clocks=False, completion_ring=False, merged_arrivals=False, warmup=Warmup.FIXED,
+                 arrival_trace=None, scheduler=QueueingSystem.Scheduler.ROUND_ROBIN, event_trace=None,
+                 progress_interval=PROGRESS_INTERVAL):
+        """
+        engine is the simulation engine and is one of:
+            SIMPY is the simpy discrete event simulation of the server clock by clock (QueueingSystem).
+            SLOT_CALENDAR calculates the service slots arithmetically (SlotCalendarQueueingSystem).
+            VECTORIZED simulates all of the FCFS queues with array operations (VectorizedQueueingSystem).
+        online_stats accumulates the statistics of the queue counts online instead of storing their change points.
+        skip_idle_clocks makes the simpy real server process skip the clocks of empty queues.
+        completion_ring makes the simpy real server process retire the service completions itself.
+        merged_arrivals generates the simpy arrivals of all of the streams in one process.
+        warmup is the warmup mode and is one of:
+            FIXED discards the statistics before stats_warmup_time.
+            MSER5 records the statistics from time 0 and a trace of the mean number of jobs in the system, and then
+            discards the statistics before the truncation point chosen by the MSER-5 rule on the trace.  The
+            truncation point is in stats_warmup_time after the run.
+        arrival_trace is the path of an arrival trace (arrival_trace_cache) that the VECTORIZED engine replays instead
+        of generating the arrival times.  The run cannot go past the horizon of the trace.
+        The run also cannot go past the horizon of a trace arrival distribution (distributions.TraceDistribution).
+        scheduler is the scheduler of the real server and is one of:
+            ROUND_ROBIN is the round-robin C-slow schedule of the groups of C queues.
+            RR_SKIP and MOST_FULL are the work-conserving schedulers of ScheduledQueueingSystem, which need the SIMPY
+            engine without skip_idle_clocks, S = 0, and Rs = 1.
+        event_trace is an event_trace.EventTrace that records the job events and the server events as binary records.
+        It is flushed at the end of each run.  The SLOT_CALENDAR engine advances each virtual queue on its own, so its
+        events are in time order only within each virtual queue.  The VECTORIZED engine records the job events of each
+        run step in time order, and it has no server events.
+        With show_progress_info, the progress of the run (the percentage of the simulation time, the simulated clocks
+        and the job events per second of wall-clock time, and the estimated time remaining) is printed every
+        progress_interval seconds of wall-clock time, and at the end of the run.
+        """
+
+        # Warmup mode.
+        if warmup == self.Warmup.MSER5:
+            if online_stats:
+                raise qsc.QueueingSystemError("The MSER5 warmup needs the stored statistics (online_stats=False).")
+            stats_warmup_time = 0
+        elif warmup != self.Warmup.FIXED:
+            raise qsc.QueueingSystemError("Warmup (%s) is not one of %s" % (repr(warmup), repr(self.VALID_WARMUPS)))
+        self.warmup = warmup
+
+        # Checkpoint options of the run.
+        self.checkpoint_file = None
+        self.checkpoint_interval = None
+        self.resumed = False
+
+        # Peak number of stored statistics entries.
+        self.peak_stats_buffer_size = 0
 
         # Show options.
         self.show_server_info = show_server_info
         self.show_job_event_info = show_job_event_info
         self.show_job_stat_info = show_job_stat_info
         self.show_progress_info = show_progress_info
+        self.progress_interval = progress_interval
+        self.event_trace = event_trace
 
         # Setup callbacks.
         self.callbacks_before_run = []
         self.callbacks_after_run = []
 
         # Create environment and queueing system.
-        self.env = simpy.Environment()
-        self.system = QueueingSystem(self, N, C, S, Rs, arrival_distributions, f_clk, SD=SD,
-                                     sd_random_class=sd_random_class, stats_warmup_time=stats_warmup_time)
-
-        # Register the monitor progress process.
-        self.env.process(self.process_monitor_progress())
+        self.engine = engine
+        if arrival_trace is not None and engine != self.Engine.VECTORIZED:
+            raise qsc.QueueingSystemError("An arrival trace can only be replayed by the VECTORIZED engine, not %s." %
+                                          repr(engine))
+        if scheduler != QueueingSystem.Scheduler.ROUND_ROBIN and (engine != self.Engine.SIMPY or skip_idle_clocks):
+            raise qsc.QueueingSystemError("The %s scheduler needs the SIMPY engine without skip_idle_clocks." %
+                                          scheduler.name)
+        if engine == self.Engine.SIMPY and scheduler != QueueingSystem.Scheduler.ROUND_ROBIN:
+            self.env = simpy.Environment()
+            self.system = ScheduledQueueingSystem(self, N, C, S, Rs, arrival_distributions, f_clk, SD=SD,
+                                                  sd_random_class=sd_random_class,
+                                                  stats_warmup_time=stats_warmup_time, online_stats=online_stats,
+                                                  completion_ring=completion_ring, merged_arrivals=merged_arrivals,
+                                                  scheduler=scheduler)
+
+            # Register the monitor progress process.
+            self.env.process(self.process_monitor_progress())
+        elif engine == self.Engine.SIMPY:
+            self.env = simpy.Environment()
+            self.system = QueueingSystem(self, N, C, S, Rs, arrival_distributions, f_clk, SD=SD,
+                                         sd_random_class=sd_random_class, stats_warmup_time=stats_warmup_time,
+                                         online_stats=online_stats, skip_idle_clocks=skip_idle_clocks,
+                                         completion_ring=completion_ring, merged_arrivals=merged_arrivals)
+
+            # Register the monitor progress process.
+            self.env.process(self.process_monitor_progress())
+        elif engine == self.Engine.SLOT_CALENDAR:
+            self.env = None
+            self.system = SlotCalendarQueueingSystem(self, N, C, S, Rs, arrival_distributions, f_clk, SD=SD,
+                                                     sd_random_class=sd_random_class,
+                                                     stats_warmup_time=stats_warmup_time,
+                                                     online_stats=online_stats)
+        elif engine == self.Engine.VECTORIZED:
+            self.env = None
+            self.system = VectorizedQueueingSystem(self, N, C, S, Rs, arrival_distributions, f_clk, SD=SD,
+                                                   sd_random_class=sd_random_class,
+                                                   stats_warmup_time=stats_warmup_time,
+                                                   online_stats=online_stats, arrival_trace=arrival_trace)
+        else:
+            raise qsc.QueueingSystemError("Engine (%s) is not one of %s" % (repr(engine), repr(self.VALID_ENGINES)))
 
     # ------------------------------------------------------------------------------------------------------------------
     def process_monitor_progress(self):
-        """ Show progress process.  This process monitors the progress of the simulation and reports
-        at what percentage of the simulation is complete. """
-        timeout = self.sim_time * (self.PROGRESS_PCT_STEPS / 100)
+        """ Show progress process.  This process wakes up at each progress check step of the simulation time and
+        reports the progress when the progress interval of wall-clock time has passed.  The simulation stops before the
+        step at the end of the run, which is reported by run(). """
         if self.show_progress_info:
-            Done = False
-            while not Done:
-                if self.env.now + timeout >= self.sim_time:
-                    yield self.env.timeout(self.sim_time - self.env.now - 1e-15)
-                    Done = True
-                else:
-                    yield self.env.timeout(timeout)
-                self.print_simulation_message("%3.f %%" % (self.env.now / self.sim_time * 100))
+            timeout = self.sim_time / self.PROGRESS_CHECK_STEPS
+            while True:
+                yield self.env.timeout(timeout)
+                self.report_progress()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def start_progress(self):
+        """ Start measuring the progress of the run from the current simulation time and wall-clock time. """
+        self.progress_start_wall_time = time.perf_counter()
+        self.progress_last_wall_time = self.progress_start_wall_time
+        self.progress_start_time = self.now
+        self.progress_start_events = self.system.num_events()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def report_progress(self, msg="", force=False):
+        """ Print the progress of the run if the progress interval has passed since the last report, or if force is
+        set.  The rates are averaged from the start of the run (or from the checkpoint it resumed from), and the
+        estimated time remaining is for the rest of the simulation time at the average clock rate. """
+        if not self.show_progress_info:
+            return
+        wall_time = time.perf_counter()
+        if not force and wall_time - self.progress_last_wall_time < self.progress_interval:
+            return
+        self.progress_last_wall_time = wall_time
+        elapsed_time = wall_time - self.progress_start_wall_time
+        clocks = (self.now - self.progress_start_time) * self.system.f_clk
+        events = self.system.num_events() - self.progress_start_events
+        if elapsed_time > 0 and clocks > 0:
+            clocks_per_second = clocks / elapsed_time
+            events_per_second = events / elapsed_time
+            remaining_time = max(self.sim_time - self.now, 0) * self.system.f_clk / clocks_per_second
+        else:
+            clocks_per_second = events_per_second = remaining_time = qsc.nan
+        self.print_simulation_message("%3.f %%  %.4g clocks/s  %.4g events/s  elapsed %s  ETA %s%s" % (
+            self.now / self.sim_time * 100, clocks_per_second, events_per_second, utils.format_duration(elapsed_time),
+            utils.format_duration(remaining_time), msg))
 
     # ------------------------------------------------------------------------------------------------------------------
     def execute_callbacks_before_run(self):
@@ -363,24 +1746,321 @@ class QueueingSystemSimulation:
             callback(self)
 
     # ------------------------------------------------------------------------------------------------------------------
-    def run(self, sim_time):
-        # Save the total simulation time for the monitor_progress process.
+    def run(self, sim_time, precision=None, checkpoint_file=None, checkpoint_interval=None):
+        """ Run the simulation until sim_time.  With a precision target (PrecisionTarget), the simulation stops as soon
+        as the target is met, and sim_time is the maximum simulation time.
+
+        With a checkpoint file, the state of the simulation is saved to the file every checkpoint_interval of simulation
+        time, and if the file exists when the run starts, the run resumes from the state in it.  A resumed run gives the
+        same results as a run with the same checkpoint interval that was not interrupted, which are also the results
+        without checkpoints except for the last bits of the online job time statistics of the vectorized engine, as
+        they are updated in blocks of the run steps.  The simpy engine cannot be checkpointed. """
+        if precision is not None and self.warmup == self.Warmup.MSER5:
+            raise qsc.QueueingSystemError("The MSER5 warmup cannot be used with a precision target.")
+        trace_horizon = min((dist.horizon for dist in self.system.arrival_distributions
+                             if isinstance(dist, distributions.TraceDistribution)), default=math.inf)
+        if sim_time > trace_horizon:
+            raise qsc.QueueingSystemError("The simulation time %r goes past the horizon %r of the arrival trace." %
+                                          (sim_time, trace_horizon))
+        if checkpoint_file is not None:
+            if self.env is not None:
+                raise qsc.QueueingSystemError("The simpy engine cannot be checkpointed.")
+            if checkpoint_interval is None or checkpoint_interval <= 0:
+                raise qsc.QueueingSystemError("Checkpoint interval (%s) is not positive." % repr(checkpoint_interval))
+
+        # Save the total simulation time for the progress reports.
         self.sim_time = sim_time
+        self.precision = precision
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
 
         # Run the simulation.
         t1 = time.time()
-        self.execute_callbacks_before_run()
-        self.env.run(until=sim_time)
+        self.resumed = checkpoint_file is not None and os.path.exists(checkpoint_file)
+        if self.resumed:
+            self.load_checkpoint(checkpoint_file)
+        else:
+            self.execute_callbacks_before_run()
+        if checkpoint_file is not None:
+            self.next_checkpoint_time = self.now + checkpoint_interval
+        if self.show_progress_info:
+            self.start_progress()
+
+        if precision is not None:
+            self.run_sequential(sim_time, precision)
+        elif self.warmup == self.Warmup.MSER5:
+            self.run_warmup_trace(sim_time)
+        else:
+            self.run_progress_steps(sim_time)
+        self.report_progress(force=True)
         self.execute_callbacks_after_run()
+        if self.warmup == self.Warmup.MSER5:
+            self.truncate_warmup()
+        if self.event_trace is not None:
+            self.event_trace.flush()
         execution_time = time.time() - t1
 
         # Return.
         return execution_time
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def run_system(self, until):
+        """ Run the queueing system until the given time, and save a checkpoint at each checkpoint time before it.
+        Nothing is run if the system is already at the given time, which is the case for the steps of a run that were
+        done before the checkpoint it resumed from. """
+        system = self.system
+        if self.checkpoint_file is not None:
+            while self.next_checkpoint_time < until:
+                system.run(self.next_checkpoint_time)
+                self.update_peak_stats_buffer_size()
+                self.save_checkpoint(self.checkpoint_file)
+                self.next_checkpoint_time += self.checkpoint_interval
+        if until > system.now:
+            system.run(until)
+        self.update_peak_stats_buffer_size()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run_progress_steps(self, until):
+        """ Run the queueing system until the given time.  There is no simpy environment for the monitor progress
+        process of the other engines, so with show_progress_info they run in the progress check steps of the simulation
+        time instead, and the progress is reported after each step. """
+        if self.env is not None or not self.show_progress_info:
+            self.run_system(until)
+            return
+        num_steps = self.PROGRESS_CHECK_STEPS
+        for step in range(1, num_steps + 1):
+            step_time = self.sim_time * step / num_steps
+            if step_time >= until:
+                break
+            if step_time > self.now:
+                self.run_system(step_time)
+                self.report_progress()
+        self.run_system(until)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def update_peak_stats_buffer_size(self):
+        """ Update the peak number of stored statistics entries of the virtual queues (qsc.QueueStats.buffer_size()).
+        The entries only grow during a run, so it is updated at the end of each step of the run. """
+        size = sum(stats.buffer_size() for stats in self.system.stats)
+        self.peak_stats_buffer_size = max(self.peak_stats_buffer_size, size)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run_sequential(self, max_sim_time, precision):
+        """ Run the simulation in chunks with a sequential stopping rule.  Each chunk after the warmup adds its
+        observations of the precision metric to the batch means (self.batch_means), and the simulation stops after the
+        first chunk that meets the precision target, or at max_sim_time.  The progress is kept in sequential_time and
+        sequential_totals, which are the end of the last chunk and the totals of the metric there, so a resumed run
+        continues with the same chunks. """
+        if not isinstance(precision.metric, self.StoppingMetric):
+            raise qsc.QueueingSystemError("Stopping metric (%s) is not one of %s" %
+                                          (repr(precision.metric), repr(self.VALID_STOPPING_METRICS)))
+        if precision.chunk_time <= 0:
+            raise qsc.QueueingSystemError("Chunk time (%s) is not positive." % repr(precision.chunk_time))
+        system = self.system
+
+        # The observations start at the end of the warmup.
+        if not self.resumed:
+            self.batch_means = qsc.BatchMeans(min_batches=precision.min_batches, confidence=precision.confidence)
+            self.sequential_time = min(max(system.stats_warmup_time, system.now), max_sim_time)
+            self.sequential_totals = None
+        if self.sequential_totals is None:
+            self.run_system(self.sequential_time)
+            self.sequential_totals = self.precision_metric_totals(precision.metric, self.sequential_time)
+
+        while self.sequential_time < max_sim_time:
+            t = min(self.sequential_time + precision.chunk_time, max_sim_time)
+            self.run_system(t)
+            totals = self.precision_metric_totals(precision.metric, t)
+            self.batch_means.add(totals[0] - self.sequential_totals[0], totals[1] - self.sequential_totals[1])
+            self.sequential_time, self.sequential_totals = t, totals
+
+            rel_half_width = self.batch_means.relative_half_width()
+            self.report_progress("  relative half-width %.4g" % rel_half_width)
+            if rel_half_width <= precision.rel_half_width:
+                break
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def precision_metric_totals(self, metric, t):
+        """ Get the total and the weight of the observations of the precision metric up to time t, summed over all of
+        the virtual queues.  The mean is the total divided by the weight. """
+        stats = self.system.stats
+        if metric == self.StoppingMetric.MEAN_JOB_WAIT_TIME:
+            return (sum(queue_stats.job_wait_time.sum() for queue_stats in stats),
+                    sum(len(queue_stats.job_wait_time) for queue_stats in stats))
+        else:
+            start_time = self.system.stats_warmup_time
+            return (sum(queue_stats.jobs_waiting.integral(t) for queue_stats in stats),
+                    len(stats) * max(t - start_time, 0))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run_warmup_trace(self, sim_time):
+        """ Run the simulation for the warmup detection.  The simulation stops at each candidate truncation point,
+        which is each MSER batch boundary in the first half of the trace, to save the number of arrivals and departures
+        of each virtual queue there.  The trace of the number of jobs in the system is calculated from the statistics
+        after the run, so the simulation runs through the second half without stopping. """
+        system = self.system
+        num_intervals = self.WARMUP_TRACE_INTERVALS
+        batch_size = self.WARMUP_MSER_BATCH_SIZE
+        num_candidates = num_intervals // batch_size // 2 + 1
+        if not self.resumed:
+            self.warmup_trace_times = [sim_time * interval / num_intervals for interval in range(num_intervals + 1)]
+            self.warmup_trace_times[0] = float(system.now)
+            self.warmup_trace_times[-1] = sim_time
+            self.warmup_trace_arrivals = []
+            self.warmup_trace_departures = []
+        for candidate in range(len(self.warmup_trace_arrivals), num_candidates):
+            if candidate > 0:
+                self.run_system(self.warmup_trace_times[candidate * batch_size])
+            self.warmup_trace_arrivals.append(list(system.total_arrivals))
+            self.warmup_trace_departures.append(list(system.total_departures))
+            self.report_progress()
+        self.run_progress_steps(sim_time)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def checkpoint_config(self):
+        """ Get the configuration of the simulation and the run that a checkpoint must match to be resumed. """
+        system = self.system
+        return {
+            "engine": self.engine.name,
+            "parameters": (system.N, system.C, system.S, system.Rs, system.f_clk, system.SD.name),
+            "arrival_distributions": [(type(dist).__name__, dist.mean(), dist.stdev())
+                                      for dist in system.arrival_distributions],
+            "online_stats": type(system.stats[0].jobs_waiting).__name__,
+            "warmup": (self.warmup.name, system.stats_warmup_time),
+            "run": (self.sim_time, self.precision),
+        }
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def save_checkpoint(self, checkpoint_file):
+        """ Save the state of the queueing system and of the run to the checkpoint file.  The file is written to a
+        temporary file first and then renamed, so an interrupted save leaves the previous checkpoint. """
+        checkpoint = {
+            "format": self.CHECKPOINT_FORMAT,
+            "config": self.checkpoint_config(),
+            "system": self.system,
+            "run": {name: getattr(self, name) for name in self.CHECKPOINT_RUN_ATTRIBUTES if hasattr(self, name)},
+        }
+        temp_file = checkpoint_file + ".tmp"
+        with open(temp_file, "wb") as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, checkpoint_file)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def load_checkpoint(self, checkpoint_file):
+        """ Replace the queueing system and the state of the run with the ones in the checkpoint file. """
+        with open(checkpoint_file, "rb") as f:
+            checkpoint = pickle.load(f)
+        if checkpoint.get("format") != self.CHECKPOINT_FORMAT:
+            raise qsc.QueueingSystemError("Checkpoint file %s has format %s, not %s." %
+                                          (repr(checkpoint_file), repr(checkpoint.get("format")),
+                                           repr(self.CHECKPOINT_FORMAT)))
+        if checkpoint["config"] != self.checkpoint_config():
+            raise qsc.QueueingSystemError("Checkpoint file %s is for a different simulation or run." %
+                                          repr(checkpoint_file))
+        self.system = checkpoint["system"]
+        self.system.sim = self
+        self.system.set_event_hooks()
+        for name, value in checkpoint["run"].items():
+            setattr(self, name, value)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def truncate_warmup(self):
+        """ Choose the warmup truncation point with the MSER-5 rule and discard the statistics before it.  The
+        observations are the mean number of jobs in the system over all of the virtual queues in each trace
+        interval. """
+        system = self.system
+        trace_times = np.array(self.warmup_trace_times)
+        areas = sum(stats.jobs_in_system.cumulative_integral(trace_times) for stats in system.stats)
+        observations = np.diff(areas) / np.diff(trace_times)
+        index = qsc.mser_truncation(observations, batch_size=self.WARMUP_MSER_BATCH_SIZE)
+        candidate = index // self.WARMUP_MSER_BATCH_SIZE
+        system.truncate_stats(self.warmup_trace_times[index], self.warmup_trace_arrivals[candidate],
+                              self.warmup_trace_departures[candidate])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def stats_warmup_time(self):
+        return self.system.stats_warmup_time
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def now(self):
+        return self.system.now
+
     # ------------------------------------------------------------------------------------------------------------------
     def print_simulation_message(self, msg):
         """ Formatted simulation message print function. """
-        print("[%s]  %s\n" % (("%.2f" % self.env.now).rjust(9), msg), end="")
+        print("[%s]  %s\n" % (("%.2f" % self.now).rjust(9), msg), end="")
+
+
+# ######################################################################################################################
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class BatchProgress:
+    """ Progress of the runs of a batch in a concurrent executor.  The batch waits for the results of the runs with
+    result(), which prints a roll-up of the batch every interval seconds of wall-clock time while it waits:  the number
+    of runs that are done and in flight, the simulated clocks per second of the finished runs over the wall-clock time
+    of the batch, and the estimated time remaining for the clocks of the runs that are not done at that rate. """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, interval=None, max_workers=None):
+        """ interval is the wall-clock time between the reports in seconds.  None disables the reports.  max_workers is
+        the number of worker processes of the executor, which bounds the number of runs in flight, because the executor
+        also marks the runs that are queued for the workers as running. """
+        self.interval = interval
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count()
+        self.runs = []
+        self.start_time = time.perf_counter()
+        self.last_report_time = self.start_time
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def add(self, future, sim_clocks):
+        """ Add the future of a run of sim_clocks clocks (the maximum number of clocks with a precision target). """
+        self.runs.append((future, sim_clocks))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def result(self, future):
+        """ Wait for the result of the future of a run, and report the progress of the batch while waiting. """
+        if self.interval is not None:
+            while True:
+                timeout = max(self.last_report_time + self.interval - time.perf_counter(), 0)
+                done, _ = concurrent.futures.wait([future], timeout=timeout)
+                if done:
+                    break
+                self.report()
+        return future.result()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def report(self):
+        """ Print the progress of the batch. """
+        self.last_report_time = time.perf_counter()
+        elapsed_time = self.last_report_time - self.start_time
+        num_done = num_in_flight = 0
+        done_clocks = remaining_clocks = 0
+        for future, sim_clocks in self.runs:
+            if future.done():
+                num_done += 1
+                result = None
+                if not future.cancelled() and future.exception() is None:
+                    result = future.result()
+                if result is not None:
+                    done_clocks += result["sim_results"]["sim_clocks"]
+                else:
+                    done_clocks += sim_clocks
+            else:
+                if future.running():
+                    num_in_flight += 1
+                remaining_clocks += sim_clocks
+        num_in_flight = min(num_in_flight, self.max_workers)
+        if elapsed_time > 0 and done_clocks > 0:
+            clocks_per_second = done_clocks / elapsed_time
+            remaining_time = remaining_clocks / clocks_per_second
+        else:
+            clocks_per_second = remaining_time = qsc.nan
+        print("[batch]  %d/%d runs done, %d in flight  %.4g clocks/s  elapsed %s  ETA %s\n" % (
+            num_done, len(self.runs), num_in_flight, clocks_per_second, utils.format_duration(elapsed_time),
+            utils.format_duration(remaining_time)), end="")
 
 
 # ######################################################################################################################
@@ -399,16 +2079,100 @@ class QueueingSystemSimulationBatch:
         "f_clk",
         "A_dist",
         "lambd",
-        "sim_clocks",
-    ])
+        "sim_clocks",           # Number of clocks, or the maximum number of clocks with a precision target
+        "precision",            # QueueingSystemSimulation.PrecisionTarget of the sequential stopping rule, or None
+    ], defaults=(None,))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    class Profile(Enum):
+        CPROFILE = 1        # cProfile statistics of the run, saved for pstats
+        TRACEMALLOC = 2     # tracemalloc snapshot at the end of the run
+
+    VALID_PROFILES = tuple(Profile.__members__)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    class ArrivalSubstreams(Enum):
+        SHARED = 1          # The N streams of a replication draw from one MT19937 substream in the order of the events
+        PER_STREAM = 2      # Each stream of a replication draws from its own MT19937 substream, in blocks
+
+    VALID_ARRIVAL_SUBSTREAMS = tuple(ArrivalSubstreams.__members__)
 
     # ------------------------------------------------------------------------------------------------------------------
     def __init__(self, detail_csv_file, summary_csv_file, max_workers=None, skip_csv_headers=False,
-                 csv_file_open_mode="w"):
+                 csv_file_open_mode="w", engine=QueueingSystemSimulation.Engine.SIMPY,
+                 warmup=QueueingSystemSimulation.Warmup.FIXED, checkpoint_dir=None, checkpoint_interval_clocks=1000000,
+                 arrival_trace_dir=None, SD=QueueingSystem.ServiceDiscipline.FCFS,
+                 scheduler=QueueingSystem.Scheduler.ROUND_ROBIN, profile=None, profile_detail_index=None,
+                 progress_interval=None, arrival_substreams=ArrivalSubstreams.SHARED, online_stats=False):
+        """
+        SD is the service discipline of the runs.  The SIRO picks of each replication are drawn from their own random
+        substream, which counts down from the last substream, so that the arrival substreams are the same for every
+        service discipline.  The VECTORIZED engine only supports FCFS.
+
+        scheduler is the scheduler of the real server.  The work-conserving schedulers (RR_SKIP and MOST_FULL) need the
+        SIMPY engine and experiments with S = 0 and Rs = 1.
+
+        checkpoint_dir is the directory of the checkpoint files of the runs, which are saved every
+        checkpoint_interval_clocks.  A run that finds its checkpoint file resumes from it, so running a batch again
+        after it was killed continues the runs that did not finish.  The checkpoint file of a run is deleted when the
+        run finishes.  None disables the checkpoints.
+
+        arrival_trace_dir is the directory of an arrival trace cache (arrival_trace_cache).  The arrival times of each
+        distinct set of arrival parameters and random states are generated once, up to sim_clocks, and the runs replay
+        them from the memory mapped trace, which saves drawing them again for each Rs of a sweep.  It needs the
+        VECTORIZED engine.  None generates the arrival times in each run.
+
+        profile is a profile mode (Profile) for the run with the sim_detail_index profile_detail_index.  CPROFILE saves
+        the cProfile statistics of the run to <detail_csv_file>.<sim_detail_index>.prof, and TRACEMALLOC saves a
+        tracemalloc snapshot of the memory that is allocated at the end of the run to
+        <detail_csv_file>.<sim_detail_index>.tracemalloc.  The top entries of either are also printed.  The profiling
+        slows the run down, so its times in the result files are not comparable to the other runs.  None disables it.
+
+        progress_interval is the wall-clock time in seconds between the progress reports of the batch (BatchProgress),
+        which are printed while the batch waits for the results of its runs.  None disables them.
+
+        arrival_substreams selects the MT19937 substreams (mt19937_substreams) of the arrival times, which reproduce the
+        arrival times of a run in any engine.  SHARED draws the interarrival times of the N streams of a replication
+        from one substream in the order of the arrivals, one at a time, which gives the results of the earlier versions.
+        PER_STREAM draws the interarrival times of each stream of a replication from a substream of its own, which lets
+        the simulation draw them in blocks (distributions.RandomDistribution.sample()).  run() raises a
+        QueueingSystemError before it submits any run if the batch needs more substreams than there are.
+
+        online_stats accumulates the statistics of the queue counts of the runs online instead of storing their change
+        points, which keeps the memory of a long run constant.  The MSER5 warmup needs the stored statistics.
+        """
+        if online_stats and warmup == QueueingSystemSimulation.Warmup.MSER5:
+            raise qsc.QueueingSystemError("The MSER5 warmup needs the stored statistics (online_stats=False).")
+        if arrival_trace_dir is not None and engine != QueueingSystemSimulation.Engine.VECTORIZED:
+            raise qsc.QueueingSystemError("The arrival trace cache needs the VECTORIZED engine, not %s." % repr(engine))
+        if scheduler != QueueingSystem.Scheduler.ROUND_ROBIN and engine != QueueingSystemSimulation.Engine.SIMPY:
+            raise qsc.QueueingSystemError("The %s scheduler needs the SIMPY engine, not %s." %
+                                          (scheduler.name, repr(engine)))
+        if SD != QueueingSystem.ServiceDiscipline.FCFS and engine == QueueingSystemSimulation.Engine.VECTORIZED:
+            raise qsc.QueueingSystemError("The vectorized engine only supports the FCFS queue discipline, not %s." %
+                                          repr(SD))
+        if profile is not None and not isinstance(profile, self.Profile):
+            raise qsc.QueueingSystemError("Profile (%s) is not one of %s" % (repr(profile), repr(self.VALID_PROFILES)))
+        if not isinstance(arrival_substreams, self.ArrivalSubstreams):
+            raise qsc.QueueingSystemError("Arrival substreams (%s) is not one of %s" %
+                                          (repr(arrival_substreams), repr(self.VALID_ARRIVAL_SUBSTREAMS)))
+
         self.detail_csv_file = detail_csv_file
         self.summary_csv_file = summary_csv_file
         self.skip_csv_headers = skip_csv_headers
         self.csv_file_open_mode = csv_file_open_mode
+        self.engine = engine
+        self.warmup = warmup
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval_clocks = checkpoint_interval_clocks
+        self.arrival_trace_dir = arrival_trace_dir
+        self.SD = SD
+        self.scheduler = scheduler
+        self.profile = profile
+        self.profile_detail_index = profile_detail_index
+        self.progress_interval = progress_interval
+        self.arrival_substreams = arrival_substreams
+        self.online_stats = online_stats
 
         if max_workers is None:
             pass
@@ -432,8 +2196,27 @@ class QueueingSystemSimulationBatch:
         import virt_queueing_model as qm
         import mt19937_substreams
 
-        # Get an iterator from the iterable.
-        parameters_iter = iter(parameters_iterable)
+        # Get the list of the parameters, so that the number of random substreams can be checked before any run is
+        # submitted.
+        parameters_list = list(parameters_iterable)
+        parameters_iter = iter(parameters_list)
+
+        # Check that there are enough random substreams: one per replication (and stream, for PER_STREAM arrival
+        # substreams) for the arrivals, which are reused by the experiments for common random numbers, plus one per
+        # replication for the picks of the SIRO service discipline.
+        if self.arrival_substreams == self.ArrivalSubstreams.PER_STREAM:
+            arrival_keys = {(virt_index, repl_index) for parameters in parameters_list
+                            for virt_index in range(parameters.N) for repl_index in range(parameters.num_replications)}
+        else:
+            arrival_keys = {repl_index for parameters in parameters_list
+                            for repl_index in range(parameters.num_replications)}
+        num_substreams = len(arrival_keys)
+        if self.SD == QueueingSystem.ServiceDiscipline.SIRO:
+            num_substreams += max((parameters.num_replications for parameters in parameters_list), default=0)
+        if num_substreams > mt19937_substreams.nstreams:
+            raise qsc.QueueingSystemError(
+                "The batch needs %d random substreams, but there are only %d." % (
+                    num_substreams, mt19937_substreams.nstreams))
 
         # Create the mt19937 substream index generator.
         mt19937_substream_index_generator = mt19937_substreams.generate_substream_indices(
@@ -446,9 +2229,25 @@ class QueueingSystemSimulationBatch:
         def get_random_state(*args):
             return mt19937_substreams.get_random_state_at_index(random_indices_collection[args])
 
+        # Function to get the random state of the service discipline picks of a replication.  These substreams count
+        # down from the last one instead of coming from the index generator, so that the arrival substreams of a
+        # replication are the same for every service discipline (common random numbers).
+        def get_service_random_state(repl_index):
+            return mt19937_substreams.get_random_state_at_index(mt19937_substreams.nstreams - 1 - repl_index)
+
         sim_summary_index_counter = count()
         sim_detail_index_counter = count()
 
+        # Create the checkpoint directory.
+        if self.checkpoint_dir is not None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+        # Open the arrival trace cache.
+        if self.arrival_trace_dir is not None:
+            trace_cache = arrival_trace_cache.ArrivalTraceCache(self.arrival_trace_dir)
+        else:
+            trace_cache = None
+
         # Change this process to a lower priority if psutil is available.
         if sys.platform.startswith("linux"):
             os.setpriority(os.PRIO_PROCESS, 0, 10)
@@ -465,6 +2264,7 @@ class QueueingSystemSimulationBatch:
                   file=sys.stderr)
 
         futures = deque()
+        progress = BatchProgress(self.progress_interval, self.max_workers)
         with utils.TimeIt("Do Experiments", verbose=True) as do_experiments_timer, \
                 concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers) as executor, \
                 utils.CancelFuturesOnException(futures):
@@ -500,24 +2300,69 @@ class QueueingSystemSimulationBatch:
                 extra["dist_class"] = dist_class
                 extra["dist_args"] = dist_args
 
+                # A trace arrival distribution replays its own memory mapped trace.  A trace source file is imported
+                # here the first time, so that the worker processes do not import it at the same time.
+                is_trace = issubclass(dist_class, distributions.TraceDistribution)
+                if is_trace:
+                    arrival_trace_cache.resolve_trace(dist_args[1])
+                # The samples of an empirical distribution are imported into its table here the first time for the same
+                # reason.
+                if issubclass(dist_class, distributions.EmpiricalDistribution):
+                    arrival_trace_cache.resolve_empirical_table(dist_args[1])
+
                 for repl_index in range(parameters.num_replications):
                     sim_detail_index = next(sim_detail_index_counter)
                     replications.append((sim_detail_index, repl_index))
 
+                    if self.checkpoint_dir is None:
+                        checkpoint_file = None
+                    else:
+                        checkpoint_file = os.path.join(self.checkpoint_dir, "%s.%d.checkpoint" % (
+                            os.path.basename(self.detail_csv_file), sim_detail_index))
+
                     arrivals_dist_virt_array = []
                     for virt_index in range(parameters.N):
+                        if self.arrival_substreams == self.ArrivalSubstreams.PER_STREAM:
+                            rngstate = get_random_state("arrival", virt_index, repl_index)
+                        else:
+                            rngstate = get_random_state("arrival", repl_index)
                         arrivals_dist_virt_array.append({
                             "dist_class": dist_class,
-                            "dist_args": dist_args,
-                            "rngstate": get_random_state("arrival", repl_index),
-                            # "rngstate": get_random_state("arrival", virt_index, repl_index),
+                            "dist_args": dist_class.get_stream_parameters(dist_args, virt_index),
+                            "rngstate": rngstate,
                         })
 
+                    # The random picks of the SIRO service discipline have their own random state.
+                    if self.SD == QueueingSystem.ServiceDiscipline.SIRO:
+                        sd_rngstate = get_service_random_state(repl_index)
+                    else:
+                        sd_rngstate = None
+
+                    # Get the arrival trace, which is generated here the first time so that it is generated only
+                    # once even when the runs that replay it are in different worker processes.
+                    if trace_cache is None or is_trace:
+                        arrival_trace = None
+                    else:
+                        arrival_trace = self.get_arrival_trace(trace_cache, parameters, arrivals_dist_virt_array)
+
+                    # Get the profile mode and file of the run.
+                    if self.profile is None or sim_detail_index != self.profile_detail_index:
+                        profile = None
+                        profile_file = None
+                    else:
+                        profile = self.profile
+                        profile_file = "%s.%d.%s" % (self.detail_csv_file, sim_detail_index,
+                                                     "prof" if profile == self.Profile.CPROFILE else "tracemalloc")
+
                     futures.append(executor.submit(
                         self.do_simulation,
                         parameters.N, parameters.C, parameters.S, parameters.Rs, parameters.f_clk, parameters.A_dist,
                         parameters.lambd, parameters.sim_clocks, repl_index, arrivals_dist_virt_array,
-                        sim_detail_index))
+                        sim_detail_index, engine=self.engine, warmup=self.warmup, precision=parameters.precision,
+                        checkpoint_file=checkpoint_file, checkpoint_interval_clocks=self.checkpoint_interval_clocks,
+                        arrival_trace=arrival_trace, SD=self.SD, sd_rngstate=sd_rngstate, scheduler=self.scheduler,
+                        profile=profile, profile_file=profile_file, online_stats=self.online_stats))
+                    progress.add(futures[-1], parameters.sim_clocks)
                     num_experiments_with_replications += 1
 
             print("%d experiments (total of %d runs) submitted to concurrent executor.\n" %
@@ -561,6 +2406,13 @@ class QueueingSystemSimulationBatch:
                         "Mean Response Time (s)",
                         "Stdv Response Time (s)",
                         "Cov of Wait Time and Service Time (s^2)",
+
+                        # Run instrumentation.
+                        "Setup Elapsed Time (s)", "Stats Elapsed Time (s)", "Num Events", "Events per Second",
+                        "Total Arrivals", "Server Wakeups", "Peak Stats Buffer", "Peak RSS (MB)",
+
+                        # Warmup.
+                        "Stats Warmup Time (s)",
                     ])
                     f_detail.flush()
 
@@ -629,6 +2481,11 @@ class QueueingSystemSimulationBatch:
 
                         # JSON blob of analytical queueing model outputs.
                         "[Model] JSON Blob",
+
+                        # Run instrumentation.
+                        "Mean Setup Elapsed Time (s)", "Mean Stats Elapsed Time (s)", "Mean Num Events",
+                        "Mean Events per Second", "Mean Total Arrivals", "Mean Server Wakeups", "Max Peak Stats Buffer",
+                        "Max Peak RSS (MB)",
                     ])
                     f_summary.flush()
 
@@ -637,6 +2494,15 @@ class QueueingSystemSimulationBatch:
                     # Setup statistic results.
                     stats_exp_elapsed_times = qsc.DataArray()
                     stats_sim_elapsed_times = qsc.DataArray()
+                    stats_setup_elapsed_times = qsc.DataArray()
+                    stats_stats_elapsed_times = qsc.DataArray()
+                    stats_num_events = qsc.DataArray()
+                    stats_events_per_second = qsc.DataArray()
+                    stats_total_arrivals = qsc.DataArray()
+                    stats_server_wakeups = qsc.DataArray()
+                    stats_peak_stats_buffer = qsc.DataArray()
+                    stats_peak_rss = qsc.DataArray()
+                    stats_sim_clocks = qsc.DataArray()
                     stats_mean_jobs_waiting = qsc.DataArray()
                     stats_std_jobs_waiting = qsc.DataArray()
                     stats_histograms_of_jobs_waiting = []
@@ -653,14 +2519,12 @@ class QueueingSystemSimulationBatch:
                     stats_std_job_response_time = qsc.DataArray()
 
                     # Calculations.
-                    sim_time = parameters.sim_clocks / parameters.f_clk
-
                     dist = extra["dist_class"](*extra["dist_args"])
 
                     for sim_detail_index, repl_index in replications:
                         # Get next future simulation result.
                         f = futures.popleft()
-                        result = f.result()
+                        result = progress.result(f)
 
                         # Print processing message.
                         print("[%d] Processing result.\n" % sim_detail_index, end="")
@@ -674,6 +2538,15 @@ class QueueingSystemSimulationBatch:
                         sim_elapsed_time = result["sim_elapsed_time"]
                         sim_results = result["sim_results"]
                         virt_queues = sim_results["virt_queues"]
+                        sim_clocks = sim_results["sim_clocks"]
+                        setup_elapsed_time = result["setup_elapsed_time"]
+                        stats_elapsed_time = result["stats_elapsed_time"]
+                        counters = result["counters"]
+                        if sim_elapsed_time > 0:
+                            events_per_second = counters["num_events"] / sim_elapsed_time
+                        else:
+                            events_per_second = qsc.nan
+                        peak_rss_mb = counters["peak_rss"] / 2 ** 20
 
                         for virt_index in range(parameters.N):
                             # Write detail row.
@@ -682,8 +2555,8 @@ class QueueingSystemSimulationBatch:
                                 sim_summary_index, sim_detail_index, exp_elapsed_time, sim_elapsed_time,
 
                                 # Simulation parameters.
-                                parameters.sim_clocks,
-                                sim_time,
+                                sim_clocks,
+                                sim_clocks / parameters.f_clk,
                                 parameters.N,
                                 parameters.C,
                                 parameters.S,
@@ -719,6 +2592,14 @@ class QueueingSystemSimulationBatch:
                                 virt_queues[virt_index]["mean_job_response_time"],
                                 virt_queues[virt_index]["std_job_response_time"],
                                 virt_queues[virt_index]["cov_job_wait_time_and_job_service_time"],
+
+                                # Run instrumentation.
+                                setup_elapsed_time, stats_elapsed_time, counters["num_events"], events_per_second,
+                                counters["total_arrivals"], counters["server_wakeups"],
+                                counters["peak_stats_buffer_size"], peak_rss_mb,
+
+                                # Warmup.
+                                sim_results["warmup_time"],
                             ])
 
                             # Build statistics.
@@ -745,6 +2626,15 @@ class QueueingSystemSimulationBatch:
                         # Build statistics.
                         stats_exp_elapsed_times.append(exp_elapsed_time)
                         stats_sim_elapsed_times.append(sim_elapsed_time)
+                        stats_setup_elapsed_times.append(setup_elapsed_time)
+                        stats_stats_elapsed_times.append(stats_elapsed_time)
+                        stats_num_events.append(counters["num_events"])
+                        stats_events_per_second.append(events_per_second)
+                        stats_total_arrivals.append(counters["total_arrivals"])
+                        stats_server_wakeups.append(counters["server_wakeups"])
+                        stats_peak_stats_buffer.append(counters["peak_stats_buffer_size"])
+                        stats_peak_rss.append(peak_rss_mb)
+                        stats_sim_clocks.append(sim_clocks)
 
                     if len(stats_exp_elapsed_times) != parameters.num_replications:
                         print("Skipping summary result (index %d).  The number of detailed results is %d and the "
@@ -752,6 +2642,12 @@ class QueueingSystemSimulationBatch:
                             sim_summary_index, len(stats_exp_elapsed_times), parameters.num_replications), end="")
                         continue
 
+                    # The number of clocks can be different for each replication with a precision target.
+                    if parameters.precision is None:
+                        sim_clocks = parameters.sim_clocks
+                    else:
+                        sim_clocks = stats_sim_clocks.mean()
+
                     model_dicts = {
                         "parameters": model.parameters,
                         "calculations": model.calculations,
@@ -762,8 +2658,8 @@ class QueueingSystemSimulationBatch:
                         sim_summary_index, stats_exp_elapsed_times.mean(), stats_sim_elapsed_times.mean(),
 
                         # Simulation parameters.
-                        parameters.sim_clocks,
-                        sim_time,
+                        sim_clocks,
+                        sim_clocks / parameters.f_clk,
                         parameters.N,
                         parameters.C,
                         parameters.S,
@@ -828,65 +2724,211 @@ class QueueingSystemSimulationBatch:
                         model.calculations["NTOT"],
 
                         # JSON blob of analytical queueing model outputs.
-                        json.dumps(model_dicts, separators=self.JSON_SEPARATERS)
+                        json.dumps(model_dicts, separators=self.JSON_SEPARATERS),
+
+                        # Run instrumentation.
+                        stats_setup_elapsed_times.mean(),
+                        stats_stats_elapsed_times.mean(),
+                        stats_num_events.mean(),
+                        stats_events_per_second.mean(),
+                        stats_total_arrivals.mean(),
+                        stats_server_wakeups.mean(),
+                        max(stats_peak_stats_buffer),
+                        max(stats_peak_rss),
                     ])
                     f_summary.flush()
 
+                # Report the progress of the finished batch.
+                if self.progress_interval is not None:
+                    progress.report()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def get_arrival_trace(cls, trace_cache, parameters, arrivals):
+        """ Get the path of the arrival trace of a run from the cache, and generate the trace if it is not there. """
+        horizon = parameters.sim_clocks / parameters.f_clk
+        dist_key = arrivals[0]["dist_class"].get_cache_key(arrivals[0]["dist_args"])
+        trace_path = trace_cache.trace_path(parameters.A_dist, parameters.lambd, parameters.N,
+                                            [item["rngstate"] for item in arrivals], horizon, dist_key=dist_key)
+        if not arrival_trace_cache.trace_exists(trace_path):
+            with utils.TimeIt("Generate Arrival Trace", verbose=False) as timer:
+                arrival_times = ArrivalTimesGenerator(cls.make_arrival_distributions(arrivals)).generate(horizon)
+                arrival_trace_cache.save_trace(trace_path, arrival_times, horizon, info={
+                    "A_dist": parameters.A_dist, "lambd": parameters.lambd, "N": parameters.N})
+            print("Generated arrival trace %s in %.2f s.\n" % (trace_path, timer.elapsed_time), end="")
+        return trace_path
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def make_arrival_distributions(arrivals):
+        """ Make the arrival distribution of each stream from its distribution class, arguments, and random state. """
+        dedupper = {}
+        arrival_distributions = []
+        for virt_index, item in enumerate(arrivals):
+            rngstate = item["rngstate"]
+            if rngstate in dedupper:
+                # If the random state for this arrival distribution is the same as another one, then we define
+                # them to be sharing the same random class.  So, we need to dedup them here.
+                random_class = dedupper[rngstate]
+            else:
+                random_class = random.Random()
+                random_class.setstate(item["rngstate"])
+                dedupper[rngstate] = random_class
+            arrival_distributions.append(item["dist_class"](
+                *item["dist_args"],
+                random_class=random_class
+            ))
+        return arrival_distributions
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def get_queue_results(queue_stats):
+        """ Reduce the statistics of a virtual queue (qsc.QueueStats) to the results of a run. """
+        count_statistics = queue_stats.count_statistics()
+        return {
+            "mean_jobs_waiting": count_statistics["mean_jobs_waiting"],
+            "std_jobs_waiting": count_statistics["std_jobs_waiting"],
+            "histogram_jobs_waiting": count_statistics["histogram_jobs_waiting"],
+            "mean_jobs_receiving_service": count_statistics["mean_jobs_receiving_service"],
+            "std_jobs_receiving_service": count_statistics["std_jobs_receiving_service"],
+            "mean_jobs_in_system": count_statistics["mean_jobs_in_system"],
+            "std_jobs_in_system": count_statistics["std_jobs_in_system"],
+            "cov_jobs_waiting_and_jobs_receiving_service":
+                count_statistics["cov_jobs_waiting_and_jobs_receiving_service"],
+            "cov_job_wait_time_and_job_service_time": queue_stats.cov_job_wait_time_and_job_service_time(),
+            "mean_jobs_in_busy_period": queue_stats.busy_period.num_jobs.mean(),
+            "std_jobs_in_busy_period": queue_stats.busy_period.num_jobs.std(),
+            "mean_busy_period": queue_stats.busy_period.duration.mean(),
+            "std_busy_period": queue_stats.busy_period.duration.std(),
+            "mean_idle_period": queue_stats.idle_period.duration.mean(),
+            "std_idle_period": queue_stats.idle_period.duration.std(),
+            "mean_job_wait_time": queue_stats.job_wait_time.mean(),
+            "std_job_wait_time": queue_stats.job_wait_time.std(),
+            "mean_job_service_time": queue_stats.job_service_time.mean(),
+            "std_job_service_time": queue_stats.job_service_time.std(),
+            "mean_job_response_time": queue_stats.job_response_time.mean(),
+            "std_job_response_time": queue_stats.job_response_time.std(),
+            "total_arrivals": queue_stats.total_arrivals,
+            "total_departures": queue_stats.total_departures,
+            "total_time": queue_stats.total_time,
+        }
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    @contextlib.contextmanager
+    def profile_run(cls, profile, profile_file, sim_detail_index, top=20):
+        """ Profile the code in the with statement with the profile mode, save the profile to profile_file, and print
+        its top entries.  Nothing is profiled if the profile mode is None. """
+        if profile is None:
+            yield
+            return
+
+        print("[%d] Profiling the run with %s.\n" % (sim_detail_index, profile.name), end="")
+        if profile == cls.Profile.CPROFILE:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(profile_file)
+                pstats.Stats(profiler, stream=sys.stdout).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        elif profile == cls.Profile.TRACEMALLOC:
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak_size = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                snapshot.dump(profile_file)
+                print("[%d] Traced memory peak is %.1f MB.  Top allocations at the end of the run:\n%s\n" % (
+                    sim_detail_index, peak_size / 2 ** 20,
+                    "\n".join(str(stat) for stat in snapshot.statistics("lineno")[:top])), end="")
+        else:
+            raise qsc.QueueingSystemError("Profile (%s) is not one of %s" %
+                                          (repr(profile), repr(cls.VALID_PROFILES)))
+        print("[%d] Saved the profile to %s.\n" % (sim_detail_index, profile_file), end="")
+
     # ------------------------------------------------------------------------------------------------------------------
     @classmethod
-    def do_simulation(cls, N, C, S, Rs, f_clk, A_dist, lambd, sim_clocks, repl_index, arrivals, sim_detail_index):
+    def do_simulation(cls, N, C, S, Rs, f_clk, A_dist, lambd, sim_clocks, repl_index, arrivals, sim_detail_index,
+                      engine=QueueingSystemSimulation.Engine.SIMPY, warmup=QueueingSystemSimulation.Warmup.FIXED,
+                      precision=None, checkpoint_file=None, checkpoint_interval_clocks=None, arrival_trace=None,
+                      SD=QueueingSystem.ServiceDiscipline.FCFS, sd_rngstate=None,
+                      scheduler=QueueingSystem.Scheduler.ROUND_ROBIN, profile=None, profile_file=None,
+                      online_stats=False):
         """ Do a queueing simulation run.  This method runs in a concurrent executor in a worker process. It therefore
-         is independent from the rest of the class. """
+         is independent from the rest of the class.  With a precision target, sim_clocks is the maximum number of
+         clocks, and the number of clocks that were simulated is in the sim_clocks of the sim results.  With a
+         checkpoint file, the run is checkpointed every checkpoint_interval_clocks and resumes from the file if it
+         exists.  The file is deleted after the run.  With an arrival trace, the arrival times are replayed from the
+         trace file.  SD is the service discipline, and sd_rngstate is the random state of its random picks.  scheduler
+         is the scheduler of the real server.  With a profile mode (Profile), the run is profiled, and the profile is
+         saved to profile_file.  online_stats accumulates the statistics of the queue counts online. """
 
         # Print simulation label.
         print("[%d] Simulating N=%r, C=%r, S=%r, Rs=%r, A_dist=%r, lambd=%r, sim_clocks=%r, repl_index=%r\n" %
               (sim_detail_index, N, C, S, Rs, A_dist, lambd, sim_clocks, repl_index), end="")
 
+        # The peak RSS of the run is measured from here.  The worker processes run one simulation after another.
+        utils.reset_peak_rss()
+
         experiment_timer = None
         sim_timer = None
         try:
-            with utils.TimeIt("Full Experiment", verbose=False) as experiment_timer:
+            with utils.TimeIt("Full Experiment", verbose=False) as experiment_timer, \
+                    cls.profile_run(profile, profile_file, sim_detail_index):
                 # Calculations.
                 t_clk = 1 / f_clk
 
                 # Setup experiment.
-                dedupper = {}
-                arrival_distributions = []
-                for virt_index, item in enumerate(arrivals):
-                    rngstate = item["rngstate"]
-                    if rngstate in dedupper:
-                        # If the random state for this arrival distribution is the same as another one, then we define
-                        # them to be sharing the same random class.  So, we need to dedup them here.
-                        random_class = dedupper[rngstate]
-                    else:
-                        random_class = random.Random()
-                        random_class.setstate(item["rngstate"])
-                        dedupper[rngstate] = random_class
-                    arrival_distributions.append(item["dist_class"](
-                        *item["dist_args"],
-                        random_class=random_class
-                    ))
-                del dedupper
+                setup_start_time = time.perf_counter()
+                arrival_distributions = cls.make_arrival_distributions(arrivals)
+                if sd_rngstate is None:
+                    sd_random_class = None
+                else:
+                    sd_random_class = random.Random()
+                    sd_random_class.setstate(sd_rngstate)
 
                 # Create the virtualized queueing system simulation.
                 sim = QueueingSystemSimulation(
                     N=N, C=C, S=S, Rs=Rs, arrival_distributions=arrival_distributions, f_clk=f_clk,
-                    SD=QueueingSystem.ServiceDiscipline.FCFS, sd_random_class=None, stats_warmup_time=100 * t_clk,
+                    SD=SD, sd_random_class=sd_random_class, stats_warmup_time=100 * t_clk,
                     show_server_info=False,
                     show_job_event_info=False,
                     show_job_stat_info=False,
-                    show_progress_info=False
+                    show_progress_info=False,
+                    engine=engine,
+                    warmup=warmup,
+                    arrival_trace=arrival_trace,
+                    scheduler=scheduler,
+                    online_stats=online_stats
                 )
+                setup_elapsed_time = time.perf_counter() - setup_start_time
 
                 # Do experiment.
                 with utils.TimeIt("Simulation Run", verbose=False) as sim_timer:
-                    sim.run(sim_clocks * t_clk)
+                    if checkpoint_file is None:
+                        sim.run(sim_clocks * t_clk, precision=precision)
+                    else:
+                        sim.run(sim_clocks * t_clk, precision=precision, checkpoint_file=checkpoint_file,
+                                checkpoint_interval=checkpoint_interval_clocks * t_clk)
+                        if sim.resumed:
+                            print("[%d] Resumed from checkpoint file %s.\n" % (sim_detail_index, checkpoint_file), end="")
+
+                        # The run is done, so its checkpoint is not needed anymore.
+                        if os.path.exists(checkpoint_file):
+                            os.remove(checkpoint_file)
 
                 # Get result.
+                stats_start_time = time.perf_counter()
                 result = {
                     "sim_detail_index": sim_detail_index,
                     "sim_elapsed_time": sim_timer.elapsed_time,
                     "sim_results": {
+                        "sim_clocks": sim_clocks if precision is None else round(sim.now * f_clk),
+                        "warmup_time": sim.stats_warmup_time,
                         "virt_queues": []
                     }
                 }
@@ -899,33 +2941,18 @@ class QueueingSystemSimulationBatch:
                         print("[%d] System is unstable.  Total arrivals is %d and total departures is %d.\n" %
                               (sim_detail_index, queue_stats.total_arrivals, queue_stats.total_departures), end="")
                         return None
-                    virt_queues.append({
-                        "mean_jobs_waiting": queue_stats.jobs_waiting.mean(),
-                        "std_jobs_waiting": queue_stats.jobs_waiting.std(),
-                        "histogram_jobs_waiting": queue_stats.jobs_waiting.histogram(),
-                        "mean_jobs_receiving_service": queue_stats.jobs_receiving_service.mean(),
-                        "std_jobs_receiving_service": queue_stats.jobs_receiving_service.std(),
-                        "mean_jobs_in_system": queue_stats.jobs_in_system.mean(),
-                        "std_jobs_in_system": queue_stats.jobs_in_system.std(),
-                        "cov_jobs_waiting_and_jobs_receiving_service":
-                            queue_stats.cov_jobs_waiting_and_jobs_receiving_service(),
-                        "cov_job_wait_time_and_job_service_time": queue_stats.cov_job_wait_time_and_job_service_time(),
-                        "mean_jobs_in_busy_period": queue_stats.busy_period.num_jobs.mean(),
-                        "std_jobs_in_busy_period": queue_stats.busy_period.num_jobs.std(),
-                        "mean_busy_period": queue_stats.busy_period.duration.mean(),
-                        "std_busy_period": queue_stats.busy_period.duration.std(),
-                        "mean_idle_period": queue_stats.idle_period.duration.mean(),
-                        "std_idle_period": queue_stats.idle_period.duration.std(),
-                        "mean_job_wait_time": queue_stats.job_wait_time.mean(),
-                        "std_job_wait_time": queue_stats.job_wait_time.std(),
-                        "mean_job_service_time": queue_stats.job_service_time.mean(),
-                        "std_job_service_time": queue_stats.job_service_time.std(),
-                        "mean_job_response_time": queue_stats.job_response_time.mean(),
-                        "std_job_response_time": queue_stats.job_response_time.std(),
-                        "total_arrivals": queue_stats.total_arrivals,
-                        "total_departures": queue_stats.total_departures,
-                        "total_time": queue_stats.total_time,
-                    })
+                    virt_queues.append(cls.get_queue_results(queue_stats))
+
+                # Get the instrumentation of the run.
+                result["setup_elapsed_time"] = setup_elapsed_time
+                result["stats_elapsed_time"] = time.perf_counter() - stats_start_time
+                result["counters"] = {
+                    "num_events": sim.system.num_events(),
+                    "total_arrivals": sum(sim.system.total_arrivals),
+                    "server_wakeups": sim.system.server_wakeups,
+                    "peak_stats_buffer_size": sim.peak_stats_buffer_size,
+                    "peak_rss": utils.peak_rss(),
+                }
 
             result["exp_elapsed_time"] = experiment_timer.elapsed_time
         except Exception: